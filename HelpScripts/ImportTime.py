@@ -0,0 +1,47 @@
+#Description: Check the import-time budget of the command line interface. The import of a module
+#  is timed in a fresh interpreter with 'python -X importtime'. The script fails (exit code 1) when
+#  the import takes longer than the budget, or when a module that prediction does not need
+#  (plotting, analysis, embedding, SciPy) is loaded.
+#  Usage: python HelpScripts/ImportTime.py [module] [budget in seconds]
+import os
+import sys
+import subprocess
+
+# Modules that must not be loaded by 'fodlego mol.xyz'
+FORBIDDEN = ("matplotlib", "statsmodels", "scipy", "rdkit.Chem.AllChem", "FODLego.graphing",
+             "FODLego.MolecularSet", "FODLego.Analysis")
+
+def ImportTimes(module: str) -> dict:
+    """
+    Return the cumulative import time (in seconds) of every module loaded by 'import module'.
+    """
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    env = dict(os.environ, PYTHONPATH=src + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=env)
+    if run.returncode != 0:
+        sys.exit(run.stderr)
+    times = {}
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)*1e-6
+    return times
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "FODLego.Molecule"
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    times = ImportTimes(module)
+    total = times[module]
+    print(f"import {module}: {total:.3f} s (budget {budget:.3f} s)")
+    for name, t in sorted(times.items(), key=lambda x: -x[1])[:10]:
+        print(f"  {t:8.3f} s  {name}")
+    loaded = [name for name in FORBIDDEN if name in times]
+    if loaded:
+        print(f"Modules that prediction does not need were loaded: {', '.join(loaded)}")
+    if total > budget or loaded:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import scipy.stats as stats
-import statsmodels.api as sm
 import matplotlib.patches as patches
 
 # Important directories
@@ -25,7 +24,7 @@ def CreateMolecules(file):
     This function returns a list of Molecules that have been read from a file
     """
     # Preliminary Data
-    from Molecule import Molecule
+    from FODLego.Molecule import Molecule
     Mols = []
 
     # Create empty list that will be returned
@@ -59,13 +58,12 @@ def GridPropRatios(mols):
     """
     import numpy as np
     import matplotlib.pyplot as plt
-    from globaldata import GlobalData
 
     # Dictionary to store bond classes and their associated bond proportions
     bond_pairs = {}
 
-    # Iterate through each bfod
-    for bfod in GlobalData.mBFODs:
+    # Iterate through each bfod of every molecule
+    for bfod in [bfod for mol in mols for bfod in mol.mContext.mBFODs]:
         # Create a unique key-value pair for each bonding type
         key = frozenset({bfod.mBold.mZ,bfod.mMeek.mZ})
         # Add key to dictionary if nonexistent.
@@ -386,6 +384,7 @@ def Plot_RMSD_Levels(all_rmsds, labels):
     #fig.savefig(savepath + "RMSD.svg")
 
 def ttest(x,y,axs):
+    import statsmodels.api as sm
     # Perform linear regression using statsmodels
     x = sm.add_constant(x)  # Adds a constant term to the predictor
     model = sm.OLS(y, x).fit()
@@ -407,6 +406,7 @@ def ttest(x,y,axs):
     print(f'T-test results for the slope: t-statistic = {t_stat}, p-value = {p_value}')
 
 def delete_residuals(x,y,axs):# Adding a constant to the predictor
+    import statsmodels.api as sm
     x_with_const = sm.add_constant(x)
 
     # Fit the model
@@ -1148,36 +1148,37 @@ def get29(all_coords):
         if len(coords[0]) == 29:
             print(SURVEY_FILES[i])
 
-directory = 'getrecords'
+if __name__ == "__main__":
+    directory = 'getrecords'
 
-# Load the global endpoints of each FOD optimization
-summ_dir = os.path.join(os.getcwd(), 'getSUMM')
-summlist = os.path.join(os.getcwd(), 'summary_source')
-fodloop_checkpoints = load_summary(summ_dir, summlist)
+    # Load the global endpoints of each FOD optimization
+    summ_dir = os.path.join(os.getcwd(), 'getSUMM')
+    summlist = os.path.join(os.getcwd(), 'summary_source')
+    fodloop_checkpoints = load_summary(summ_dir, summlist)
 
-# Load the global endpoints of each FOD optimization
-rec_dir = os.path.join(os.getcwd(), 'getrecords')
-recordlist = os.path.join(os.getcwd(), 'record_source')
-all_energies, all_coords, all_rmsds, labels = load_energies(rec_dir, recordlist)
+    # Load the global endpoints of each FOD optimization
+    rec_dir = os.path.join(os.getcwd(), 'getrecords')
+    recordlist = os.path.join(os.getcwd(), 'record_source')
+    all_energies, all_coords, all_rmsds, labels = load_energies(rec_dir, recordlist)
 
-#get29(all_coords)
+    #get29(all_coords)
 
-# Plot all data on the same graph
-#Plot_RMSD_Levels(all_rmsds, labels)
-#plot_all_energ_glob_checkp(all_energies, labels, fodloop_checkpoints)
-#convergence_subset(all_energies, labels, fodloop_checkpoints)
-#boxplotFirstEnergy(all_energies, all_coords)
-#rateOfConv(all_energies)
-#scf_barchart()
+    # Plot all data on the same graph
+    #Plot_RMSD_Levels(all_rmsds, labels)
+    #plot_all_energ_glob_checkp(all_energies, labels, fodloop_checkpoints)
+    #convergence_subset(all_energies, labels, fodloop_checkpoints)
+    #boxplotFirstEnergy(all_energies, all_coords)
+    #rateOfConv(all_energies)
+    #scf_barchart()
 
 
-#iter_rmsd_scatter(all_coords, all_energies)
-# iter_maxD(all_coords, all_energies)
+    #iter_rmsd_scatter(all_coords, all_energies)
+    # iter_maxD(all_coords, all_energies)
 
-#iter_rmsd_scatter_zoom(all_coords, all_energies)
-# coordinate_analysis(all_coords, '69')
-# coordinate_analysis(all_coords, '276')
-#coordinate_analysis_2(all_coords, '276', '69')
-#iter_energy_scatter(all_coords, all_energies)
-#plot_global_rate(fodloop_checkpoints, all_energies)
-#plt.show()
+    #iter_rmsd_scatter_zoom(all_coords, all_energies)
+    # coordinate_analysis(all_coords, '69')
+    # coordinate_analysis(all_coords, '276')
+    #coordinate_analysis_2(all_coords, '276', '69')
+    #iter_energy_scatter(all_coords, all_energies)
+    #plot_global_rate(fodloop_checkpoints, all_energies)
+    #plt.show()
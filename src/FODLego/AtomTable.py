@@ -0,0 +1,108 @@
+#Description: The AtomTable class holds the atoms of a molecule as NumPy arrays (positions, Z,
+#  period, group, full-shell electron count, valence count, charge, free pairs and steric number).
+#  The positions are read from the RDKit conformer in one call
+#  and the per-element properties are looked up once per element, not once per atom. Atom objects
+#  are views into a row of the table and are only created when they are first accessed.
+import numpy as np
+from rdkit.Chem import GetPeriodicTable
+from FODLego.globaldata import GlobalData
+from FODLego.ElementaryClasses import Atom
+
+
+class AtomTable:
+    def __init__(self, owner, Z, pos):
+        self.mOwner = owner
+        self.mZ = np.asarray(Z, dtype=np.int64)
+        self.mPos = np.array(pos, dtype=np.float64).reshape(len(self.mZ), 3)
+        # Element properties from the Z-indexed tables of GlobalData
+        self.mPeriod = GlobalData.GetPeriods(self.mZ)
+        self.mGroup = GlobalData.GetRows(self.mZ)
+        self.mFullElec = GlobalData.GetFullElecCounts(self.mZ)
+        # Names, looked up once for every distinct element
+        elems, inverse = np.unique(self.mZ, return_inverse=True)
+        pt = GetPeriodicTable()
+        self.mNames = [pt.GetElementSymbol(int(z)) for z in elems]
+        self.mElem = inverse.reshape(-1)
+        self.mValCount = np.zeros(len(self.mZ), dtype=np.int64)
+        # Determined from the bonds (CalcSteric)
+        self.mCharge = np.zeros(len(self.mZ))
+        self.mFreePairs = np.zeros(len(self.mZ))
+        self.mSteric = np.zeros(len(self.mZ))
+        self.mBondTable = None
+        self.mGeometry = None
+        self.mViews = [None]*len(self.mZ)
+
+    @classmethod
+    def FromRDKit(cls, owner, rdmol, conf=None):
+        """
+        Create the table from an RDKit molecule with a conformer. The positions of all atoms
+        are taken with a single GetPositions() call.
+        """
+        Z = [atom.GetAtomicNum() for atom in rdmol.GetAtoms()]
+        if rdmol.GetNumConformers() == 0:
+            pos = np.zeros((len(Z), 3))
+        elif conf is None:
+            pos = rdmol.GetConformer().GetPositions()
+        else:
+            pos = rdmol.GetConformer(conf).GetPositions()
+        return cls(owner, Z, pos)
+
+    def SetPositions(self, pos) -> None:
+        """
+        Replace the positions of the atoms, dropping the geometry cached from the old ones.
+        """
+        self.mPos[:] = np.asarray(pos, dtype=np.float64).reshape(self.mPos.shape)
+        if self.mGeometry is not None:
+            self.mGeometry.Invalidate()
+
+    def GetName(self, index: int) -> str:
+        return self.mNames[self.mElem[index]]
+
+    def FindValences(self, degree: np.ndarray) -> None:
+        """
+        Vectorized Atom.FindValence: set the number of electrons in the valence shell of every
+        atom, given the number of bonds of each atom.
+        """
+        self.mValCount[:] = self.Valences(degree)
+
+    def Valences(self, degree: np.ndarray) -> np.ndarray:
+        """
+        The number of electrons in the valence shell of every atom for the given number of bonds
+        of each atom, without storing them.
+        """
+        group = self.mGroup
+        period = self.mPeriod
+        val = np.where(period < 4, 2 + (group - 12), group)
+        val = np.where(group < 4, group, val)
+        val[np.asarray(degree) == 0] = 0
+        return val
+
+    def CalcSteric(self) -> None:
+        """
+        Vectorized Atom.CalcSteric: the charge, free pairs and steric number of every atom, from
+        the electrons in the bonds of the bond table.
+        """
+        bonds = self.mBondTable
+        bondelec = np.bincount(bonds.mIdx.reshape(-1), weights=np.repeat(2*bonds.mOrder, 2), minlength=len(self))
+        self.mCharge[:] = (self.mZ + bondelec) - self.mFullElec
+        self.mFreePairs[:] = np.trunc(np.asarray(GlobalData.mShellCount)[self.mPeriod] - bondelec)/2
+        self.mSteric[:] = self.mFreePairs + bonds.Degree()
+
+    # Sequence protocol. Atom views are created on first access.
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        atom = self.mViews[index]
+        if atom is None:
+            if index < 0:
+                index += len(self)
+            atom = Atom(index, self)
+            self.mViews[index] = atom
+        return atom
+
+    def __len__(self) -> int:
+        return len(self.mZ)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -1,6 +1,7 @@
 from FODLego.Funcs import *
 from FODLego.ElementaryClasses import *
 from FODLego.globaldata import *
+from FODLego.FOD import _Column, _AtomRef
 
 class BFOD(FOD):
     """
@@ -8,8 +9,24 @@ class BFOD(FOD):
     along the bonding axis in order to characterize the FODs. Some of these attributes of this class will tend toward zero in the SBFOD, but we know from some examples
     that they are not always zero (e.g. they might lie slightly off the bonding axis, so there might be an angle).
     """
+    __slots__ = ()
+    mCode = 2
+    # Atoms
+    mBold = _AtomRef('bold')
+    mMeek = _AtomRef('meek')
+    # Angles
+    mBoldAngle = _Column('boldangle')
+    mMeekAngle = _Column('meekangle')
+    # Vectors
+    mHeight = _Column('height')
+    # Distances
+    mMeekR = _Column('meekR')
+    mBoldR = _Column('boldR')
+    # Misc
+    mBoldPortion = _Column('portion')
+
     def __init__(self, boldAt: Atom, meekAt: Atom, target=None, pol=True):
-        super().__init__(ch=pol)
+        super().__init__(ch=pol, store=AtomStore(boldAt, isinstance(target, np.ndarray)))
         # Atoms
         self.mBold = boldAt
         self.mMeek = meekAt
@@ -17,10 +34,8 @@ class BFOD(FOD):
         self.mBoldAngle = 0.0
         self.mMeekAngle = 0.0
         # Vectors
-        self.mBondDir = meekAt.mPos - boldAt.mPos  # Always in direction away fromBold atom
         self.mHeight = np.zeros(3)
         # Distances
-        self.mBondDist = np.linalg.norm(self.mBondDir)
         self.mMeekR = 0.0
         self.mBoldR = 0.0
         # Misc 
@@ -30,6 +45,17 @@ class BFOD(FOD):
             self.mPos = target
             self.RevDet()
 
+    @property
+    def mBondDir(self) -> np.ndarray:
+        """
+        Bonding axis, always in direction away from the Bold atom.
+        """
+        return self.mBold.mTable.mGeometry.Vector(self.mBold.mI, self.mMeek.mI)
+
+    @property
+    def mBondDist(self) -> float:
+        return self.mBold.mTable.mGeometry.Distance(self.mBold.mI, self.mMeek.mI)
+
     def Calc_AxisBoldPortion(self, Zbold:int, Zmeek:int) -> float:
             """
             Finds the portion (from 0 to 1) of the bonding distance that the Bold atom covers.
@@ -100,6 +126,9 @@ class SBFOD(BFOD):
     """
     This is the Single Bonding FOD (SBFOD) class
     """
+    __slots__ = ()
+    mCode = 3
+
     def __init__(self, bold: Atom, meek: Atom, ch=True):
         super().__init__(bold,meek, pol=ch)
         self.mBoldPortion = self.Calc_AxisBoldPortion(bold.mZ, meek.mZ)
@@ -115,6 +144,9 @@ class SBFOD(BFOD):
         self.mMeekR = self.mBondDist*(1-self.mBoldPortion)
 
 class DBFOD(BFOD):
+    __slots__ = ()
+    mCode = 4
+
     def __init__(self, bold: Atom, meek: Atom, heightdir: np.ndarray, ch=True):
         super().__init__(bold,meek,pol=ch)
         self.mHeight = heightdir
@@ -171,6 +203,9 @@ class DBFOD(BFOD):
         self.mBoldR = np.linalg.norm(self.mBold.mPos - self.mPos)
 
 class TBFOD(BFOD):
+    __slots__ = ()
+    mCode = 5
+
     def __init__(self, bold: Atom, meek: Atom, heightdir: np.ndarray, ch=True):
         super().__init__(bold,meek,pol=ch)
         self.mHeight = heightdir 
@@ -218,3 +253,263 @@ class TBFOD(BFOD):
 
     def DetermineHeight(self):
         pass
+
+################# BATCHED ENGINE #################
+
+def BondFODs(mol, bonds=None) -> bool:
+    """
+    Batched version of SingleBond, DoubleBond and TripleBond in FODStructure.PrepareShells. It
+    works on the (n_bonds x 2) array of bonded atoms and the bond orders of the molecule, and it
+    determines the bold/meek atoms, portions, heights and positions of all the BFODs of each bond
+    order at once. The BFODs are written into the FOD store of the molecule in the order in which
+    the per-atom heuristics create them, and they are linked to the atoms and bonds.
+    The rotations of all bonds are done at once with RotateNormalsBatch and RotateVecs.
+
+    mol: The Molecule
+    bonds: Indices of the bonds whose BFODs are created. All bonds by default.
+
+    Returns False, without creating any BFOD, when a bond falls outside of the cases handled
+    here (e.g. missing radii or neighbors for the double bond rules). The caller then uses the
+    per-atom heuristics, which report the problem.
+    """
+    table = mol.mAtoms
+    store = mol.mContext.mStore
+    pairs = mol.mBondIdx
+    orders = mol.mBondOrder
+    nb = len(pairs)
+    sel = np.arange(nb) if bonds is None else np.asarray(bonds, dtype=np.int64)
+    if len(sel) == 0:
+        return True
+
+    # Adjacency in the order of Atom.mBonds (the CSR arrays of the bond table)
+    bonds = mol.mBonds
+    start = bonds.mNbrStart[:-1]
+    degree = bonds.Degree()
+    nbr_bond = bonds.mNbrBond
+
+    # The lower atom creates the bond. Sort the bonds as the per-atom loop would visit them.
+    lo = pairs.min(axis=1)
+    hi = pairs.max(axis=1)
+    lo_rank = np.where(pairs[:,0] == lo, bonds.mRank[:,0], bonds.mRank[:,1])
+    sel = sel[np.lexsort((lo_rank[sel], lo[sel]))]
+
+    # Bold and meek atoms (BoldMeek)
+    P, Z = table.mPeriod, table.mZ
+    lo_bold = (P[lo] < P[hi]) | ((P[lo] == P[hi]) & (Z[lo] > Z[hi]))
+    bold = np.where(lo_bold, lo, hi)
+    meek = np.where(lo_bold, hi, lo)
+
+    # FODs per bond and channel. DBFODs are only placed for atoms up to 18 electrons.
+    nfod = np.zeros(nb, dtype=np.int64)
+    nfod[orders == 1] = 1
+    nfod[(orders == 2) & (table.mFullElec[lo] <= 18)] = 2
+    nfod[orders == 3] = 3
+    nch = 2 if mol.mOpen else 1
+
+    # The geometry is computed for the alpha channel only, bond by bond. The beta channel of an
+    # open-shell molecule is a copy of it, made when the FODs are written.
+    counts = nfod[sel]
+    nrows = int(counts.sum())
+    row_bond = np.repeat(sel, counts)
+    row_member = np.arange(nrows) - np.repeat(np.cumsum(counts) - counts, counts)
+    first_row = np.full(nb, -1)
+    first_row[sel] = np.cumsum(counts) - counts
+
+    geometry = mol.mGeometry
+    B = table.mPos[bold]
+    M = table.mPos[meek]
+    bonddir = geometry.Oriented(bold)
+    bonddist = geometry.mDist
+
+    pos = np.zeros((nrows, 3))
+    height = np.zeros((nrows, 3))
+    boldangle = np.zeros(nrows)
+    meekangle = np.zeros(nrows)
+    boldR = np.zeros(nrows)
+    meekR = np.zeros(nrows)
+    portion = np.zeros(nrows)
+    code = np.zeros(nrows, dtype=np.int8)
+
+    try:
+        ### Single bonds ###
+        rows = np.flatnonzero(orders[row_bond] == 1)
+        b = row_bond[rows]
+        code[rows] = SBFOD.mCode
+        Zb, Zm = Z[bold[b]].astype(float), Z[meek[b]].astype(float)
+        Zb = np.where(Zb == 1, 0.4, Zb)
+        r = np.sqrt(Zm/Zb)
+        g = r/(1+r)
+        g = np.where(g < 0.5, g, 1-g)
+        portion[rows] = np.where(Z[bold[b]] == Z[meek[b]], 0.5, g)
+        pos[rows] = B[b] + bonddir[b]*portion[rows][:,None]
+        boldR[rows] = bonddist[b]*portion[rows]
+        meekR[rows] = bonddist[b]*(1-portion[rows])
+
+        ### Triple bonds ###
+        rows = np.flatnonzero(orders[row_bond] == 3)
+        b = row_bond[rows]
+        code[rows] = TBFOD.mCode
+        tb = sel[orders[sel] == 3]
+        if len(tb) > 0:
+            lohi = geometry.Oriented(lo)[tb]
+            axis = lohi/np.linalg.norm(lohi, axis=1)[:,None]
+            norms = np.empty((nb, 3, 3))
+            norms[tb] = RotateNormalsBatch(3, RandomPerpDirs(lohi), axis)
+            height[rows] = norms[b, row_member[rows]]
+
+            rad = GlobalData.GetRadii(Z[bold[b]])
+            c = bonddist[b]
+            mono = Z[bold[b]] == Z[meek[b]]
+            p2 = (P[bold[b]] == 2) & (P[meek[b]] == 2)
+            p3 = (P[bold[b]] > 2) & (P[meek[b]] > 2)
+            if (mono & ~p2 & ~p3).any():
+                return False
+            theta = np.full(len(rows), np.deg2rad(54.735))
+            with np.errstate(invalid='ignore'):
+                theta = np.where(mono & p2, np.arccos((c/2)/rad), theta)
+            theta = np.where(mono & p3, np.arctan(rad/(c/2)), theta)
+            dr = (bonddir[b]/c[:,None])*rad[:,None]*np.cos(theta)[:,None]
+            dl = height[rows]*rad[:,None]*np.sin(theta)[:,None]
+            pos[rows] = B[b] + dr + dl
+            boldangle[rows] = theta
+            meekangle[rows] = AnglesBetween(-bonddir[b], pos[rows] - M[b])
+            boldR[rows] = np.linalg.norm(pos[rows] - B[b], axis=1)
+            meekR[rows] = np.linalg.norm(pos[rows] - M[b], axis=1)
+            portion[rows] = (np.cos(theta)*boldR[rows])/c
+
+        ### Double bonds ###
+        db = sel[nfod[sel] == 2]
+        if len(db) > 0:
+            freepairs = table.mFreePairs[lo[db]]
+            deg = degree[lo[db]]
+            D = np.full((len(db), 3), np.nan)
+            pending = np.zeros(len(db), dtype=bool)
+
+            def Neighbors(atoms, n, exclude=None):
+                """
+                Vectors from the atoms (with n bonds each) to their bonded atoms, in the order
+                of Atom.mBonds. The bonds in exclude are left out.
+                """
+                idx = start[atoms][:,None] + np.arange(n)[None,:]
+                if exclude is not None:
+                    idx = idx[nbr_bond[idx] != exclude[:,None]].reshape(len(atoms), n-1)
+                return geometry.mNbrVec[idx]
+
+            # (a) No free pairs and 3 bonds: height from the neighbors (HeightDir_fromNeighborBFODs)
+            case = (freepairs == 0) & (deg == 3)
+            if case.any():
+                vec = Neighbors(lo[db[case]], 3, db[case])
+                d = np.cross(vec[:,0], vec[:,1])
+                d = d/np.linalg.norm(d, axis=1)[:,None]
+                BA = geometry.Oriented(lo)[db[case]]
+                angle = AnglesBetween(BA, d)
+                off = (angle > 1.01*(np.pi/2)) | (angle < .99*(np.pi/2))
+                if off.any():
+                    axis = np.cross(BA[off], d[off])
+                    axis = axis/np.linalg.norm(axis, axis=1)[:,None]
+                    d[off] = RotateVecs(d[off], axis*(np.pi/2 - angle[off])[:,None])
+                D[case] = d
+            # (b) No free pairs and 2 bonds: random direction for the first bond of the atom,
+            # the normal of the BFODs of the first bond for the second one
+            case = (freepairs == 0) & (deg == 2) & (lo_rank[db] == 0)
+            D[case] = RandomPerpDirs(bonddir[db[case]])
+            pending = (freepairs == 0) & (deg == 2) & (lo_rank[db] != 0)
+            # (c) One free pair: normal of the plane of the neighbors
+            case = (freepairs == 1) & (deg == 2)
+            if case.any():
+                vec = Neighbors(lo[db[case]], 2)
+                d = np.cross(vec[:,0], vec[:,1])
+                D[case] = d/np.linalg.norm(d, axis=1)[:,None]
+            if ((freepairs == 1) & (deg != 2)).any() or ((freepairs == 0) & (deg != 2) & (deg != 3)).any():
+                return False
+            # (d) Anything else: random direction
+            case = (freepairs != 0) & (freepairs != 1)
+            D[case] = RandomPerpDirs(bonddir[db[case]])
+
+            # Parameters shared by both FODs of the bond (GetBondAxProj)
+            Zb, Zm = Z[bold[db]], Z[meek[db]]
+            rad = GlobalData.GetRadii(Zb)
+            Z1 = np.where(Zb == 1, 0.4, Zb)
+            Z2 = np.where(Zm == 1, 0.4, Zm)
+            r = np.sqrt(Z1/Z2)
+            g = r/(1+r)
+            g = np.where(g < 0.5, g, 1-g)
+            proj = np.where(P[bold[db]] == P[meek[db]], g, np.cos(np.deg2rad(54))*rad/bonddist[db])
+            proj = np.where(Zb == Zm, 0.5, proj)
+            delta_bond = bonddir[db]*proj[:,None]
+            with np.errstate(invalid='ignore'):
+                hlen = np.sqrt(rad**2 - np.linalg.norm(delta_bond, axis=1)**2)
+
+            def PlaceDouble(case):
+                """
+                Place the DBFODs of the double bonds db[case] along their height directions.
+                """
+                bb = db[case]
+                for m, sign in ((0, 1), (1, -1)):
+                    rows = first_row[bb] + m
+                    code[rows] = DBFOD.mCode
+                    h = D[case] if sign > 0 else -D[case]
+                    height[rows] = h
+                    portion[rows] = proj[case]
+                    pos[rows] = B[bb] + delta_bond[case] + h*hlen[case][:,None]
+                    toFOD = M[bb] - pos[rows]
+                    meekangle[rows] = AnglesBetween(bonddir[bb], toFOD)
+                    meekR[rows] = np.linalg.norm(toFOD, axis=1)
+                    boldangle[rows] = AnglesBetween(bonddir[bb], pos[rows] - B[bb])
+                    boldR[rows] = np.linalg.norm(B[bb] - pos[rows], axis=1)
+
+            PlaceDouble(~pending)
+            placed = ~pending
+            # The second bond of a two-bonded atom depends on the BFODs of its first bond, which
+            # may themselves be a pending double bond (e.g. cumulenes).
+            dep = nbr_bond[start[lo[db]]]
+            where_db = np.full(nb, -1)
+            where_db[db] = np.arange(len(db))
+            while pending.any():
+                ready = pending & ((where_db[dep] < 0) | placed[np.maximum(where_db[dep], 0)])
+                if not ready.any() or (nfod[dep[ready]] != 2).any():
+                    return False
+                first = first_row[dep[ready]]
+                if (first < 0).any():
+                    return False
+                at = table.mPos[lo[db[ready]]]
+                D[ready] = np.cross(pos[first] - at, pos[first + 1] - at)
+                PlaceDouble(ready)
+                placed |= ready
+                pending &= ~ready
+    except KeyError:
+        return False
+
+    ### Write the FODs, in creation order (bond by bond, channel by channel), and link them ###
+    counts = nfod[sel]*nch
+    out_bond = np.repeat(sel, counts)
+    offset = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    src = first_row[out_bond] + offset % nfod[out_bond]
+    first_row[sel] = np.cumsum(counts) - counts
+    rows = store.Extend(BFOD, pos[src], type=code[src], channel=offset < nfod[out_bond], bold=bold[out_bond],
+                        meek=meek[out_bond], height=height[src], boldangle=boldangle[src],
+                        meekangle=meekangle[src], boldR=boldR[src], meekR=meekR[src], portion=portion[src])
+    fods = store.Views(range(rows.start, rows.stop))
+    if len(fods) == 0:
+        return True
+    # Siblings: the other FODs of the same bond and channel
+    n = nfod[out_bond]
+    group = first_row[out_bond] + offset - offset % n
+    for k in (2, 3):
+        member = np.flatnonzero(n == k)
+        if len(member) == 0:
+            continue
+        m = offset[member] % k
+        others = np.array([[j for j in range(k) if j != i] for i in range(k)])
+        sibs = group[member][:,None] + others[m]
+        for i, row in zip(member.tolist(), sibs.tolist()):
+            fods[i].mSiblings = tuple(fods[j] for j in row)
+    # Every atom receives the FODs of its bonds in creation order (grouped by atom, then by row)
+    owner = np.concatenate((bold[out_bond], meek[out_bond]))
+    local = np.tile(np.arange(len(fods)), 2)
+    order = np.lexsort((local, owner))
+    owner, local = owner[order], local[order]
+    bounds = np.flatnonzero(np.diff(owner)) + 1
+    for at, chunk in zip(owner[np.r_[0, bounds]].tolist(), np.split(local, bounds)):
+        table[at].mFODStruct.mBFODs.extend(fods[j] for j in chunk.tolist())
+    return True
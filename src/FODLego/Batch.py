@@ -0,0 +1,150 @@
+#Description: Batch driver that predicts the FODs of many structures in one call. The inputs
+#  are distributed over a pool of worker processes, one Molecule per task, so that RDKit, SciPy
+#  and the rest of FODLego are imported once per worker instead of once per structure.
+#  Every input writes its CLUSTER, FRMORB and lego.xyz into its own output directory.
+import os
+import re
+import logging
+import argparse
+from glob import glob
+from multiprocessing import Pool
+logger = logging.getLogger(__name__)
+
+# Extensions of the structure files that FODLego can read directly
+STRUCT_EXT = (".xyz", ".pdb", "CLUSTER")
+
+def ReadManifest(manifest: str) -> list:
+    """
+    Read a manifest file. Each non-empty line holds one input (a structure file or a SMILES
+    string) as its first column. Lines starting with '#' are ignored. Relative paths are
+    resolved with respect to the directory of the manifest.
+    """
+    inputs = []
+    root = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, 'r') as file:
+        for line in file:
+            entry = line.split()
+            if len(entry) == 0 or entry[0].startswith('#'):
+                continue
+            src = entry[0]
+            path = os.path.join(root, src)
+            if os.path.isfile(path):
+                src = path
+            inputs.append(src)
+    return inputs
+
+def CollectInputs(specs: list) -> list:
+    """
+    Expand the command line specifications into a list of inputs. A specification can be a
+    structure file, a glob pattern of structure files, or a manifest file.
+    """
+    inputs = []
+    for spec in specs:
+        if os.path.isfile(spec) and not spec.endswith(STRUCT_EXT):
+            inputs += ReadManifest(spec)
+        else:
+            matches = sorted(glob(spec))
+            if len(matches) == 0:
+                logger.warning(f"No input matches {spec}")
+            inputs += matches
+    return inputs
+
+def OutputDirs(inputs: list, outdir: str) -> list:
+    """
+    Return a unique output directory for every input. Files are named after their basename
+    without extension, SMILES strings after their position in the input list.
+    """
+    dirs = []
+    used = set()
+    for i, src in enumerate(inputs):
+        if os.path.isfile(src):
+            name = os.path.basename(src)
+            for ext in STRUCT_EXT:
+                if name.endswith(ext) and name != ext:
+                    name = name[:-len(ext)].rstrip('._')
+                    break
+        else:
+            name = f"smiles_{i}"
+        name = re.sub(r'[^A-Za-z0-9_.+-]', '_', name)
+        # Two inputs with the same name (e.g. several CLUSTER files) get a numbered suffix
+        unique = name
+        n = 1
+        while unique in used:
+            unique = f"{name}_{n}"
+            n += 1
+        used.add(unique)
+        dirs.append(os.path.join(outdir, unique))
+    return dirs
+
+def _InitWorker():
+    """
+    Import the prediction machinery once per worker process.
+    """
+    import FODLego.Molecule
+
+def _PredictOne(task):
+    """
+    Predict the FODs of a single input and write them into its output directory.
+    Returns the input, the output directory and an error message (None on success).
+    """
+    from FODLego.Molecule import Molecule
+    src, dest, openshell, symmetry = task
+    try:
+        mol = Molecule(src, openshell=openshell, symmetry=symmetry)
+        os.makedirs(dest, exist_ok=True)
+        mol.CreateCLUSTER(os.path.join(dest, "CLUSTER"))
+        mol.CreateFRMORB(os.path.join(dest, "FRMORB"))
+        mol.CreateXYZ(os.path.join(dest, "lego.xyz"))
+        return src, dest, None
+    except Exception as e:
+        return src, dest, f"{type(e).__name__}: {e}"
+
+def RunBatch(inputs: list, outdir: str = "fodlego_out", jobs: int = None, openshell: bool = False, symmetry: bool = False) -> int:
+    """
+    Predict the FODs of all inputs across a process pool. Returns the number of inputs
+    that could not be predicted.
+    """
+    dirs = OutputDirs(inputs, outdir)
+    tasks = [(src, dest, openshell, symmetry) for src, dest in zip(inputs, dirs)]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(tasks)))
+
+    failed = 0
+    if jobs == 1:
+        results = map(_PredictOne, tasks)
+        failed = _Report(results)
+    else:
+        with Pool(jobs, initializer=_InitWorker) as pool:
+            failed = _Report(pool.imap_unordered(_PredictOne, tasks))
+    logger.info(f"Predicted {len(tasks) - failed} of {len(tasks)} inputs into {outdir}")
+    return failed
+
+def _Report(results) -> int:
+    failed = 0
+    for src, dest, error in results:
+        if error is None:
+            logger.info(f"{src} -> {dest}")
+        else:
+            failed += 1
+            logger.warning(f"{src} could not be predicted. {error}")
+    return failed
+
+def BatchMain(argv: list) -> int:
+    """
+    Command line interface of 'fodlego batch'.
+    """
+    parser = argparse.ArgumentParser(prog="fodlego batch",
+        description="Predict the FODs of many inputs (XYZ, PDB, CLUSTER or SMILES) in parallel.")
+    parser.add_argument("inputs", nargs='+', help="Structure files, glob patterns or manifest files")
+    parser.add_argument("-o", "--outdir", default="fodlego_out", help="Directory that receives one subdirectory per input")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--open", action="store_true", help="Create open-shell (alpha/beta) FODs")
+    parser.add_argument("--symmetry", action="store_true", help="Place the FODs of symmetry-unique atoms and bonds only, and generate the rest with the point group")
+    args = parser.parse_args(argv)
+
+    inputs = CollectInputs(args.inputs)
+    if len(inputs) == 0:
+        logger.warning("No inputs were found")
+        return 1
+    return RunBatch(inputs, args.outdir, args.jobs, args.open, args.symmetry)
@@ -1,20 +1,145 @@
+#Description: The BondTable class holds every bond of a molecule once: the bonded atom pairs (in the
+#  order of RDKit), the bond orders, CSR arrays with the bonds and bonded atoms of every atom, and the
+#  rows of the FOD store that belong to each bond. Bond objects are views into a row of the table; the
+#  molecule and its atoms share the table instead of keeping copies of every bond.
 from FODLego.Funcs import *
 from FODLego.FOD import FOD
-from scipy.spatial import distance
 
-class Bond:
-    def __init__(self,start,end,order):
-        self.mAtoms = (start,end)
-        self.mOrder = order
-        self.mFODs: List[FOD] = []
 
-    # Methods
-    def SetFODs(self, fods):
+class BondTable:
+    def __init__(self, atoms, idx, orders):
+        self.mAtoms = atoms
+        self.mIdx = np.asarray(idx, dtype=np.int64).reshape(-1, 2)
+        self.mOrder = np.asarray(orders, dtype=np.float64).reshape(-1)
+        n, nb = len(atoms), len(self.mIdx)
+
+        # CSR adjacency. The bonds of atom i are mNbrBond[mNbrStart[i]:mNbrStart[i+1]], in the
+        # order of RDKit, and mNbrAtom holds the bonded atoms. mRank[b,k] is the position of bond b
+        # in the list of its atom mIdx[b,k].
+        ends = self.mIdx.T.reshape(-1)
+        ids = np.tile(np.arange(nb), 2)
+        order = np.lexsort((ids, ends))
+        degree = np.bincount(ends, minlength=n)
+        self.mNbrStart = np.zeros(n + 1, dtype=np.int64)
+        self.mNbrStart[1:] = np.cumsum(degree)
+        self.mNbrBond = ids[order]
+        self.mNbrAtom = self.mIdx[:,::-1].T.reshape(-1)[order]
+        rank = np.empty(2*nb, dtype=np.int64)
+        rank[order] = np.arange(2*nb) - self.mNbrStart[ends[order]]
+        self.mRank = rank.reshape(2, nb).T
+
+        # FOD slices. The FODs of bond b are the store rows mFODRows[mFODStart[b]:mFODStart[b+1]]
+        self.mStore = None
+        self.mFODStart = np.zeros(nb + 1, dtype=np.int64)
+        self.mFODRows = np.zeros(0, dtype=np.int64)
+
+        self.mViews = [None]*nb
+        self.mAtomViews = [None]*n
+
+    def Degree(self) -> np.ndarray:
+        """
+        Number of bonds of every atom.
+        """
+        return np.diff(self.mNbrStart)
+
+    def Neighbors(self, atoms) -> np.ndarray:
+        """
+        Bonded atoms of each of the atoms, in the order of Atom.mBonds. All the atoms must have
+        the same number of bonds.
+        """
+        atoms = np.asarray(atoms, dtype=np.int64)
+        if len(atoms) == 0:
+            return np.zeros((0, 0), dtype=np.int64)
+        n = self.mNbrStart[atoms[0] + 1] - self.mNbrStart[atoms[0]]
+        return self.mNbrAtom[self.mNbrStart[atoms][:,None] + np.arange(n)[None,:]]
+
+    def AtomBonds(self, i: int) -> list:
+        """
+        Views of the bonds of atom i, starting at atom i, in the order of RDKit.
+        """
+        views = self.mAtomViews[i]
+        if views is None:
+            bonds = self.mNbrBond[self.mNbrStart[i]:self.mNbrStart[i+1]].tolist()
+            views = [Bond(self, b, reverse=bool(self.mIdx[b,0] != i)) for b in bonds]
+            self.mAtomViews[i] = views
+        return views
+
+    def LinkFODs(self, store) -> None:
         """
-        Set the FODs belonging to this bond.
+        Find the BFODs of every bond in the store (through their bold and meek atoms) and keep
+        them as slices of mFODRows, in row order.
         """
-        self.mFODs = fods
+        from FODLego.BFOD import BFOD
+        self.mStore = store
+        n = len(self.mAtoms)
+        key = self.mIdx.min(axis=1)*n + self.mIdx.max(axis=1)
+        sort = np.argsort(key)
+        rows = store.Select(BFOD)
+        bold, meek = store['bold'][rows], store['meek'][rows]
+        bond = sort[np.searchsorted(key[sort], np.minimum(bold, meek)*n + np.maximum(bold, meek))]
+        order = np.lexsort((rows, bond))
+        self.mFODRows = rows[order]
+        self.mFODStart[1:] = np.cumsum(np.bincount(bond, minlength=len(self)))
 
+    def GetFODs(self, b: int) -> list:
+        """
+        The FODs of bond b (both channels, alpha first when created so).
+        """
+        if self.mStore is None:
+            return []
+        return self.mStore.Views(self.mFODRows[self.mFODStart[b]:self.mFODStart[b+1]])
+
+    # Sequence protocol. Bond views are created on first access.
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        bond = self.mViews[index]
+        if bond is None:
+            bond = Bond(self, index)
+            self.mViews[index] = bond
+        return bond
+
+    def __len__(self) -> int:
+        return len(self.mIdx)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class Bond:
+    """
+    View of a row of a BondTable. mAtoms is (start, end); the views in Atom.mBonds start at their
+    atom, so that mAtoms[1] is the bonded atom.
+    """
+    def __init__(self, table: BondTable, index: int, reverse: bool = False):
+        self.mTable = table
+        self.mI = index
+        self.mReverse = reverse
+
+    @property
+    def mAtoms(self) -> tuple:
+        i, j = self.mTable.mIdx[self.mI]
+        atoms = self.mTable.mAtoms
+        return (atoms[int(j)], atoms[int(i)]) if self.mReverse else (atoms[int(i)], atoms[int(j)])
+
+    @property
+    def mOrder(self) -> float:
+        return float(self.mTable.mOrder[self.mI])
+
+    @property
+    def mFODs(self) -> List[FOD]:
+        return self.mTable.GetFODs(self.mI)
+
+    def __eq__(self, other) -> bool:
+        # Views of the same bond from either atom are the same bond
+        return isinstance(other, Bond) and other.mTable is self.mTable and other.mI == self.mI
+
+    def __hash__(self) -> int:
+        return hash((id(self.mTable), self.mI))
+
+    # Methods
     def GetDist(self):
         """
         Returns the distance between FODs. If 2 BFODs, then it simply returns their distance.
@@ -28,6 +153,7 @@ class Bond:
             b = self.mFODs[1].mAssocFOD.mPos
             c = self.mFODs[2].mAssocFOD.mPos
             # Get their pairwise distance and average
+            from scipy.spatial import distance
             arr = np.vstack((a,b,c))
             dd = distance.cdist(arr,arr)
             dd = np.tril(dd)
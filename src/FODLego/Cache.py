@@ -0,0 +1,106 @@
+#Description: On-disk cache of the RDKit stages of loading a molecule: the bond perception of XYZ
+#  inputs (DetermineConnectivity/DetermineBondOrders) and the constrained embedding of a SMILES onto
+#  a reference XYZ (ConstrainedEmbed + MMFF). Entries are RDKit binary molecules, keyed by a hash of
+#  the elements, the rounded coordinates, the charge and the SMILES, so that repeated passes over the
+#  same inputs do not run RDKit's perception or embedding again.
+#  The cache is used when a Molecule receives cache=True/<directory>, or when FODLEGO_CACHE is set.
+import os
+import hashlib
+import logging
+import numpy as np
+from tempfile import mkstemp
+from rdkit import Chem, rdBase
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fodlego")
+
+class MolCache:
+    def __init__(self, directory: str = None):
+        self.mDir = directory or os.environ.get("FODLEGO_CACHE") or DEFAULT_DIR
+        self.mHits = 0
+        self.mMisses = 0
+
+    @staticmethod
+    def Key(kind: str, mol: Chem.Mol = None, charge: int = 0, smiles: str = '', decimals: int = 4) -> str:
+        """
+        Hash of the inputs of an RDKit stage: its kind (e.g. 'bonds'), the RDKit version, the
+        charge, the SMILES and the elements and coordinates (rounded to decimals) of mol.
+        """
+        h = hashlib.sha256()
+        h.update(f"{kind}|{rdBase.rdkitVersion}|{charge}|{smiles}|".encode())
+        if mol is not None:
+            Z = np.array([atom.GetAtomicNum() for atom in mol.GetAtoms()], dtype=np.int32)
+            h.update(Z.tobytes())
+            if mol.GetNumConformers() > 0:
+                # Adding 0.0 turns -0.0 into 0.0, so both round to the same bytes
+                pos = np.round(mol.GetConformer().GetPositions(), decimals) + 0.0
+                h.update(pos.tobytes())
+        return h.hexdigest()
+
+    def _Path(self, key: str) -> str:
+        return os.path.join(self.mDir, key[:2], key + ".mol")
+
+    def Load(self, key: str, natoms: int = None):
+        """
+        Return the cached molecule of key, or None. Entries that cannot be read, or that do not
+        have natoms atoms, are ignored.
+        """
+        path = self._Path(key)
+        try:
+            with open(path, 'rb') as file:
+                mol = Chem.Mol(file.read())
+        except FileNotFoundError:
+            self.mMisses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}. {e}")
+            self.mMisses += 1
+            return None
+        if natoms is not None and mol.GetNumAtoms() != natoms:
+            self.mMisses += 1
+            return None
+        self.mHits += 1
+        return mol
+
+    def Store(self, key: str, mol: Chem.Mol) -> None:
+        """
+        Write mol (with its bonds and conformers) as the entry of key. The file is replaced
+        atomically, so several processes can share a cache directory.
+        """
+        path = self._Path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as file:
+                file.write(mol.ToBinary())
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path}. {e}")
+
+def GetCache(cache):
+    """
+    Resolve the cache argument of Molecule: a MolCache, True (default directory), a directory,
+    or None/False. None uses the directory in FODLEGO_CACHE if it is set.
+    """
+    if isinstance(cache, MolCache):
+        return cache
+    if cache is None:
+        cache = os.environ.get("FODLEGO_CACHE")
+        if not cache:
+            return None
+    if cache is False:
+        return None
+    return MolCache(None if cache is True else cache)
+
+def SetPositions(mol: Chem.Mol, pos: np.ndarray) -> None:
+    """
+    Set the coordinates of the first conformer of mol, e.g. to the exact input coordinates
+    after a cached molecule was loaded with a key of rounded coordinates.
+    """
+    conf = mol.GetConformer()
+    if hasattr(conf, "SetPositions"):
+        conf.SetPositions(np.asarray(pos, dtype=np.float64))
+    else:
+        from rdkit.Geometry import Point3D
+        for i, p in enumerate(pos):
+            conf.SetAtomPosition(i, Point3D(*p))
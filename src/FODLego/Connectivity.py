@@ -0,0 +1,198 @@
+#Description: Connectivity and bond-order perception for large structures. Atoms are bonded when
+#  their distance is below the sum of their covalent radii plus a tolerance; the candidate pairs come
+#  from a KD-tree, so the cost grows linearly with the number of atoms. Bond orders are then
+#  determined by RDKit for every connected fragment on its own, instead of for the whole molecule.
+#  Used by Molecule(..., connectivity='covalent').
+import logging
+import numpy as np
+from scipy.spatial import cKDTree
+from rdkit import Chem
+from rdkit.Chem import rdDetermineBonds
+logger = logging.getLogger(__name__)
+
+_RCOV = None
+
+def CovalentRadii(Z: np.ndarray) -> np.ndarray:
+    """
+    Covalent radii (in Angstrom) of the RDKit periodic table for every atomic number in Z.
+    """
+    global _RCOV
+    if _RCOV is None:
+        pt = Chem.GetPeriodicTable()
+        _RCOV = np.array([pt.GetRcovalent(z) for z in range(119)])
+    return _RCOV[np.asarray(Z)]
+
+def CovalentBonds(Z: np.ndarray, pos: np.ndarray, tol: float = 0.45) -> np.ndarray:
+    """
+    Return the (n,2) array of bonded atom pairs (i < j, sorted). Atoms i and j are bonded when
+    |pos[i] - pos[j]| <= rcov[i] + rcov[j] + tol.
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    if len(pos) < 2:
+        return np.zeros((0,2), dtype=np.int64)
+    rcov = CovalentRadii(Z)
+    pairs = cKDTree(pos).query_pairs(2*rcov.max() + tol, output_type='ndarray').astype(np.int64)
+    dist = np.linalg.norm(pos[pairs[:,0]] - pos[pairs[:,1]], axis=1)
+    pairs = pairs[dist <= rcov[pairs[:,0]] + rcov[pairs[:,1]] + tol]
+    return pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+
+def DetermineBonds(rdmol: Chem.Mol, charge: int = 0, tol: float = 0.45) -> Chem.Mol:
+    """
+    Add the covalent bonds to rdmol (which must have a conformer) and determine their orders
+    fragment by fragment. The charge of the molecule is given to its largest fragment; the other
+    fragments are taken as neutral. Fragments whose orders cannot be determined keep single bonds.
+    Returns the new molecule.
+    """
+    Z = np.array([atom.GetAtomicNum() for atom in rdmol.GetAtoms()])
+    pos = rdmol.GetConformer().GetPositions()
+    pairs = CovalentBonds(Z, pos, tol)
+    rwmol = Chem.RWMol(rdmol)
+    for bond in list(rwmol.GetBonds()):
+        rwmol.RemoveBond(bond.GetBeginAtomIdx(), bond.GetEndAtomIdx())
+    for i, j in pairs:
+        rwmol.AddBond(int(i), int(j), Chem.BondType.SINGLE)
+    mol = rwmol.GetMol()
+    if len(pairs) == 0:
+        return mol
+
+    # A single fragment is perceived as a whole, as RDKit would
+    frags = Chem.GetMolFrags(mol, asMols=False, sanitizeFrags=False)
+    if len(frags) == 1:
+        rdDetermineBonds.DetermineBondOrders(mol, charge=charge)
+        return mol
+
+    # Fragment and index within the fragment of every atom, and the bonds grouped by fragment
+    label = np.empty(len(Z), dtype=np.int64)
+    local = np.empty(len(Z), dtype=np.int64)
+    for f, atoms in enumerate(frags):
+        label[list(atoms)] = f
+        local[list(atoms)] = np.arange(len(atoms))
+    pairs = pairs[np.argsort(label[pairs[:,0]], kind='stable')]
+    bounds = np.searchsorted(label[pairs[:,0]], np.arange(len(frags) + 1))
+
+    largest = max(range(len(frags)), key=lambda f: len(frags[f]))
+    rwmol = Chem.RWMol(mol)
+    for f, atoms in enumerate(frags):
+        if len(atoms) < 2:
+            continue
+        sub = Chem.RWMol()
+        for i in atoms:
+            sub.AddAtom(Chem.Atom(int(Z[i])))
+        edges = pairs[bounds[f]:bounds[f+1]]
+        for i, j in local[edges]:
+            sub.AddBond(int(i), int(j), Chem.BondType.SINGLE)
+        conf = Chem.Conformer(len(atoms))
+        conf.SetPositions(pos[list(atoms)])
+        sub.AddConformer(conf)
+        sub = sub.GetMol()
+        try:
+            rdDetermineBonds.DetermineBondOrders(sub, charge=charge if f == largest else 0)
+            Chem.Kekulize(sub, clearAromaticFlags=True)
+        except Exception as e:
+            logger.warning(f"Bond orders of fragment {f} ({len(atoms)} atoms) could not be determined. {e}")
+            continue
+        # Copy the orders, charges and radicals back onto the molecule
+        for src in sub.GetAtoms():
+            dst = rwmol.GetAtomWithIdx(atoms[src.GetIdx()])
+            dst.SetFormalCharge(src.GetFormalCharge())
+            dst.SetNumRadicalElectrons(src.GetNumRadicalElectrons())
+            dst.SetNoImplicit(True)
+        for (i, j), bond in zip(edges, sub.GetBonds()):
+            rwmol.GetBondBetweenAtoms(int(i), int(j)).SetBondType(bond.GetBondType())
+    mol = rwmol.GetMol()
+    # The fragments are already sanitized and kekulized, so the (costly) aromaticity pass is skipped
+    Chem.SanitizeMol(mol, Chem.SANITIZE_ALL ^ Chem.SANITIZE_SETAROMATICITY)
+    return mol
+
+def _PairSet(pairs) -> set:
+    return {(int(min(i, j)), int(max(i, j))) for i, j in pairs}
+
+def UpdateBonds(rdmol: Chem.Mol, old: np.ndarray, new: np.ndarray, tol: float = 0.45):
+    """
+    Update the bonds of rdmol from the positions old to new (both (M,3), Angstrom). The pairs
+    within the covalent thresholds (CovalentBonds) of both geometries are compared; the bonds
+    that broke are removed from rdmol and the ones that formed are added. The orders and formal
+    charges are only determined again in a region around the changed atoms: the changed atoms,
+    their bonded atoms, and the atoms across multiple bonds out of it, so that every bond leaving
+    the region is a single bond. Those bonds are capped with hydrogens and the region is given
+    the summed formal charge of its atoms. The rest of rdmol keeps its bonds and orders.
+    Returns the new molecule and the atoms of the region, or (None, empty) when no bond changed.
+    Raises ValueError when the orders of the region cannot be determined.
+    """
+    Z = np.array([atom.GetAtomicNum() for atom in rdmol.GetAtoms()])
+    before, after = _PairSet(CovalentBonds(Z, old, tol)), _PairSet(CovalentBonds(Z, new, tol))
+    formed, broken = after - before, before - after
+    current = {(min(b.GetBeginAtomIdx(), b.GetEndAtomIdx()), max(b.GetBeginAtomIdx(), b.GetEndAtomIdx())): b.GetBondTypeAsDouble()
+               for b in rdmol.GetBonds()}
+    formed -= set(current)
+    broken &= set(current)
+    if len(formed) == 0 and len(broken) == 0:
+        return None, np.zeros(0, dtype=np.int64)
+    bonds = {pair: order for pair, order in current.items() if pair not in broken}
+    bonds.update({pair: 1.0 for pair in formed})
+
+    # Region: the changed atoms and their bonded atoms, grown across multiple bonds
+    nbrs = [[] for _ in Z]
+    for i, j in bonds:
+        nbrs[i].append(j)
+        nbrs[j].append(i)
+    changed = {i for pair in formed | broken for i in pair}
+    region = set(changed)
+    for i in changed:
+        region.update(nbrs[i])
+    while True:
+        out = {k for (i, j), order in bonds.items() if order != 1.0 and (i in region) != (j in region) for k in (i, j)}
+        if out <= region:
+            break
+        region |= out
+    region = sorted(region)
+    local = {a: k for k, a in enumerate(region)}
+
+    # Capped region, with a hydrogen along every bond that leaves it
+    rcov = CovalentRadii(Z)
+    sub = Chem.RWMol()
+    for a in region:
+        sub.AddAtom(Chem.Atom(int(Z[a])))
+    xyz = [new[a] for a in region]
+    inner = [(i, j) for (i, j) in bonds if i in local and j in local]
+    for i, j in inner:
+        sub.AddBond(local[i], local[j], Chem.BondType.SINGLE)
+    for i, j in bonds:
+        if (i in local) == (j in local):
+            continue
+        a, b = (i, j) if i in local else (j, i)
+        h = sub.AddAtom(Chem.Atom(1))
+        sub.AddBond(local[a], h, Chem.BondType.SINGLE)
+        axis = new[b] - new[a]
+        xyz.append(new[a] + axis/np.linalg.norm(axis)*(rcov[Z[a]] + rcov[1]))
+    conf = Chem.Conformer(sub.GetNumAtoms())
+    conf.SetPositions(np.array(xyz, dtype=np.float64))
+    sub.AddConformer(conf)
+    sub = sub.GetMol()
+    charge = sum(rdmol.GetAtomWithIdx(a).GetFormalCharge() for a in region)
+    try:
+        rdDetermineBonds.DetermineBondOrders(sub, charge=charge)
+        Chem.Kekulize(sub, clearAromaticFlags=True)
+    except Exception as e:
+        raise ValueError(f"Bond orders of the {len(region)} atoms around the changed bonds could not be determined. {e}")
+
+    # Copy the bonds, orders, charges and radicals of the region back onto the molecule
+    rwmol = Chem.RWMol(rdmol)
+    for i, j in sorted(broken):
+        rwmol.RemoveBond(i, j)
+    for i, j in sorted(formed):
+        rwmol.AddBond(i, j, Chem.BondType.SINGLE)
+    for i, j in inner:
+        rwmol.GetBondBetweenAtoms(i, j).SetBondType(sub.GetBondBetweenAtoms(local[i], local[j]).GetBondType())
+    for a in region:
+        src = sub.GetAtomWithIdx(local[a])
+        dst = rwmol.GetAtomWithIdx(a)
+        dst.SetFormalCharge(src.GetFormalCharge())
+        dst.SetNumRadicalElectrons(src.GetNumRadicalElectrons())
+        dst.SetNoImplicit(True)
+    mol = rwmol.GetMol()
+    try:
+        Chem.SanitizeMol(mol, Chem.SANITIZE_ALL ^ Chem.SANITIZE_SETAROMATICITY)
+    except Exception as e:
+        raise ValueError(f"The molecule with the new bonds is not valid. {e}")
+    return mol, np.array(region, dtype=np.int64)
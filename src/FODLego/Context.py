@@ -0,0 +1,55 @@
+#Description: The FODContext class holds the FODs that belong to a single molecule. Each Molecule
+#  owns one context and its FODs are rows of the context's FODStore, so that nothing is accumulated
+#  in class-level lists. Building many molecules in one process (e.g. a MolecularSet) therefore
+#  keeps the memory of each molecule separate, and molecules can be built concurrently.
+import numpy as np
+from typing import List
+from FODLego.FOD import FOD, FODStore
+
+
+class FODContext:
+    def __init__(self, atoms=None):
+        self.mStore = FODStore(atoms)    # Predicted FODs, in creation order
+        self.mTargets = FODStore(atoms)  # Target FODs associated with the predicted ones
+
+    @property
+    def mFODs(self) -> List[FOD]:
+        """
+        All predicted FODs, in the (deterministic) order of creation.
+        """
+        return self.mStore.Views()
+
+    @property
+    def mBFODs(self) -> List[FOD]:
+        """
+        The predicted bonding FODs, in the order of creation.
+        """
+        from FODLego.BFOD import BFOD
+        return self.mStore.Views(self.mStore.Select(BFOD))
+
+    def RestoreCreationOrder(self) -> None:
+        """
+        Reorder the predicted FODs into the order of the per-atom heuristics: atom by atom, first
+        the bonding FODs of its bonds to higher atoms, then the core FODs and then the free FODs.
+        The batched engines fill the store stage by stage, so their rows are sorted afterwards.
+        """
+        from FODLego.FOD import CFOD
+        from FODLego.BFOD import BFOD
+        store = self.mStore
+        if len(store) == 0:
+            return
+        stage = np.full(len(store), 2)
+        stage[store.Select(BFOD)] = 0
+        stage[store.Select(CFOD)] = 1
+        owner = np.where(stage == 0, np.minimum(store['bold'], store['meek']), store['atom'])
+        store.Permute(np.lexsort((np.arange(len(store)), stage, owner)))
+
+    def Clear(self) -> None:
+        """
+        Remove all FODs from the context.
+        """
+        self.mStore = FODStore(self.mStore.mAtoms)
+        self.mTargets = FODStore(self.mTargets.mAtoms)
+
+    def __len__(self) -> int:
+        return len(self.mStore)
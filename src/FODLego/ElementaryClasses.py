@@ -11,9 +11,6 @@ import numpy as np
 from numpy import sqrt
 from numpy.linalg import norm
 from typing import List
-from scipy.spatial.transform import Rotation as R
-from scipy.spatial.distance import cdist
-from rdkit.Chem import GetPeriodicTable as PT
 #
 # FODLego Dependencies
 from FODLego.Bond import *
@@ -24,36 +21,101 @@ from  .globaldata import GlobalData
 ################# FOD STRUCTURE #################
 
 class Atom:
-    def __init__(self, index: int, Name: str, Pos, owner):
+    """
+    View of a row of an AtomTable. The atomic attributes (position, Z, period, group, valence count,
+    charge, free pairs, steric number) are read from the arrays of the table, and the bonds from
+    the bond table of the molecule.
+    """
+    def __init__(self, index: int, table):
         #Undetermined Attributes
-        self.mSteric = 0
-        self.mFreePairs = 0
-        self.mCharge = 0  # In the future can be changed 
-        self.mBonds = []
-        self.mGlobalBonds = []
         self.mFODStruct = FODStructure(self)
         self.mCompleteVal = False
         #Known Attributes
-        self.mName = Name
-        self.mPos = np.array(Pos)
+        self.mTable = table
         self.mI = index
-        self.mZ = PT().GetAtomicNumber(Name)
-        self.mPeriod = GlobalData.GetPeriod(self.mZ)
-        self.mGroup = GlobalData.GetRow(self.mZ)
-        self.mValCount = 0
-        self.mOwner = owner
-        
+        self.mOwner = table.mOwner
+
+    @property
+    def mPos(self) -> np.ndarray:
+        return self.mTable.mPos[self.mI]
+
+    @mPos.setter
+    def mPos(self, pos):
+        self.mTable.mPos[self.mI] = pos
+        if self.mTable.mGeometry is not None:
+            self.mTable.mGeometry.Invalidate()
+
+    @property
+    def mName(self) -> str:
+        return self.mTable.GetName(self.mI)
+
+    @property
+    def mZ(self) -> int:
+        return int(self.mTable.mZ[self.mI])
+
+    @property
+    def mPeriod(self) -> int:
+        return int(self.mTable.mPeriod[self.mI])
+
+    @property
+    def mGroup(self) -> int:
+        return int(self.mTable.mGroup[self.mI])
+
+    @property
+    def mFullElec(self) -> int:
+        """
+        Electrons of the atom when its valence is fully completed.
+        """
+        return int(self.mTable.mFullElec[self.mI])
+
+    @property
+    def mValCount(self) -> int:
+        return int(self.mTable.mValCount[self.mI])
+
+    @mValCount.setter
+    def mValCount(self, count: int):
+        self.mTable.mValCount[self.mI] = count
+
+    @property
+    def mCharge(self):
+        return self.mTable.mCharge[self.mI]
+
+    @mCharge.setter
+    def mCharge(self, charge):
+        self.mTable.mCharge[self.mI] = charge
+
+    @property
+    def mFreePairs(self):
+        return self.mTable.mFreePairs[self.mI]
+
+    @mFreePairs.setter
+    def mFreePairs(self, pairs):
+        self.mTable.mFreePairs[self.mI] = pairs
+
+    @property
+    def mSteric(self):
+        return self.mTable.mSteric[self.mI]
+
+    @mSteric.setter
+    def mSteric(self, steric):
+        self.mTable.mSteric[self.mI] = steric
+
+    @property
+    def mBonds(self) -> list:
+        """
+        Views of the bonds of the atom in the bond table of the molecule, starting at this atom.
+        """
+        bonds = self.mTable.mBondTable
+        return [] if bonds is None else bonds.AtomBonds(self.mI)
 
-    def GetMonoCovalRad(self): 
-        elecs = GlobalData.GetFullElecCount(self.mGroup, self.mPeriod)
-        return GlobalData.mRadii[elecs][self.mZ]
+    def GetMonoCovalRad(self):
+        return GlobalData.GetRadii(self.mZ, self.mFullElec)
 
     def GetMonoCovalEdge(self):
         """
         Get the FOD edge distance of a monoatomic calculation
         """
-        elecs = GlobalData.GetFullElecCount(self.mGroup, self.mPeriod)
-        return GlobalData.mVert[elecs][self.mZ]
+        return GlobalData.GetEdges(self.mZ, self.mFullElec)
 
     def GetLastAtomRadius(self):
         dist = np.linalg.norm(self.mFODStruct.mCore[-1].mPos - self.mPos)
@@ -67,29 +129,29 @@ class Atom:
 
     def GetBFODs(self):
         return self.mFODStruct.mBFODs
+
+    def GetAlphaBFODs(self):
+        """
+        The BFODs of the alpha channel. In open-shell molecules the beta BFODs are copies of them,
+        so the free FODs are placed from these only.
+        """
+        return [fod for fod in self.mFODStruct.mBFODs if fod.mChannel]
     
     def GetFFODs(self):
         return self.mFODStruct.mFFODs
 
-    def AddBond(self, atom2, order: int):
-        self.mBonds.append(Bond(self, atom2,order))
-
     def AddBFOD(self, fod):
         self.mFODStruct.mBFODs.append(fod)
     
     def GetVec2BFODs(self):
-        return [ x.mPos - self.mPos for x in self.mFODStruct.mBFODs]
+        return [ x.mPos - self.mPos for x in self.GetAlphaBFODs()]
 
     def GetVectoNeighbors(self):
         """
-        This function returns the sum of the vectors that start on
-        neighboring (bonded) atoms and end on current atom.
+        This function returns the vectors that start on the current atom and
+        end on the neighboring (bonded) atoms, as a (k,3) array.
         """
-        freedir = []
-        for bond in self.mBonds:
-            at2 = bond.mAtoms[1]
-            freedir.append(at2.mPos - self.mPos)
-        return freedir
+        return self.mTable.mGeometry.NeighborVectors(self.mI)
 
     def AverageBFODDir(self):
         """
@@ -100,17 +162,15 @@ class Atom:
         TODO: Resolve whether to use Atoms or FODs as reference
         """
         resultant = np.zeros(3)
-        bfods = self.mFODStruct.mBFODs
+        bfods = self.GetAlphaBFODs()
+        geometry = self.mTable.mGeometry
         for bfod in bfods:
-            # If the ffod atom is Meek, then the vector points in its direction! So, no issue here!
-            if self == bfod.mMeek:
-                resultant += bfod.mBondDir
-            # When the atom is Bold, the BondDir points away, so you must get the negative
-            else:
-                resultant -= bfod.mBondDir
+            # The bonding axis, pointing from the other atom of the bond to this one
+            other = bfod.mBold if self == bfod.mMeek else bfod.mMeek
+            resultant -= geometry.Vector(self.mI, other.mI)
 
         # If the average displacement is too small, then the 3 points are planar
-        resultant /= len(self.mFODStruct.mBFODs)
+        resultant /= len(bfods)
 
         if np.linalg.norm(resultant) < .2:
             vecs = [bfod.mPos-self.mPos for bfod in bfods]
@@ -141,7 +201,7 @@ class Atom:
         #Electrons involved in the Bond
         bondelec = np.sum([2*bond.mOrder for bond in self.mBonds])
         # The difference between the total electrons and the number of electrons that fill the shell
-        self.mCharge = (self.mZ + bondelec) - GlobalData.GetFullElecCount(self.mGroup, self.mPeriod)
+        self.mCharge = (self.mZ + bondelec) - self.mFullElec
         self.mFreePairs = int(GlobalData.mShellCount[self.mPeriod] - bondelec)/2
         self.mSteric = self.mFreePairs + len(self.mBonds)
     
@@ -190,6 +250,7 @@ class Atom:
         """
         dists = []
         if len(self.mFODStruct.mFFODs) > 0 and exists(typ,self.mFODStruct.mFFODs):
+                from scipy.spatial.distance import cdist
                 ffods = [x.mAssocFOD.mPos for x in self.mFODStruct.mFFODs]
                 bfods = [x.mAssocFOD.mPos for x in self.mFODStruct.mBFODs]
                 pairdD = cdist(ffods,bfods)
@@ -268,7 +329,7 @@ class FODStructure:
                 else:
                     self.mfods = np.vstack((self.mfods,fod))
 
-    def _AddCoreShell(self, shell):
+    def _AddCoreShell(self, shell, beta=False):
         """
         This function adds the Shell object to the FODStructure object
         and it also adds the FODs of that Shell object to the mCore of 
@@ -277,22 +338,29 @@ class FODStructure:
        Args:
             shell: The Shell object that will be added to the FOD 
             Structure.
-            ch: Boolean representing the alpha/beta (up/down) channels 
-            of the electrons. True for Alpha, False for Beta.
+            beta: Also add the beta shell, the alpha shell inverted through
+            the nucleus (as in Shells.CoreShells).
         """
         self.mCoreShells.append(shell)
         # Add individual FODs to the electronic structure
         for fod in shell.mfods:
-            GlobalData.mFODs.append(fod)
             self.mCore.append(fod)
+        if beta:
+            store = shell.mfods[0].mStore
+            rows = [fod.mIdx for fod in shell.mfods]
+            new = store.Copy(rows, channel=False, pos=2*self.mAtom.mPos - store['pos'][rows])
+            self._AddCoreShell(type(shell).FromFODs(self.mAtom, store.Views(range(new.start, new.stop)), False))
 
-    def PrepareShells(self, atoms: List[Atom]):
+    def PrepareShells(self, atoms: List[Atom], bonds=True, core=True, free=True):
         """
         This function will determine the creation of Core FODs, those 
         that are not related to bonding. The scheme is easy in the first
         3 periods of the Periodic Table, but it will become trickier 
         ahead if Hybridization heuristics don't work. Currently it only 
         works for closed shell calculations (V 0.1).
+        The BFODs (bonds=False), the core (core=False) and the FFODs (free=False)
+        are skipped when they are created by the batched engines: BFOD.BondFODs,
+        Shells.CoreShells and FFOD.FreeFODs.
         """
         # TODO: This will assume that we are doing up to the n=3 shell,
         #  with sp3 hybridization
@@ -302,8 +370,6 @@ class FODStructure:
         # TODO: Find an elegant solution to do exceptions for H bonds
         # TODO: Account previous bonds formed, by talling previous FODs,
         #  or looking back at mBonds 
-        # TODO: GlobalData.GetFullElecCount() Can be precalculated ahead
-        #  of time and placed as a member vatrable
 
         #Lazy loading in order to 
         from FODLego.BFOD import SBFOD, DBFOD, TBFOD
@@ -318,9 +384,6 @@ class FODStructure:
            boldMeek = BoldMeek(at1,at2)
            newFOD = SBFOD(*boldMeek)
            _AddBFOD(curr_bond, at1, at2, newFOD)
-           if self.mAtom.mOwner.mOpen == True:
-                newFOD = SBFOD(*boldMeek, False)
-                _AddBFOD(curr_bond, at1, at2, newFOD)
 
         def DoubleBond(at2: Atom, curr_bond: Bond):
             """
@@ -383,7 +446,7 @@ class FODStructure:
                         else:
                             # Cross product between atom and already-placed FODs
                             vector_for_cross = []
-                            for fods in self.mBFODs:
+                            for fods in self.mAtom.GetAlphaBFODs():
                                 vector_for_cross.append(fods.mPos)
                             vector_for_cross -= self.mAtom.mPos
                             return np.cross(*vector_for_cross)
@@ -401,62 +464,68 @@ class FODStructure:
             axis2fod = np.ndarray(3)
             dom,sub= BoldMeek(at1,at2)
 
-            if GlobalData.GetFullElecCount(self.mAtom.mGroup,self.mAtom.mPeriod) <= 18:
+            if self.mAtom.mFullElec <= 18:
                 #Find perpendicular unit vector
-                    dir = sub.mPos - dom.mPos
+                    dir = self.mAtom.mTable.mGeometry.Vector(dom.mI, sub.mI)
                     axis2fod = D_BFOD_Direction()
                     # Create FODs and link
                     f1 = DBFOD(dom,sub,axis2fod)
                     f2 = DBFOD(dom,sub,-axis2fod)
                     _AddBFOD(curr_bond, dom, sub, f1, f2) # Does dom/sub matter, or are at1/at2 fine?
-                    if self.mAtom.mOwner.mOpen == True:
-                        f1 = DBFOD(dom,sub,axis2fod,False)
-                        f2 = DBFOD(dom,sub,-axis2fod, False)
-                        _AddBFOD(curr_bond, dom, sub, f1, f2) # Does dom/sub matter, or are at1/at2 fine?
+
+        def _Beta(fods):
+            """
+            The beta FODs of an open-shell molecule: copies of the rows of the alpha FODs fods.
+            """
+            store = fods[0].mStore
+            rows = store.Copy([fod.mIdx for fod in fods], channel=False)
+            return store.Views(range(rows.start, rows.stop))
 
         def _AddBFOD(curr_bond: Bond, at1: Atom, at2: Atom, *fods):
             """
-            This function adds a new FOD to the individual atoms, to the list in GlobalData, and to the FODStructure
+            This function adds a new FOD to the individual atoms and to the FODStructure. The FOD is already
+            a row of the molecule's FODStore, since it was created there. In open-shell molecules the
+            beta BFODs are added as copies of the alpha ones.
             """ 
-            # TODO: Make Bonds easier to deal with by having one instance instead of one per bond per atom (i.e. there are 2 instances of Bond that are slightly for both atoms in a bond)
-            # The main purpose of this function is not to not duplicate the FOD in GlobalData
+            # The main purpose of this function is not to not duplicate the FOD in the atoms
             # by adding the FODs in each individual atom. This makes this class a type of 
             # FOD manager in addition to constructing the structure.
             # The reason why we don't load FODs directly
             # is because we don't know whether at1 or at2
             # is the self.mAtom
 
-            # Create siblings
-            curr_bond.SetFODs(fods)
-            if len(fods) == 2:
-                fods[0].AddSibling(fods[1])
-                fods[1].AddSibling(fods[0])
-            elif len(fods) == 3:
-                fods[0].AddSibling(fods[1],fods[2])
-                fods[1].AddSibling(fods[0],fods[2])
-                fods[2].AddSibling(fods[0],fods[1])
-            # Add to atoms and globaldata
-            for fod in fods:
-                at1.AddBFOD(fod)  # Maybe remove this, and instead do a getter function
-                at2.AddBFOD(fod)
-                GlobalData.mFODs.append(fod)
-                GlobalData.mBFODs.append(fod)
+            channels = [fods, _Beta(fods)] if self.mAtom.mOwner.mOpen else [fods]
+            for fods in channels:
+                # Create siblings. The bond finds its FODs in the store (BondTable.LinkFODs).
+                if len(fods) == 2:
+                    fods[0].AddSibling(fods[1])
+                    fods[1].AddSibling(fods[0])
+                elif len(fods) == 3:
+                    fods[0].AddSibling(fods[1],fods[2])
+                    fods[1].AddSibling(fods[0],fods[2])
+                    fods[2].AddSibling(fods[0],fods[1])
+                # Add to atoms
+                for fod in fods:
+                    at1.AddBFOD(fod)  # Maybe remove this, and instead do a getter function
+                    at2.AddBFOD(fod)
         
         def _AddFFOD(*ffods):
             """
             TODO: Put this on a bigger scope
+            In open-shell molecules the beta FFODs are added as copies of the alpha ones.
             """
-            # Create siblings. Manually seemed the fastest way to implement.
-            if len(ffods) == 2:
-               ffods[0].AddSibling(ffods[1])
-               ffods[1].AddSibling(ffods[0])
-            elif len(ffods) == 3:
-               ffods[0].AddSibling(ffods[1],ffods[2])
-               ffods[1].AddSibling(ffods[0],ffods[2])
-               ffods[2].AddSibling(ffods[0],ffods[1])
-            for ffod in ffods:
-                self.mFFODs.append(ffod)
-                GlobalData.mFODs.append(ffod)          
+            channels = [ffods, _Beta(ffods)] if self.mAtom.mOwner.mOpen else [ffods]
+            for ffods in channels:
+                # Create siblings. Manually seemed the fastest way to implement.
+                if len(ffods) == 2:
+                   ffods[0].AddSibling(ffods[1])
+                   ffods[1].AddSibling(ffods[0])
+                elif len(ffods) == 3:
+                   ffods[0].AddSibling(ffods[1],ffods[2])
+                   ffods[1].AddSibling(ffods[0],ffods[2])
+                   ffods[2].AddSibling(ffods[0],ffods[1])
+                for ffod in ffods:
+                    self.mFFODs.append(ffod)
 
         def AddFreeElectron(free: int):
             """
@@ -469,16 +538,17 @@ class FODStructure:
                 Return the direction of the double bond FODs
                 """
                 heightdir = np.array([0.0,0.0,0.0])
+                bfods = self.mAtom.GetAlphaBFODs()
                 if len(self.mAtom.mBonds) == 2:
-                    heightdir = np.cross(*[fod.mPos - at1.mPos for fod in self.mBFODs],axis=0)
+                    heightdir = np.cross(*[fod.mPos - at1.mPos for fod in bfods],axis=0)
                 elif len(self.mAtom.mBonds) == 1:
-                    heightdir = np.cross(*[fod.mPos - at1.mPos for fod in self.mBFODs],axis=0)
+                    heightdir = np.cross(*[fod.mPos - at1.mPos for fod in bfods],axis=0)
                 elif len(self.mAtom.mBonds) == 3:
                     heightdir = np.cross(*[bond.mAtoms_p[1] - bond.mAtoms_p[0] for bond in self.mAtom.mBonds], axis=0)
 
                 # Add a check in case the cross product gives 0
                 if (heightdir == np.array([0.0,0.0,0.0])).all():
-                    heightdir = RandomPerpDir(self.mBFODs[0].mPos)
+                    heightdir = RandomPerpDir(bfods[0].mPos)
                 return normalize(heightdir)
 
             if len(self.mAtom.mBonds) == 1:
@@ -492,10 +562,6 @@ class FODStructure:
                 a = DFFOD(at1,heightdir)
                 b = DFFOD(at1,-heightdir)
                 _AddFFOD(a,b)
-                if self.mAtom.mOwner.mOpen == True:
-                    a = DFFOD(at1,heightdir, False)
-                    b = DFFOD(at1,-heightdir, False)
-                    _AddFFOD(a,b)
 
             elif free == 3:
                 from FODLego.FFOD import TFFOD
@@ -506,19 +572,12 @@ class FODStructure:
                 f3 = TFFOD(at1, norms[2])
                 _AddFFOD(f1,f2,f3)
 
-                #Add alternative FOD channel if open shelled
-                if self.mAtom.mOwner.mOpen == True:
-                    f1 = TFFOD(at1, norms[0], False)
-                    f2 = TFFOD(at1, norms[1], False)
-                    f3 = TFFOD(at1, norms[2], False)
-                    _AddFFOD(f1,f2,f3)
-
         def TripleBond(at2: Atom, curr_bond: Bond):
             """
             #TODO: Create a helper funtion for conditional statements
             """
             # Place BFODs, for new implementation
-            bonddir = tofrom(at2.mPos,at1.mPos)
+            bonddir = at1.mTable.mGeometry.Vector(at1.mI, at2.mI)
             boldmeek = BoldMeek(at1,at2)
             dir0 = RandomPerpDir(bonddir)
             norms = RotateNormals(3, dir0, normalize(bonddir)) 
@@ -527,11 +586,6 @@ class FODStructure:
             f2 = TBFOD(*boldmeek, norms[1])
             f3 = TBFOD(*boldmeek, norms[2])
             _AddBFOD(curr_bond, at1, at2, f1, f2, f3)
-            if self.mAtom.mOwner.mOpen == True:
-                f1 = TBFOD(*boldmeek, norms[0], False)
-                f2 = TBFOD(*boldmeek, norms[1], False)
-                f3 = TBFOD(*boldmeek, norms[2], False)
-                _AddBFOD(curr_bond, at1, at2, f1, f2, f3)
 
  
 
@@ -539,15 +593,19 @@ class FODStructure:
             """
             Finish determining BFODs. This is done after initializing all initial BFODs.
             """
-            for bond in self.mAtom.mBonds:
+            table = self.mAtom.mTable.mBondTable
+            start, stop = table.mNbrStart[self.mAtom.mI], table.mNbrStart[self.mAtom.mI+1]
+            # Only the bonds to higher atoms are created here
+            for k in np.flatnonzero(table.mNbrAtom[start:stop] > self.mAtom.mI):
+                bond = self.mAtom.mBonds[k]
                 bonded_at = bond.mAtoms[1]
-                if bonded_at.mI  > self.mAtom.mI:
-                    if bond.mOrder == 1:
-                        SingleBond(bonded_at, bond)
-                    elif bond.mOrder == 2:
-                        DoubleBond(bonded_at, bond)
-                    elif bond.mOrder == 3:
-                        TripleBond(bonded_at, bond)
+                order = table.mOrder[table.mNbrBond[start + k]]
+                if order == 1:
+                    SingleBond(bonded_at, bond)
+                elif order == 2:
+                    DoubleBond(bonded_at, bond)
+                elif order == 3:
+                    TripleBond(bonded_at, bond)
 
         def AddFFODs():
             #Lazy import for LSP
@@ -558,8 +616,6 @@ class FODStructure:
             elif self.mAtom.mFreePairs == 1:
                 if self.mAtom.mSteric >= 2:
                     _AddFFOD(SFFOD(self.mAtom))
-                    if self.mAtom.mOwner.mOpen == True:
-                        _AddFFOD(SFFOD(self.mAtom, False))
             elif self.mAtom.mFreePairs == 3:
                 AddFreeElectron(3)
 
@@ -570,22 +626,21 @@ class FODStructure:
             if core_elec != 0:
                 for shell in GlobalData.mGeo_Ladder[core_elec]:
                     if shell == 'pt':
-                        self._AddCoreShell(Shells.Point(self.mAtom))
-                        if self.mAtom.mOwner.mOpen == True:
-                            self._AddCoreShell(Shells.Point(self.mAtom, False))
+                        self._AddCoreShell(Shells.Point(self.mAtom), beta=self.mAtom.mOwner.mOpen)
                     elif shell == 'tetra':
-                        self._AddCoreShell(Shells.Tetra(self.mAtom, 10))
-                        if self.mAtom.mOwner.mOpen == True:
-                            self._AddCoreShell(Shells.Tetra(self.mAtom, 10, False))
+                        self._AddCoreShell(Shells.Tetra(self.mAtom, 10), beta=self.mAtom.mOwner.mOpen)
                     elif shell == 'a_triaug':
                         pass # For future development: Beyond scope
 
 
         # Prepare the valence shell first, since it will help determine the
         # orientation of the inner shells
-        AddBFODs()
-        AddCoreElectrons()
-        AddFFODs()
+        if bonds:
+            AddBFODs()
+        if core:
+            AddCoreElectrons()
+        if free:
+            AddFFODs()
 
         # Define Valence
         self.mValence = self.mBFODs + self.mFFODs
@@ -599,22 +654,8 @@ def BoldMeekDir(at1: Atom, at2: Atom, all=True):
     at2: An atom bonding to at2
     all: Boolean to return dominant and weak atom. Default only return dominant atom.
     """
-    if at1.mPeriod < at2.mPeriod:
-        fugal = at2.mPos - at1.mPos
-        dom = at1
-        sub = at2
-    elif at1.mPeriod > at2.mPeriod:
-        fugal = at1.mPos - at2.mPos
-        dom = at2
-        sub = at1
-    elif at1.mZ > at2.mZ:
-            fugal = at2.mPos - at1.mPos
-            dom = at1
-            sub = at2
-    elif at1.mZ <= at2.mZ:
-            fugal = at1.mPos - at2.mPos
-            dom = at2
-            sub = at1
+    dom, sub = BoldMeek(at1, at2)
+    fugal = at1.mTable.mGeometry.Vector(dom.mI, sub.mI)
     # Either return dom and sub, or just the dominant atom. 
     if all:
         return dom, sub, fugal
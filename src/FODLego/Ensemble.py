@@ -0,0 +1,167 @@
+#Description: Conformer ensembles from SMILES ('fodlego ensemble'). The conformers are embedded
+#  and optimized together (EmbedMultipleConfs, MMFFOptimizeMoleculeConfs) over numThreads threads,
+#  optionally reduced to the lowest-energy or the most diverse ones, and all of them share the bonds
+#  of the SMILES string. The bonds and the FOD layout are set up once, on the first conformer; every
+#  other conformer only moves the atoms (Molecule.UpdatePositions), so the FODs of all conformers
+#  are listed in the same order and are stacked into one array.
+import os
+import logging
+import argparse
+import numpy as np
+from rdkit import Chem
+logger = logging.getLogger(__name__)
+
+def EmbedConformers(smiles: str, nconfs: int = 10, seed: int = -1, threads: int = 0):
+    """
+    Embed nconfs conformers of the SMILES string (with hydrogens) and optimize them with MMFF
+    (UFF when MMFF has no parameters for the molecule). threads is the numThreads of RDKit
+    (0 uses all cores). Returns the molecule with its conformers and their energies (kcal/mol),
+    in the order of the conformer ids.
+    """
+    from rdkit.Chem import AllChem
+    rdmol = Chem.MolFromSmiles(smiles)
+    if rdmol is None:
+        raise ValueError(f"{smiles} is not a valid SMILES string")
+    rdmol = Chem.AddHs(rdmol)
+    params = AllChem.ETKDGv3()
+    params.randomSeed = seed
+    params.numThreads = threads
+    ids = AllChem.EmbedMultipleConfs(rdmol, numConfs=nconfs, params=params)
+    if len(ids) == 0:
+        raise ValueError(f"No conformer of {smiles} could be embedded")
+    if AllChem.MMFFHasAllMoleculeParams(rdmol):
+        result = AllChem.MMFFOptimizeMoleculeConfs(rdmol, numThreads=threads, maxIters=2000)
+    else:
+        logger.warning(f"MMFF has no parameters for {smiles}, the conformers are optimized with UFF")
+        result = AllChem.UFFOptimizeMoleculeConfs(rdmol, numThreads=threads, maxIters=2000)
+    energies = np.array([energy for _, energy in result], dtype=np.float64)
+    return rdmol, energies
+
+def SelectConformers(rdmol: Chem.Mol, energies: np.ndarray, keep: int, select: str = 'energy') -> np.ndarray:
+    """
+    Return the indices (into the conformers of rdmol) of keep conformers. 'energy' keeps the
+    lowest-energy ones. 'diverse' starts from the lowest-energy conformer and adds, one at a time,
+    the conformer farthest (heavy-atom RMSD after alignment) from those already kept.
+    """
+    order = np.argsort(energies, kind='stable')
+    if keep is None or keep >= len(order):
+        return order
+    if select == 'energy':
+        return order[:keep]
+    elif select != 'diverse':
+        raise ValueError(f"Unknown conformer selection '{select}'")
+    from rdkit.Chem import AllChem
+    heavy = Chem.RemoveHs(rdmol)
+    n = heavy.GetNumConformers()
+    # Lower triangle, row by row: rms(i,j) for j < i
+    tri = AllChem.GetConformerRMSMatrix(heavy, prealigned=False)
+    rms = np.zeros((n, n))
+    rms[np.tril_indices(n, -1)] = tri
+    rms += rms.T
+    kept = [order[0]]
+    nearest = rms[order[0]].copy()
+    for _ in range(keep - 1):
+        nearest[kept] = -1.0
+        far = int(np.argmax(nearest))
+        kept.append(far)
+        nearest = np.minimum(nearest, rms[far])
+    return np.array(kept)
+
+class Ensemble:
+    """
+    FODs of the conformers of one molecule. mAtomPos (K,M,3) and mPos (K,N,3) hold the positions
+    (Angstrom) of the atoms and FODs of the K conformers, sorted by mEnergies (kcal/mol); mChannel
+    (N,) and mType (N,) are shared by all conformers, as in Prediction. mMolecule is left at the
+    last conformer; Conformer(k) moves it to conformer k.
+    """
+    def __init__(self, smiles: str, nconfs: int = 10, keep: int = None, select: str = 'energy', seed: int = -1, threads: int = 0, tol: float = 1e-3, **kwargs):
+        from FODLego.Molecule import Molecule
+        rdmol, energies = EmbedConformers(smiles, nconfs, seed, threads)
+        confs = list(rdmol.GetConformers())
+        chosen = SelectConformers(rdmol, energies, keep, select)
+        chosen = chosen[np.argsort(energies[chosen], kind='stable')]
+
+        # One molecule with the bonds of the SMILES string, set up on the first conformer
+        first = Chem.Mol(rdmol, confId=confs[chosen[0]].GetId())
+        first.SetProp('_FileComments', smiles)
+        self.mMolecule = Molecule(first, **kwargs)
+        self.mSmiles = smiles
+        store = self.mMolecule.mContext.mStore
+        self.mChannel = store['channel'].copy()
+        self.mType = store['type'].copy()
+        owners = store['atom'].copy()
+
+        atompos, fodpos, kept = [], [], []
+        for k in chosen.tolist():
+            pos = confs[k].GetPositions()
+            if len(kept) > 0:
+                self.mMolecule.UpdatePositions(pos, tol)
+                store = self.mMolecule.mContext.mStore
+                if len(store) != len(owners) or not np.array_equal(store['atom'], owners) or not np.array_equal(store['type'], self.mType):
+                    logger.warning(f"Conformer {k} of {smiles} has another FOD layout and is left out")
+                    continue
+            atompos.append(self.mMolecule.mAtoms.mPos.copy())
+            fodpos.append(store['pos'].copy())
+            kept.append(k)
+        self.mConfIds = np.array(kept)
+        self.mEnergies = energies[self.mConfIds]
+        self.mAtomPos = np.array(atompos)
+        self.mPos = np.array(fodpos)
+
+    def __len__(self) -> int:
+        return len(self.mConfIds)
+
+    def Conformer(self, k: int):
+        """
+        Move the molecule to the k-th conformer of the ensemble and return its Prediction, e.g. to
+        write its CLUSTER and FRMORB files.
+        """
+        from FODLego.Prediction import Prediction
+        self.mMolecule.UpdatePositions(self.mAtomPos[k])
+        return Prediction(self.mMolecule)
+
+    def WriteXYZ(self, filename: str = "ensemble.xyz") -> None:
+        """
+        Write all conformers into one multi-frame XYZ file (alpha FODs as 'X', beta FODs as 'He').
+        """
+        import FODLego.Writers as Writers
+        names, _, _ = self.mMolecule._AtomArrays()
+        up = self.mChannel
+        with Writers.Output(filename) as write:
+            for k in range(len(self)):
+                comment = f"{self.mSmiles} conformer {self.mConfIds[k]} energy {self.mEnergies[k]:.4f}\n"
+                Writers.WriteXYZFrame(write, comment, (names, self.mAtomPos[k]), ('X', self.mPos[k][up]), ('He', self.mPos[k][~up]))
+
+def EnsembleMain(argv: list) -> int:
+    """
+    Command line interface of 'fodlego ensemble'.
+    """
+    parser = argparse.ArgumentParser(prog="fodlego ensemble",
+        description="Predict the FODs of an ensemble of conformers of a SMILES string.")
+    parser.add_argument("smiles", help="SMILES string of the molecule")
+    parser.add_argument("-n", "--nconfs", type=int, default=10, help="Number of conformers to embed (default: 10)")
+    parser.add_argument("-k", "--keep", type=int, default=None, help="Number of conformers to keep (default: all)")
+    parser.add_argument("--select", default="energy", choices=("energy", "diverse"), help="Keep the lowest-energy or the most diverse conformers")
+    parser.add_argument("-j", "--threads", type=int, default=0, help="Threads for embedding and optimization (default: all cores)")
+    parser.add_argument("--seed", type=int, default=-1, help="Random seed of the embedding (default: random)")
+    parser.add_argument("-o", "--output", default="ensemble.xyz", help="Multi-frame XYZ file with the atoms and FODs of all conformers")
+    parser.add_argument("--outdir", default=None, help="Also write the CLUSTER, FRMORB and lego.xyz of every conformer into conf_<k> subdirectories")
+    parser.add_argument("--open", action="store_true", help="Create open-shell (alpha/beta) FODs")
+    args = parser.parse_args(argv)
+
+    try:
+        ens = Ensemble(args.smiles, args.nconfs, args.keep, args.select, args.seed, args.threads, openshell=args.open)
+    except ValueError as e:
+        logger.warning(e)
+        return 1
+    ens.WriteXYZ(args.output)
+    if args.outdir is not None:
+        for k in range(len(ens)):
+            dest = os.path.join(args.outdir, f"conf_{k}")
+            os.makedirs(dest, exist_ok=True)
+            res = ens.Conformer(k)
+            res.WriteCLUSTER(os.path.join(dest, "CLUSTER"))
+            res.WriteFRMORB(os.path.join(dest, "FRMORB"))
+            res.WriteXYZ(os.path.join(dest, "lego.xyz"))
+    logger.info(f"Predicted {len(ens)} conformers of {args.smiles} into {args.output}")
+    return 0 if len(ens) > 0 else 1
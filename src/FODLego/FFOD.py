@@ -1,11 +1,21 @@
 from FODLego.Funcs import *
 from FODLego.FOD import *
+from FODLego.FOD import _Column, _AtomRef
 from FODLego.ElementaryClasses import *
 from copy import copy
 
 class FFOD(FOD):
+    __slots__ = ()
+    mCode = 6
+    mAtom = _AtomRef('atom')
+    mAngle = _Column('angle')
+    mR = _Column('R')
+    # Vectors
+    mHeight = _Column('height')
+    mFreeDir = _Column('freedir')
+
     def __init__(self, atom: Atom, HeightDir = np.zeros(3), ch=True, target=None):
-        super().__init__(copy(atom.mPos), ch)
+        super().__init__(copy(atom.mPos), ch, AtomStore(atom, isinstance(target, np.ndarray)))
         self.mAtom = atom
         self.mAngle = 0.0
         self.mR = 0.0
@@ -27,6 +37,9 @@ class FFOD(FOD):
         # self.mHeight = 0.0
 
 class SFFOD(FFOD):
+    __slots__ = ()
+    mCode = 7
+
     def __init__(self, atom: Atom, pol=True):
             super().__init__(atom, ch=pol)
             self.DetermineParameters()
@@ -70,6 +83,9 @@ class SFFOD(FFOD):
         self.mFreeDir = normalize(atom2ffod)
 
 class DFFOD(FFOD):
+    __slots__ = ()
+    mCode = 8
+
     def __init__(self, atom: Atom, heightdir: np.ndarray, ch=True):
         super().__init__(atom, heightdir, ch)
         self.DetermineParameters()
@@ -119,6 +135,9 @@ class DFFOD(FFOD):
         self.mFreeDir = normalize(atom2ffod)
 
 class TFFOD(FFOD):
+    __slots__ = ()
+    mCode = 9
+
     def __init__(self, atom: Atom, heightdir: np.ndarray, ch=True):
         super().__init__(atom, heightdir,ch)
         self.DetermineParameters()
@@ -164,3 +183,209 @@ class TFFOD(FFOD):
                 return bfod.mMeekR
             else:
                 return bfod.mBoldR
+
+################# BATCHED ENGINE #################
+
+def FreeFODs(mol, indices=None) -> bool:
+    """
+    Batched version of AddFFODs in FODStructure.PrepareShells. The free direction of every atom
+    (Atom.AverageBFODDir, including the planar fallback) is computed once in a single pass over
+    the BFODs of the molecule. The SFFODs, DFFODs and TFFODs are then placed per class of
+    (free pairs, bonds, period) with array operations, and written into the FOD store of the
+    molecule atom by atom, in the order of the per-atom heuristics.
+    All the BFODs and the core FODs must exist already.
+
+    mol: The Molecule
+    indices: The atoms whose FFODs are created. All atoms by default.
+
+    Returns False, without creating any FFOD, when an atom falls outside of the cases handled
+    here. The caller then uses the per-atom heuristics, which report the problem.
+    """
+    from FODLego.BFOD import BFOD
+    table = mol.mAtoms
+    store = mol.mContext.mStore
+    idx = np.arange(len(table)) if indices is None else np.asarray(indices, dtype=np.int64)
+    if len(idx) == 0:
+        return True
+
+    # Which free FODs each atom receives
+    freepairs = table.mFreePairs[idx]
+    steric = table.mSteric[idx]
+    nfod = np.zeros(len(idx), dtype=np.int64)
+    nfod[(freepairs == 1) & (steric >= 2)] = 1
+    nfod[(freepairs == 2) & (steric >= 3)] = 2
+    nfod[freepairs == 3] = 3
+    atoms = idx[nfod > 0]
+    nfod = nfod[nfod > 0]
+    if len(atoms) == 0:
+        return True
+    nbonds = np.bincount(mol.mBondIdx.reshape(-1), minlength=len(table))[atoms]
+    period = table.mPeriod[atoms]
+    center = table.mPos[atoms]
+
+    # Alpha BFODs of every atom, in creation order (Atom.mFODStruct.mBFODs). The FFODs are placed
+    # from the alpha channel and repeated for beta, as the BFODs are.
+    rows = store.Select(BFOD)
+    rows = rows[store['channel'][rows]]
+    bold, meek = store['bold'][rows], store['meek'][rows]
+    inc_atom = np.concatenate((bold, meek))
+    inc_row = np.concatenate((rows, rows))
+    inc_sign = np.concatenate((np.full(len(rows), -1.0), np.full(len(rows), 1.0)))
+    order = np.lexsort((inc_row, inc_atom))
+    inc_atom, inc_row, inc_sign = inc_atom[order], inc_row[order], inc_sign[order]
+    count = np.bincount(inc_atom, minlength=len(table))
+    first = np.cumsum(count) - count
+    nbfod = count[atoms]
+    if (nbfod == 0).any():
+        return False
+
+    # Free direction of every atom (AverageBFODDir)
+    local = np.full(len(table), -1)
+    local[atoms] = np.arange(len(atoms))
+    mine = local[inc_atom] >= 0
+    bonddir = table.mPos[store['meek'][inc_row[mine]]] - table.mPos[store['bold'][inc_row[mine]]]
+    freedir = np.zeros((len(atoms), 3))
+    np.add.at(freedir, local[inc_atom[mine]], inc_sign[mine][:,None]*bonddir)
+    freedir /= nbfod[:,None]
+    planar = np.linalg.norm(freedir, axis=1) < .2
+    if planar.any():
+        if (nbfod[planar] < 3).any():
+            return False
+        vecs = store['pos'][inc_row[first[atoms[planar]][:,None] + np.arange(3)]] - center[planar][:,None,:]
+        cross = np.cross(vecs[:,0] - vecs[:,1], vecs[:,1] - vecs[:,2])
+        dists = np.zeros(len(atoms))
+        np.add.at(dists, local[inc_atom[mine]], np.linalg.norm(store['pos'][inc_row[mine]] - table.mPos[inc_atom[mine]], axis=1))
+        d = (dists/nbfod)[planar]
+        freedir[planar] = cross/np.linalg.norm(cross, axis=1)[:,None]*d[:,None]
+
+    # First BFOD of every atom and its distance to the atom (GetBFODs()[0])
+    bfod0 = inc_row[first[atoms]]
+    F = np.where(store['meek'][bfod0] == atoms, store['meekR'][bfod0], store['boldR'][bfod0])
+    unit = freedir/np.linalg.norm(freedir, axis=1)[:,None]
+
+    # Parameters of each FOD of an atom (before the channels are repeated)
+    nat = len(atoms)
+    offs = np.zeros((nat, 3, 3))
+    height = np.zeros((nat, 3, 3))
+    fdir = np.repeat(freedir[:,None,:], 3, axis=1)
+    angle = np.zeros((nat, 3))
+    radius = np.zeros((nat, 3))
+    code = np.zeros(nat, dtype=np.int8)
+
+    try:
+        ### SFFOD ###
+        single = nfod == 1
+        if (single & ((nbonds < 1) | (nbonds > 3))).any():
+            return False
+        code[single] = SFFOD.mCode
+        c = single & (nbonds == 3)
+        offs[c,0] = freedir[c]
+        c = single & (nbonds == 2)
+        offs[c,0] = unit[c]*GlobalData.GetRadii(table.mZ[atoms[c]])[:,None]
+        c = single & (nbonds == 1) & (period < 3)
+        offs[c,0] = unit[c]*GlobalData.GetEdges(table.mZ[atoms[c]])[:,None]/sqrt(8)
+        c = single & (nbonds == 1) & (period >= 3)
+        offs[c,0] = freedir[c]
+
+        ### DFFOD ###
+        double = nfod == 2
+        if (double & (((nbonds != 1) & (nbonds != 2)) | (nbfod != 2) | (period > 3))).any():
+            return False
+        code[double] = DFFOD.mCode
+        if double.any():
+            at = atoms[double]
+            v0 = store['pos'][bfod0[double]] - center[double]
+            v1 = store['pos'][inc_row[first[at] + 1]] - center[double]
+            # Height direction (ChoosePerpDir)
+            hd = np.cross(v0, v1)
+            zero = (hd == 0.0).all(axis=1)
+            hd[zero] = RandomPerpDirs(store['pos'][bfod0[double][zero]])
+            hd = hd/np.linalg.norm(hd, axis=1)[:,None]
+            # Opening angle, 220 rule (DetermineR)
+            two = nbonds[double] == 2
+            pa, pb = v0.copy(), v1.copy()
+            if two.any():
+                vec = mol.mGeometry.mNbrVec[mol.mBonds.mNbrStart[at[two]][:,None] + np.arange(2)]
+                pa[two], pb[two] = vec[:,0], vec[:,1]
+            theta = (np.deg2rad(220) - AnglesBetween(pa, pb))/2
+            phi = AnglesBetween(freedir[double], v0)
+            E = GlobalData.GetEdges(table.mZ[at])
+            Fd = F[double]
+            val = E**2 - Fd**2 + 2*Fd*E*np.cos(phi)*np.cos(theta)
+            E = np.where(val < 0, E*1.2, E)
+            Rd = np.sqrt(E**2 - Fd**2 + 2*Fd*E*np.cos(phi)*np.cos(theta))
+            # The shift along the height is added after the one along the free direction
+            dshift = np.empty((len(at), 2, 3))
+            for m, h in ((0, hd), (1, -hd)):
+                height[double, m] = h
+                angle[double, m] = theta
+                radius[double, m] = Rd
+                offs[double, m] = unit[double]*Rd[:,None]*np.cos(theta)[:,None]
+                dshift[:, m] = h*Rd[:,None]*np.sin(theta)[:,None]
+
+        ### TFFOD ###
+        triple = nfod == 3
+        if (triple & (nbonds != 1)).any():
+            return False
+        code[triple] = TFFOD.mCode
+        if triple.any():
+            at = atoms[triple]
+            free_dir = -mol.mGeometry.mNbrVec[mol.mBonds.mNbrStart[at]]
+            axis = free_dir/np.linalg.norm(free_dir, axis=1)[:,None]
+            norms = RotateNormalsBatch(3, RandomPerpDirs(free_dir), axis)
+            l = F[triple]
+            tight = period[triple] < 3
+            h = np.empty(len(at))
+            fd = np.empty((len(at), 3))
+            h[tight] = l[tight]/sqrt(3)
+            fd[tight] = unit[triple][tight]*h[tight][:,None]/np.tan(np.deg2rad(70.52))
+            if (~tight).any():
+                # Distance of the last core FOD of the atom (GetLastAtomRadius)
+                core = store.Select(CFOD)
+                last = np.full(len(table), -1)
+                np.maximum.at(last, store['atom'][core], core)
+                lastcore = last[at[~tight]]
+                if (lastcore < 0).any():
+                    return False
+                proj = np.linalg.norm(store['pos'][lastcore] - center[triple][~tight], axis=1)
+                fd[~tight] = unit[triple][~tight]*proj[:,None]
+                with np.errstate(invalid='ignore'):
+                    h[~tight] = np.sqrt(l[~tight]**2 - proj**2)
+            height[triple] = norms
+            fdir[triple] = fd[:,None,:]
+            offs[triple] = norms*h[:,None,None]
+    except KeyError:
+        return False
+
+    ### Positions, in creation order: atom by atom, channel by channel ###
+    nch = 2 if mol.mOpen else 1
+    pos = center[:,None,:] + offs
+    if double.any():
+        pos[double,:2] += dshift
+    if triple.any():
+        pos[triple] += fdir[triple]
+        tri = pos[triple] - center[triple][:,None,:]
+        angle[triple] = AnglesBetween(fdir[triple].reshape(-1,3), tri.reshape(-1,3)).reshape(-1,3)
+
+    counts = nfod*nch
+    member = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    owner = np.repeat(np.arange(nat), counts)
+    channel = member < nfod[owner]
+    member = member % nfod[owner]
+    rows = store.Extend(FFOD, pos[owner, member], type=code[owner], channel=channel, atom=atoms[owner],
+                        height=height[owner, member], freedir=fdir[owner, member], angle=angle[owner, member],
+                        R=radius[owner, member])
+
+    ### Link the FFODs to the atoms ###
+    fods = store.Views(range(rows.start, rows.stop))
+    k = 0
+    for i, n in zip(atoms, nfod):
+        struct = table[int(i)].mFODStruct
+        for ch in range(nch):
+            group = fods[k:k+n]
+            k += n
+            if n > 1:
+                for fod in group:
+                    fod.AddSibling(*[f for f in group if f is not fod])
+            struct.mFFODs += group
+    return True
@@ -2,11 +2,242 @@ import numpy as np
 from typing import List
 from numpy.linalg import norm
 
+################# FOD STORE #################
+
+class FODStore:
+    """
+    Struct-of-arrays storage of the FODs of a molecule. Every FOD is a row: its position is a row
+    of an (N,3) float64 array and its parameters (type code, channel, atom indices, radii, angles,
+    portion) are entries of typed columns. The FOD classes are lightweight views into one row, so
+    whole-molecule operations become single NumPy calls on the columns, e.g. store['pos'].
+    """
+    # Column name: (dtype, width). Atom columns hold indices into mAtoms (-1 for no atom).
+    mLayout = {
+        'pos': (np.float64, 3),
+        'height': (np.float64, 3),
+        'freedir': (np.float64, 3),
+        'type': (np.int8, 1),
+        'channel': (np.bool_, 1),
+        'atom': (np.int32, 1),
+        'bold': (np.int32, 1),
+        'meek': (np.int32, 1),
+        'R': (np.float64, 1),
+        'boldR': (np.float64, 1),
+        'meekR': (np.float64, 1),
+        'boldangle': (np.float64, 1),
+        'meekangle': (np.float64, 1),
+        'angle': (np.float64, 1),
+        'portion': (np.float64, 1),
+    }
+
+    def __init__(self, atoms=None, capacity: int = 16):
+        self.mAtoms = atoms if atoms is not None else []
+        self.mCount = 0
+        self.mCols = {}
+        self.mViews = []
+        self._Allocate(capacity)
+
+    def _Allocate(self, capacity: int) -> None:
+        """
+        Grow the columns to hold capacity FODs, keeping the current rows.
+        """
+        for name, (dtype, width) in self.mLayout.items():
+            shape = (capacity, width) if width > 1 else (capacity,)
+            col = np.zeros(shape, dtype=dtype)
+            if name in ('atom', 'bold', 'meek'):
+                col[:] = -1
+            if name in self.mCols:
+                col[:self.mCount] = self.mCols[name][:self.mCount]
+            self.mCols[name] = col
+        self.mCapacity = capacity
+
+    def Reserve(self, n: int) -> None:
+        """
+        Make room for n more FODs.
+        """
+        needed = self.mCount + n
+        if needed > self.mCapacity:
+            self._Allocate(max(needed, 2*self.mCapacity))
+
+    def Append(self, fod) -> int:
+        """
+        Add a row for the FOD view fod and return its index.
+        """
+        self.Reserve(1)
+        idx = self.mCount
+        self.mCols['type'][idx] = fod.mCode
+        self.mViews.append(fod)
+        self.mCount += 1
+        return idx
+
+    def Extend(self, cls, pos: np.ndarray, **columns) -> slice:
+        """
+        Add len(pos) rows of FODs of class cls at once. The remaining columns are given as
+        keyword arguments (scalars are broadcast). No view objects are created; they are
+        built lazily by View().
+        Returns the slice of the new rows.
+        """
+        n = len(pos)
+        self.Reserve(n)
+        rows = slice(self.mCount, self.mCount + n)
+        self.mCols['pos'][rows] = pos
+        self.mCols['type'][rows] = cls.mCode
+        for name, values in columns.items():
+            self.mCols[name][rows] = values
+        self.mViews.extend([None]*n)
+        self.mCount += n
+        return rows
+
+    def Copy(self, rows, **columns) -> slice:
+        """
+        Add copies of the given rows (e.g. the beta channel of alpha FODs), with the columns given
+        as keyword arguments replaced. No view objects are created, as in Extend().
+        Returns the slice of the new rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n = len(rows)
+        self.Reserve(n)
+        new = slice(self.mCount, self.mCount + n)
+        for name, col in self.mCols.items():
+            col[new] = col[rows]
+        for name, values in columns.items():
+            self.mCols[name][new] = values
+        self.mViews.extend([None]*n)
+        self.mCount += n
+        return new
+
+    def View(self, idx: int):
+        """
+        Return the FOD view of row idx, creating it if needed. A row always has the same view.
+        """
+        fod = self.mViews[idx]
+        if fod is None:
+            cls = FOD.mRegistry[int(self.mCols['type'][idx])]
+            fod = cls.__new__(cls)
+            fod.mStore = self
+            fod.mIdx = idx
+            fod.mSiblings = ()
+            fod.mAssocFOD = None
+            self.mViews[idx] = fod
+        return fod
+
+    def Views(self, indices=None) -> list:
+        """
+        Return the views of the given rows (all rows by default), in row order.
+        """
+        if indices is None:
+            indices = range(self.mCount)
+        return [self.View(int(i)) for i in indices]
+
+    def Permute(self, order: np.ndarray) -> None:
+        """
+        Reorder the rows so that new row i is the old row order[i]. Existing views follow
+        their rows.
+        """
+        order = np.asarray(order)
+        assert len(order) == self.mCount, "The permutation must cover every row"
+        for name, col in self.mCols.items():
+            col[:self.mCount] = col[order]
+        self.mViews = [self.mViews[i] for i in order]
+        for idx, fod in enumerate(self.mViews):
+            if fod is not None:
+                fod.mIdx = idx
+
+    def Remove(self, rows: np.ndarray) -> None:
+        """
+        Remove the given rows. The remaining rows keep their order and their views follow them;
+        the views of the removed rows are detached (mIdx = -1).
+        """
+        keep = np.ones(self.mCount, dtype=bool)
+        keep[np.asarray(rows, dtype=np.int64)] = False
+        order = np.flatnonzero(keep)
+        for idx in np.flatnonzero(~keep):
+            if self.mViews[idx] is not None:
+                self.mViews[idx].mIdx = -1
+        for name, col in self.mCols.items():
+            col[:len(order)] = col[order]
+            col[len(order):self.mCount] = -1 if name in ('atom', 'bold', 'meek') else 0
+        self.mViews = [self.mViews[i] for i in order]
+        for idx, fod in enumerate(self.mViews):
+            if fod is not None:
+                fod.mIdx = idx
+        self.mCount = len(order)
+
+    def Select(self, *classes) -> np.ndarray:
+        """
+        Return the indices of the rows whose FOD is an instance of any of the classes.
+        """
+        codes = [code for code, cls in FOD.mRegistry.items() if issubclass(cls, classes)]
+        return np.flatnonzero(np.isin(self['type'], codes))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        Return the filled part of a column as a view, e.g. store['pos'] is (N,3).
+        """
+        return self.mCols[name][:self.mCount]
+
+    def __len__(self) -> int:
+        return self.mCount
+
+class _Column:
+    """
+    Attribute of a FOD view that is stored in a column of its FODStore.
+    """
+    def __init__(self, col: str):
+        self.mCol = col
+
+    def __get__(self, fod, owner=None):
+        if fod is None:
+            return self
+        return fod.mStore.mCols[self.mCol][fod.mIdx]
+
+    def __set__(self, fod, value):
+        fod.mStore.mCols[self.mCol][fod.mIdx] = value
+
+class _Flag(_Column):
+    """
+    Boolean column. Returns Python booleans so that identity checks (e.g. 'is True') hold.
+    """
+    def __get__(self, fod, owner=None):
+        if fod is None:
+            return self
+        return bool(fod.mStore.mCols[self.mCol][fod.mIdx])
+
+class _AtomRef(_Column):
+    """
+    Reference to an Atom. The column holds the index of the atom in the molecule.
+    """
+    def __get__(self, fod, owner=None):
+        if fod is None:
+            return self
+        i = fod.mStore.mCols[self.mCol][fod.mIdx]
+        return fod.mStore.mAtoms[i] if i >= 0 else None
+
+    def __set__(self, fod, atom):
+        fod.mStore.mCols[self.mCol][fod.mIdx] = -1 if atom is None else atom.mI
+
+################# FOD VIEWS #################
+
 class FOD:
-    def __init__(self, pos: np.ndarray = np.zeros(3), ch=True) -> None:
+    __slots__ = ('mStore', 'mIdx', 'mSiblings', 'mAssocFOD')
+    mCode = 0
+    mRegistry = {}
+
+    mPos = _Column('pos')
+    mChannel = _Flag('channel')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        FOD.mRegistry[cls.mCode] = cls
+
+    def __init__(self, pos: np.ndarray = np.zeros(3), ch=True, store: FODStore = None) -> None:
+        if store is None:
+            store = FODStore(capacity=1)
+        self.mStore = store
+        self.mIdx = store.Append(self)
         self.mPos = pos
         self.mSiblings = ()
-        self.mAssocFOD: FOD = []
+        self.mAssocFOD: FOD = None
         self.mChannel = ch
 
     def AddSibling(self, *siblings):
@@ -15,7 +246,7 @@ class FOD:
         """
         self.mSiblings = siblings
 
-    #################### Operator Overloading #################### 
+    #################### Operator Overloading ####################
     def __str__(self) -> str:
         return str(self.mPos)
 
@@ -35,13 +266,28 @@ class FOD:
         """
         return (self.mPos - shift)
 
+FOD.mRegistry[FOD.mCode] = FOD
+
+def AtomStore(atom, target=False) -> FODStore:
+    """
+    Return the FODStore of the molecule that owns atom. Target (relaxed) FODs are kept in
+    a separate store so that they are not mixed with the predicted FODs.
+    """
+    context = atom.mOwner.mContext
+    return context.mTargets if target else context.mStore
+
 class CFOD(FOD):
     """
     This class is essentially the same as <FOD>. For categorization purposes, it was better to
     create this class instead of creating a Boolean member inside the FOD class that made it a
     CFOD.
     """
-    def __init__(self, atom, pos: np.ndarray = np.zeros(3), ch=True) -> None:
-        super().__init__(pos,ch)
+    __slots__ = ()
+    mCode = 1
+    mAtom = _AtomRef('atom')
+    mR = _Column('R')
+
+    def __init__(self, atom, pos: np.ndarray = np.zeros(3), ch=True, store: FODStore = None) -> None:
+        super().__init__(pos,ch, store if store is not None else AtomStore(atom))
         self.mAtom = atom
         self.mR = np.linalg.norm(self.mPos - atom.mPos)
@@ -1,6 +1,5 @@
 from  typing import List
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 
 def AddNormals(vectors: list[np.array]) -> np.ndarray:
     """This function normalizes all the given vectors, adds their normal,
@@ -14,9 +13,50 @@ def AddNormals(vectors: list[np.array]) -> np.ndarray:
     free_dir /= np.linalg.norm(free_dir)
     return free_dir
             
+def RotateBatch(vectors: np.ndarray, axes: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """
+    Rotate every vector about its axis by each of the angles. The rotation vectors are
+    angle*axis (as in Rotation.from_rotvec), so a non-unit axis scales the angles. All the
+    rotations are done in one stacked evaluation of Rodrigues' formula.
+
+    vectors: (M,3) vectors to rotate
+    axes: (M,3) axes of rotation, one per vector
+    angles: (n,) angles shared by all the vectors, or (M,n) angles per vector
+
+    Returns the (M,n,3) rotated vectors. A zero angle returns the vector unchanged.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1,3)
+    axes = np.asarray(axes, dtype=np.float64).reshape(-1,3)
+    angles = np.asarray(angles, dtype=np.float64)
+    if angles.ndim == 1:
+        angles = angles[None,:]
+    rotvec = angles[:,:,None]*axes[:,None,:]
+    theta = np.sqrt((rotvec*rotvec).sum(axis=2))[:,:,None]
+    # A zero rotation vector gives a zero unit axis, and the vector is returned unchanged
+    k = rotvec/np.where(theta == 0, 1.0, theta)
+    v = vectors[:,None,:]
+    cos = np.cos(theta)
+    kxv = np.stack((k[...,1]*v[...,2] - k[...,2]*v[...,1],
+                    k[...,2]*v[...,0] - k[...,0]*v[...,2],
+                    k[...,0]*v[...,1] - k[...,1]*v[...,0]), axis=2)
+    rotated = v*cos + kxv*np.sin(theta) + k*((k*v).sum(axis=2)[:,:,None]*(1 - cos))
+    return rotated
+
+def RotateVecs(V: np.ndarray, rotvecs: np.ndarray) -> np.ndarray:
+    """
+    Batched RotateVec. Rotates each row of V (M,3) by the matching rotation vector in rotvecs (M,3).
+    """
+    return RotateBatch(V, rotvecs, np.ones(1))[:,0]
+
+def RotateNormalsBatch(n: int, firstdirs: np.ndarray, axes: np.ndarray) -> np.ndarray:
+    """
+    Batched RotateNormals. Returns the (M,n,3) points equally distributed on the circles
+    that start at firstdirs (M,3) and turn about axes (M,3).
+    """
+    return RotateBatch(firstdirs, axes, ((2*np.pi)/n)*np.arange(n))
+
 def RotateVec(V: np.ndarray, axis: np.ndarray):
-    rot = R.from_rotvec(axis)
-    return np.matmul(rot.as_matrix(),V)
+    return RotateVecs(V, axis)[0]
 
 def RotatePoints(n:int,fod0:np.ndarray,axis:np.ndarray) -> List[np.ndarray]:
     """
@@ -27,29 +67,13 @@ def RotatePoints(n:int,fod0:np.ndarray,axis:np.ndarray) -> List[np.ndarray]:
     axis: The axis of rotation
     """
     assert len(axis) == 3, "The array must have 3 dimensions"
-    fodsRotated = [fod0]
-    step = (2*np.pi)/n
-    for i in range(1,n):
-        rot = R.from_rotvec((step*i)*axis)
-        fod = np.matmul(rot.as_matrix(),fod0)
-        fodsRotated.append(fod)
-    return fodsRotated
+    return [fod0] + list(RotateNormalsBatch(n, fod0, axis)[0,1:])
 
 def RotateNormals(n: int, firstdir: np.ndarray, axis: np.ndarray) -> List[np.ndarray]:
     # Assertions
     assert len(axis) == 3, "The array must have 3 dimensions"
     assert len(firstdir) == 3, "The array must have 3 dimensions"
-
-    # Variables
-    fodsRotated = [firstdir]
-    step = (2*np.pi)/n
-
-    # Rotate input vector and create a new coordinate from that
-    for i in range(1,n):
-        rot = R.from_rotvec((step*i)*axis)
-        fod = np.matmul(rot.as_matrix(),firstdir)
-        fodsRotated.append(fod)
-    return fodsRotated
+    return [firstdir] + list(RotateNormalsBatch(n, firstdir, axis)[0,1:])
 
 def RandomPerpDir(ref: np.ndarray) -> np.ndarray:
     """
@@ -65,6 +89,78 @@ def RandomPerpDir(ref: np.ndarray) -> np.ndarray:
         randperp = np.array([10,2,b_z])
         return normalize(randperp)     
     
+def RandomPerpDirs(refs: np.ndarray) -> np.ndarray:
+    """
+    Vectorized RandomPerpDir. Returns one perpendicular direction for every row of refs (M,3),
+    following the same rules as RandomPerpDir.
+    """
+    refs = np.asarray(refs, dtype=np.float64)
+    dirs = np.empty_like(refs)
+    x0 = refs[:,0] == 0
+    y0 = ~x0 & (refs[:,1] == 0)
+    z0 = ~x0 & ~y0 & (refs[:,2] == 0)
+    rest = ~(x0 | y0 | z0)
+    dirs[x0] = [1.0,0.0,0.0]
+    dirs[y0] = [0.0,1.0,0.0]
+    dirs[z0] = [0.0,0.0,1.0]
+    r = refs[rest]
+    randperp = np.stack((np.full(len(r), 10.0), np.full(len(r), 2.0), -(10*r[:,0] + 2*r[:,1])/r[:,2]), axis=1)
+    dirs[rest] = randperp/np.linalg.norm(randperp, axis=1)[:,None]
+    return dirs
+
+# Largest number of pairs for which OptimalAssignment solves the full distance matrix
+DENSE_ASSIGNMENT = 4000000
+
+def OptimalAssignment(A: np.ndarray, B: np.ndarray, cutoff: float = 1.5):
+    """
+    Returns the assignment between the points in A and the points in B that minimizes the
+    sum of distances (Hungarian problem). Every point of the smaller set is assigned.
+    Up to DENSE_ASSIGNMENT pairs, the full distance matrix is solved (linear_sum_assignment).
+    Larger sets only put the pairs closer than cutoff into a sparse cost matrix, and the cutoff
+    is doubled until a full assignment exists and stays the same after one more doubling (or
+    every pair is in the matrix).
+
+    A: (n,3) array of points
+    B: (m,3) array of points
+    cutoff: Initial pruning distance of the sparse cost matrix
+
+    Returns the row indices into A and the column indices into B, ordered by row.
+    """
+    if len(A) == 0 or len(B) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    if len(A)*len(B) <= DENSE_ASSIGNMENT:
+        from scipy.optimize import linear_sum_assignment
+        from scipy.spatial.distance import cdist
+        rows, cols = linear_sum_assignment(cdist(A, B))
+        return rows.astype(np.intp), cols.astype(np.intp)
+
+    from scipy.spatial import cKDTree
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+    treeA = cKDTree(A)
+    treeB = cKDTree(B)
+    # Beyond this cutoff every pair is in the matrix and a full matching always exists
+    extent = np.linalg.norm(np.ptp(np.vstack((A,B)), axis=0)) + 1.0
+    last = None
+    while True:
+        cost = treeA.sparse_distance_matrix(treeB, min(cutoff, extent), output_type='coo_matrix')
+        # Shift the distances so that coincident points are not dropped as zeros. A constant
+        # shift does not change which full assignment is optimal.
+        cost.data += 1.0
+        try:
+            rows, cols = min_weight_full_bipartite_matching(cost.tocsr())
+        except ValueError:
+            if cutoff >= extent:
+                raise
+            cutoff *= 2
+            continue
+        order = np.argsort(rows)
+        match = (np.asarray(rows)[order].astype(np.intp), np.asarray(cols)[order].astype(np.intp))
+        # A longer cutoff that does not change the matching has not found a better one
+        if cutoff >= extent or (last is not None and np.array_equal(last[1], match[1])):
+            return match
+        last = match
+        cutoff *= 2
+
 def AngleBetween(A: np.ndarray, B: np.ndarray) -> float:
     """
     Returns the angle between vector A and vector B using simple dot product properties. 
@@ -73,6 +169,14 @@ def AngleBetween(A: np.ndarray, B: np.ndarray) -> float:
     ab_abs = np.linalg.norm(A)*np.linalg.norm(B)
     return np.arccos(ab/(ab_abs))
 
+def AnglesBetween(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Vectorized AngleBetween for the rows of A and B (M,3).
+    """
+    ab = np.einsum('ij,ij->i', A, B)
+    ab_abs = np.linalg.norm(A, axis=1)*np.linalg.norm(B, axis=1)
+    return np.arccos(ab/(ab_abs))
+
 
 ####LAMBDA FUNCTIONS######
 normalize = lambda v: v/np.linalg.norm(v)
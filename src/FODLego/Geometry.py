@@ -0,0 +1,104 @@
+#Description: The Geometry class caches the geometric quantities of the bonds of a molecule: the
+#  vector, distance and unit direction of every bonded pair, the vectors from every atom to its
+#  bonded atoms and their resultant per atom. The arrays are computed from the AtomTable and the
+#  BondTable the first time they are read, and dropped (Invalidate) when the positions change.
+import numpy as np
+
+
+class Geometry:
+    def __init__(self, atoms, bonds):
+        self.mAtoms = atoms
+        self.mBonds = bonds
+        # Bond of every (lower, higher) pair of bonded atoms
+        self.mPairs = {(min(i, j), max(i, j)): b for b, (i, j) in enumerate(bonds.mIdx.tolist())}
+        self.Invalidate()
+
+    def Invalidate(self) -> None:
+        """
+        Drop the cached arrays. They are computed again from the positions when next read.
+        """
+        self._vec = None
+        self._dist = None
+        self._unit = None
+        self._nbrvec = None
+        self._resultant = None
+
+    # Arrays over the bonds, along the bond table (from mIdx[b,0] to mIdx[b,1])
+    @property
+    def mVec(self) -> np.ndarray:
+        if self._vec is None:
+            pos = self.mAtoms.mPos
+            self._vec = pos[self.mBonds.mIdx[:,1]] - pos[self.mBonds.mIdx[:,0]]
+        return self._vec
+
+    @property
+    def mDist(self) -> np.ndarray:
+        if self._dist is None:
+            self._dist = np.linalg.norm(self.mVec, axis=1)
+        return self._dist
+
+    @property
+    def mUnit(self) -> np.ndarray:
+        if self._unit is None:
+            self._unit = self.mVec/self.mDist[:,None]
+        return self._unit
+
+    # Arrays over the atoms
+    @property
+    def mNbrVec(self) -> np.ndarray:
+        """
+        Vectors from every atom to its bonded atoms, in the CSR order of the bond table.
+        """
+        if self._nbrvec is None:
+            bonds = self.mBonds
+            owner = np.repeat(np.arange(len(self.mAtoms)), bonds.Degree())
+            self._nbrvec = self.mAtoms.mPos[bonds.mNbrAtom] - self.mAtoms.mPos[owner]
+        return self._nbrvec
+
+    @property
+    def mResultant(self) -> np.ndarray:
+        """
+        Sum of the vectors from every atom to its bonded atoms.
+        """
+        if self._resultant is None:
+            bonds = self.mBonds
+            owner = np.repeat(np.arange(len(self.mAtoms)), bonds.Degree())
+            self._resultant = np.zeros((len(self.mAtoms), 3))
+            np.add.at(self._resultant, owner, self.mNbrVec)
+        return self._resultant
+
+    def Oriented(self, start: np.ndarray) -> np.ndarray:
+        """
+        Vector of every bond b from the atom start[b] (one of its two atoms) to the other one.
+        """
+        return np.where((self.mBonds.mIdx[:,0] == start)[:,None], self.mVec, -self.mVec)
+
+    # Lookups for the per-atom heuristics
+    def BondIndex(self, i: int, j: int) -> int:
+        return self.mPairs[(min(i, j), max(i, j))]
+
+    def Vector(self, i: int, j: int) -> np.ndarray:
+        """
+        Vector from atom i to its bonded atom j.
+        """
+        b = self.BondIndex(i, j)
+        return self.mVec[b] if self.mBonds.mIdx[b,0] == i else -self.mVec[b]
+
+    def Distance(self, i: int, j: int) -> float:
+        return self.mDist[self.BondIndex(i, j)]
+
+    def Direction(self, i: int, j: int) -> np.ndarray:
+        """
+        Unit vector from atom i to its bonded atom j.
+        """
+        b = self.BondIndex(i, j)
+        return self.mUnit[b] if self.mBonds.mIdx[b,0] == i else -self.mUnit[b]
+
+    def NeighborVectors(self, i: int) -> np.ndarray:
+        """
+        Vectors from atom i to its bonded atoms, in the order of Atom.mBonds.
+        """
+        return self.mNbrVec[self.mBonds.mNbrStart[i]:self.mBonds.mNbrStart[i+1]]
+
+    def Resultant(self, i: int) -> np.ndarray:
+        return self.mResultant[i]
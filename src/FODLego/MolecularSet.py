@@ -27,20 +27,15 @@ class MolecularSet:
 
     def GetBonds(self, order=None) -> List[Bond]:
         """
-        Returns a python list of all bonds across all molecules. Because they are ordered by index, then there the 'greater than' condition assures no repeats
+        Returns a python list of all bonds across all molecules. Every bond is held once in the
+        bond table of its molecule, so there are no repeats.
         """
         bonds = []
         for mol in self.mMols:
             if mol.mValidStruct == True:
-                for atom in mol.mAtoms:
-                    for bond in atom.mBonds:
-                        bonded_at = bond.mAtoms[1]
-                        if bonded_at.mI  > atom.mI:
-                            if order is None:
-                                bonds.append(bond)
-                            else:
-                                if bond.mOrder == order:
-                                    bonds.append(bond)
+                for bond in mol.mBonds:
+                    if order is None or bond.mOrder == order:
+                        bonds.append(bond)
         return bonds
 
     def tally_ffod_edges(self, typ=FOD):
@@ -3,38 +3,74 @@ from rdkit import Chem
 from rdkit.Chem import Mol
 from rdkit.Chem import rdDetermineBonds
 from rdkit.Chem import rdmolops
-from rdkit.Chem import AllChem
-from rdkit.Chem import rdDistGeom
 from rdkit.Chem import GetPeriodicTable
-from rdkit import Geometry
-# Numpy
-from scipy.spatial import distance
+# Embedding (AllChem, rdDistGeom) and SciPy are imported where they are used, so that
+# predicting from an XYZ file does not load them.
 # Others
-from os import remove
 import logging
 logger = logging.getLogger(__name__)
 
 # Custom Made library
 from FODLego.globaldata import GlobalData
+from FODLego.Context import FODContext
+from FODLego.AtomTable import AtomTable
+import FODLego.Shells as Shells
 from FODLego.ElementaryClasses import *
 from FODLego.Bond import *
-from FODLego.FOD import FOD
+from FODLego.Geometry import Geometry
+from FODLego.FOD import FOD, FODStore
 from FODLego.BFOD import *
+from FODLego.FFOD import FreeFODs
+from FODLego.Cache import GetCache, SetPositions
+import FODLego.Writers as Writers
 
 
+def ClusterToXYZ(text: str) -> str:
+    """
+    Convert the content of a CLUSTER file (coordinates in Bohr) into an XYZ block (Angstrom).
+    """
+    lines = text.splitlines()
+
+    # Skip the first two lines and get the atom count from the third line
+    atom_count = int(lines[2].split()[0])
+    xyz = [f"{atom_count}\n\n"]  # XYZ format first line (atom count) and an empty comment line
+
+    # Process the remaining lines
+    for line in lines[3:3+atom_count]:
+        parts = line.split()
+        x, y, z = parts[:3]  # First three are the coordinates
+        x = float(x)*GlobalData.AU2ANG
+        y = float(y)*GlobalData.AU2ANG
+        z = float(z)*GlobalData.AU2ANG
+
+        atomZ = int(parts[3])  # Atomic number at index 3
+        element = GetPeriodicTable().GetElementSymbol(atomZ)
+
+        # Write the element and coordinates in .xyz format
+        xyz.append(f"{element} {x:10.5f} {y:10.5f} {z:10.6f}\n")
+    return ''.join(xyz)
+
 class Molecule:
-    def __init__(self, source, RelaxedFODs = None, OgXYZ = None, openshell = False) -> None:
+    def __init__(self, source, RelaxedFODs = None, OgXYZ = None, openshell = False, assign = 'greedy', batched = True, cache = None, connectivity = 'rdkit', symmetry = False) -> None:
         # Molecular Parameters
         self.mAtoms: List[Atom] = []
         self.mComment = ''
         self.mQ = 0
-        self.mBonds: List[Bond] = []
+        self.mBonds: BondTable = None
+        self.mGeometry: Geometry = None
         self.mBFODs = set()
         self.mFFODs = set()
         self.mCFODs = set()
         self.mFODs = []
         self.mValidStruct = True
         self.mOpen = openshell
+        self.mAssign = assign
+        self.mBatched = batched
+        self.mCache = GetCache(cache)
+        self.mConnectivity = connectivity
+        self.mSymmetry = symmetry        # False, True or the tolerance of the point group (Angstrom)
+        self.mPointGroup = None
+        self.mSymmetryOps = None         # (center, operations, atom permutations) used for the FODs
 
         # Associated files
         self.mSrc: str = source
@@ -43,6 +79,7 @@ class Molecule:
 
         # Load File
         self._LoadSource()
+        self.mContext = FODContext(self.mAtoms)
         self.__RD_Bonds()
         self.CheckStericity()
         self.CalculateFODs()
@@ -52,8 +89,9 @@ class Molecule:
         # Reverse Determine Parameters with a target file
         if RelaxedFODs != None:
             self.mRelaxPos = []
+            self.mRelaxPosDown = []
             self.__LoadTargetFODs()
-            self.ReverseDetermination()
+            self.ReverseDetermination(assign)
             if OgXYZ != None:
                 self.CreateCompXYZ()
 
@@ -61,11 +99,22 @@ class Molecule:
     def CalculateFODs(self):
         """
         Loop through the atoms and call respective methods to 
-        calculate the FOD shells
+        calculate the FOD shells. With mBatched, the FODs of all atoms are created
+        stage by stage by the batched engines (BondFODs, Shells.CoreShells and
+        FreeFODs) and put back in the order of the per-atom heuristics afterwards.
+        A stage that an engine cannot handle is done with the per-atom heuristics.
+        With mSymmetry, the engines only run for the symmetry-unique atoms and bonds, and
+        the other FODs are generated with the symmetry operations (Symmetry.SymmetricFODs).
+        """
+        self.__PredictFODs()
+        self.__CollectFODs()
+
+    def __CollectFODs(self) -> None:
+        """
+        Gather the FODs of the atoms into the molecule and link the bonds to their BFODs.
         """
-        # TODO: Find a way to just add them deterministically, since sets mess order
+        self.mBFODs, self.mFFODs, self.mCFODs = set(), set(), set()
         for atom in self.mAtoms:
-            atom.mFODStruct.PrepareShells(self.mAtoms)
             # Add the calculated FODs to the molecule
             for bfod in atom.mFODStruct.mBFODs:
                 self.mBFODs.add(bfod)
@@ -73,20 +122,267 @@ class Molecule:
                 self.mFFODs.add(ffod)
             for cfod in atom.mFODStruct.mCore:
                 self.mCFODs.add(cfod)
-        self.mFODs = set.union(self.mBFODs, self.mCFODs, self.mFFODs)
-
-    def _InterFOD_Dist(self):
-        # Create a list with all FODs. Make into List for index use.
-        allFODs = set.union(self.mBFODs, self.mFFODs)
-        allFODs = list(allFODs)
-        n = len(allFODs)
-        # Double loop without double counting
-        for i in range(n):
-            fod1 = allFODs[i]
-            for j in range(i+1,n):
-                fod2 = allFODs[j]
-                if dist(fod1.mPos, fod2.mPos) < 0.4:
-                    print(f'Valence FOD at {fod1.mPos} is very close to FOD at {fod2.mPos}')
+        # The context holds every FOD once, in the (deterministic) order of creation
+        self.mFODs = list(self.mContext.mFODs)
+        # Every bond finds its BFODs in the store
+        self.mBonds.LinkFODs(self.mContext.mStore)
+
+    def UpdatePositions(self, pos, tol: float = 1e-3, rebond: bool = False) -> np.ndarray:
+        """
+        Move the atoms to pos ((M,3), Angstrom) and update the FODs without perceiving the bonds
+        again, e.g. between the steps of a geometry optimization or a scan. The bonds, their
+        orders and the FOD layout are kept. The FODs of the atoms that moved more than tol and of
+        the atoms up to two bonds away from them (whose bonding FODs and free directions depend
+        on the moved atoms) are computed again; the other FODs follow their atoms. The rows of
+        the store keep their order, so the FRMORB of the new geometry lists the FODs in the same
+        order as the old one.
+        With rebond (e.g. along a reaction path), the bonds that form or break between the two
+        geometries are found with the covalent thresholds of Connectivity.UpdateBonds, and the
+        bond orders are only perceived again around them. The FODs of the atoms in that region
+        are then computed again as well, and the FODs keep their order elsewhere.
+        Returns the indices of the atoms whose FODs were computed again.
+        """
+        table = self.mAtoms
+        pos = np.asarray(pos, dtype=np.float64)
+        if pos.shape != table.mPos.shape:
+            raise ValueError(f"Expected positions of shape {table.mPos.shape}, got {pos.shape}")
+        delta = pos - table.mPos
+        moved = np.linalg.norm(delta, axis=1) > tol
+        table.SetPositions(pos)
+        if self.rdmol is not None and self.rdmol.GetNumConformers() > 0:
+            SetPositions(self.rdmol, pos)
+
+        # Bonds that formed or broke since the bonds were perceived, and the region whose orders
+        # were perceived again. When no valid bonds are found (e.g. a hydrogen shared by two
+        # atoms halfway along a transfer, or left without bonds), the old bonds are kept and tried
+        # again on the next call.
+        oldidx = self.mBonds.mIdx
+        rebonded = False
+        if rebond:
+            from FODLego.Connectivity import UpdateBonds, DetermineBonds
+            rdmol = None
+            try:
+                rdmol, region = UpdateBonds(self.rdmol, self.mBondPos, pos)
+                if rdmol is None:
+                    self.mBondPos = pos.copy()
+            except ValueError as e:
+                logger.warning(f"{e} Perceiving the bonds of {self.mSrc} again")
+                try:
+                    rdmol, region = DetermineBonds(self.rdmol, charge=self.mQ), np.arange(len(table))
+                except ValueError as e:
+                    logger.warning(f"The bonds of {self.mSrc} are kept. {e}")
+            if rdmol is not None and not self.__SupportedBonds(rdmol):
+                logger.warning(f"The new bonds of {self.mSrc} leave atoms without a known core shell; the bonds are kept")
+                rdmol = None
+            if rdmol is not None:
+                oldmol, oldpos = self.rdmol, self.mBondPos
+                self.rdmol = rdmol
+                self.__RD_Bonds()
+                self.CheckStericity()
+                moved[region] = True
+                rebonded = True
+
+        # The atoms to compute again: the moved ones and the atoms up to two bonds away (in the
+        # old and new bonds). A double bond at an atom with two bonds and no free pairs is placed
+        # from its other bond, so that atom and both of its bonds are computed together.
+        idx, bonds = self.mBonds.mIdx, self.mBonds
+        both = np.vstack((oldidx, idx)) if rebonded else idx
+        redo = moved.copy()
+        for _ in range(2):
+            redo[both[redo[both].any(axis=1)].reshape(-1)] = True
+        chain = (bonds.Degree() == 2) & (table.mFreePairs == 0)
+        while True:
+            dep = (bonds.mOrder == 2) & redo[idx].any(axis=1) & chain[idx].any(axis=1)
+            grow = redo.copy()
+            grow[idx[dep][chain[idx[dep]]]] = True
+            if (grow == redo).all():
+                break
+            redo = grow
+        if not self.mBatched or self.mSymmetry:
+            # The per-atom heuristics and the symmetry operations work on the whole molecule
+            redo[:] = True
+        atoms = np.flatnonzero(redo)
+
+        # Rows of the store that belong to those atoms and bonds, in row order
+        store = self.mContext.mStore
+        is_bfod = np.zeros(len(store), dtype=bool)
+        is_bfod[store.Select(BFOD)] = True
+        bold, meek, owner = store['bold'], store['meek'], store['atom']
+        rows = np.flatnonzero(np.where(is_bfod, redo[bold] | redo[meek], redo[owner]))
+
+        # The other FODs follow their atoms: core and free FODs move with their atom, bonding
+        # FODs with their point along the bond
+        keep = np.ones(len(store), dtype=bool)
+        keep[rows] = False
+        shift = np.where(is_bfod[:,None], delta[bold] + store['portion'][:,None]*(delta[meek] - delta[bold]), delta[owner])
+        store['pos'][keep] += shift[keep]
+        if rebonded:
+            try:
+                return self.__RebondFODs(redo, rows, both)
+            except (KeyError, IndexError, ValueError) as e:
+                # Go back to the old bonds, at the new positions
+                logger.warning(f"The FODs of {self.mSrc} could not be predicted with the new bonds; the bonds are kept. {type(e).__name__}: {e}")
+                self.rdmol = oldmol
+                self.__RD_Bonds()
+                self.CheckStericity()
+                self.mBondPos = oldpos
+                self.__Repredict()
+                return np.arange(len(table))
+        if len(rows) == 0:
+            return atoms
+
+        # Compute the FODs of the atoms in a scratch context and copy them into their rows
+        context, structs = self.mContext, [atom.mFODStruct for atom in table]
+        self.mContext = FODContext(table)
+        for atom in table:
+            atom.mFODStruct = FODStructure(atom)
+        try:
+            done = self.__PredictFODs(None if len(atoms) == len(table) else atoms)
+            new = self.mContext.mStore
+        finally:
+            self.mContext = context
+            for atom, struct in zip(table, structs):
+                atom.mFODStruct = struct
+        same = done and len(new) == len(rows) and all((new[col] == store[col][rows]).all() for col in ('type', 'channel', 'atom', 'bold', 'meek'))
+        if not same:
+            logger.warning(f"The FODs of {self.mSrc} changed layout; predicting them again in a new order")
+            self.__Repredict()
+            return np.arange(len(table))
+        for name in FODStore.mLayout:
+            store[name][rows] = new[name]
+        return atoms
+
+    def __SupportedBonds(self, rdmol: Chem.Mol) -> bool:
+        """
+        Check that every atom has a core shell in GlobalData.mGeo_Ladder with the bonds of rdmol
+        (e.g. a hydrogen without bonds has none).
+        """
+        degree = np.array([at.GetDegree() for at in rdmol.GetAtoms()])
+        core = self.mAtoms.mZ - self.mAtoms.Valences(degree)
+        return all(c == 0 or c in GlobalData.mGeo_Ladder for c in core.tolist())
+
+    def __RebondFODs(self, redo: np.ndarray, rows: np.ndarray, both: np.ndarray) -> np.ndarray:
+        """
+        After the bonds changed, remove the FODs of the atoms in redo (and of their bonds) from the
+        store, compute them with the new bonds and sort the store again. The FODs of the other
+        atoms are kept.
+        """
+        atoms = np.flatnonzero(redo)
+        if len(atoms) == len(self.mAtoms):
+            self.__Repredict()
+            return atoms
+        self.mContext.mStore.Remove(rows)
+        for i in atoms.tolist():
+            self.mAtoms[i].mFODStruct = FODStructure(self.mAtoms[i])
+        # Bonded atoms outside of redo drop the BFODs that were removed
+        for i in np.unique(both[redo[both].any(axis=1)]).tolist():
+            struct = self.mAtoms[i].mFODStruct
+            if not redo[i]:
+                struct.mBFODs = [fod for fod in struct.mBFODs if fod.mIdx >= 0]
+        if not self.__PredictFODs(atoms):
+            logger.warning(f"The FODs of {self.mSrc} are predicted again after the bonds changed")
+            self.__Repredict()
+            return np.arange(len(self.mAtoms))
+        self.__CollectFODs()
+        return atoms
+
+    def __PredictFODs(self, atoms=None) -> bool:
+        """
+        Run the batched engines (or, for a whole molecule, their fallbacks) for the given atoms and
+        the bonds that touch them, in the current context. Returns False when an engine cannot
+        handle a subset of the atoms.
+        """
+        if not self.mBatched:
+            for atom in self.mAtoms:
+                atom.mFODStruct.PrepareShells(self.mAtoms)
+            return True
+        if atoms is None:
+            if not (self.mSymmetry and self.__SymmetricFODs()):
+                if not BondFODs(self):
+                    for atom in self.mAtoms:
+                        atom.mFODStruct.PrepareShells(self.mAtoms, core=False, free=False)
+                Shells.CoreShells(self)
+                if not FreeFODs(self):
+                    for atom in self.mAtoms:
+                        atom.mFODStruct.PrepareShells(self.mAtoms, bonds=False, core=False)
+        else:
+            redo = np.zeros(len(self.mAtoms), dtype=bool)
+            redo[atoms] = True
+            if not BondFODs(self, np.flatnonzero(redo[self.mBonds.mIdx].any(axis=1))):
+                return False
+            Shells.CoreShells(self, atoms)
+            if not FreeFODs(self, atoms):
+                return False
+        for atom in self.mAtoms:
+            atom.mFODStruct.mValence = atom.mFODStruct.mBFODs + atom.mFODStruct.mFFODs
+        self.mContext.RestoreCreationOrder()
+        return True
+
+    def __Repredict(self) -> None:
+        """
+        Predict all FODs again in a new context.
+        """
+        self.mContext = FODContext(self.mAtoms)
+        for atom in self.mAtoms:
+            atom.mFODStruct = FODStructure(atom)
+        self.CalculateFODs()
+
+    def __SymmetricFODs(self) -> bool:
+        from FODLego.Symmetry import SymmetricFODs, TOLERANCE
+        tol = TOLERANCE if self.mSymmetry is True else float(self.mSymmetry)
+        return SymmetricFODs(self, tol)
+
+    def _InterFOD_Dist(self, thres: float = 0.4, core: bool = False, crosschannel: bool = False) -> np.ndarray:
+        """
+        Find the pairs of FODs that are closer than thres (Angstrom) to each other. Large
+        groups are searched with a KD-tree (fixed-radius query), so the cost grows with the
+        number of close pairs rather than with the square of the number of FODs. Small groups
+        are compared directly, which avoids importing SciPy for small molecules.
+
+        Args:
+            thres: Distance under which two FODs are considered too close.
+            core: Also include the core FODs. By default only valence FODs are checked.
+            crosschannel: Also pair alpha FODs with beta FODs. By default each spin channel
+            is checked on its own, since alpha and beta FODs may legitimately coincide.
+
+        Returns:
+            An (M,2) array of indices into self.mFODs, with i < j in every row.
+        """
+        pairs = np.empty((0,2), dtype=np.intp)
+        if len(self.mFODs) == 0:
+            return pairs
+        # The rows of the FODStore are in the same order as self.mFODs
+        store = self.mContext.mStore
+        pos = store['pos']
+        channel = store['channel']
+        selected = np.ones(len(store), dtype=bool)
+        if not core:
+            selected[store.Select(CFOD)] = False
+
+        # Each group of FODs gets its own tree
+        if crosschannel:
+            groups = [selected]
+        else:
+            groups = [selected & channel, selected & ~channel]
+        found = [pairs]
+        for group in groups:
+            index = np.flatnonzero(group)
+            if len(index) < 2:
+                continue
+            if len(index) <= 1024:
+                d2 = ((pos[index,None] - pos[None,index])**2).sum(-1)
+                i, j = np.nonzero(np.triu(d2 <= thres*thres, 1))
+                found.append(np.column_stack((index[i], index[j])))
+            else:
+                from scipy.spatial import cKDTree
+                tree = cKDTree(pos[index])
+                found.append(index[tree.query_pairs(thres, output_type='ndarray')])
+        pairs = np.sort(np.vstack(found), axis=1)
+        pairs = pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+
+        for i, j in pairs:
+            print(f'FOD at {self.mFODs[i].mPos} is very close to FOD at {self.mFODs[j].mPos}')
+        return pairs
 
     def CreateSDF(self) -> None:
         """
@@ -95,60 +391,60 @@ class Molecule:
         writer = Chem.SDWriter(self.mSrc + '.sdf')
         writer.write(self.rdmol)
 
-    def CreateXYZ(self) -> None:
+    def _AtomArrays(self):
         """
-        Create an XYZ file with
+        Names, atomic numbers and (N,3) positions of the atoms, for the writers.
         """
-        with open("lego.xyz",'w') as output:
-            #First 2 lines
-            output.write(str(len(self.mAtoms) + len(self.mFODs)) + '\n')
-            output.write(self.mComment)
-             
-            # Write all atoms
-            for atom in self.mAtoms:
-                atom_coords = ' '.join([f"{x:7.4f}" for x in atom.mPos])
-                output.write(f"{atom.mName} {atom_coords}\n")
-             
-            # Initialize separate strings for each channel
-            up_fods = []
-            down_fods = []
-
-            for fod in self.mFODs:
-                fod_coords = ' '.join([f"{x:7.4f}" for x in fod.mPos])
-                if fod.mChannel is True:
-                    up_fods.append(f"X {fod_coords}\n")
-                else:
-                    down_fods.append(f"He {fod_coords}\n")
+        atoms = self.mAtoms
+        if isinstance(atoms, AtomTable):
+            return np.array(atoms.mNames, dtype=object)[atoms.mElem], atoms.mZ, atoms.mPos
+        names = np.array([atom.mName for atom in atoms], dtype=object)
+        Z = np.array([atom.mZ for atom in atoms], dtype=np.int64)
+        return names, Z, np.array([atom.mPos for atom in atoms]).reshape(-1,3)
 
-            # Combine all lines with True channels first, then False channels
-            output.write(''.join(up_fods + down_fods))
-    
-    def CreateCLUSTER(self) -> None:
+    def GetXYZText(self) -> str:
+        """
+        Return the content of the XYZ file written by CreateXYZ.
+        """
+        return Writers.ToText(self.CreateXYZ)
+
+    def CreateXYZ(self, filename = "lego.xyz", compress: bool = None) -> None:
+        """
+        Create an XYZ file with the atoms and the predicted FODs.
+        Alpha FODs are written as 'X' and beta FODs as 'He'.
+        filename can also be an open file object; names ending in '.gz' are compressed.
+        """
+        names, _, atoms = self._AtomArrays()
+        store = self.mContext.mStore
+        pos = store['pos']
+        up = store['channel']
+        # Alpha FODs first, then beta FODs
+        Writers.WriteXYZ(filename, self.mComment, (names, atoms), ('X', pos[up]), ('He', pos[~up]), compress=compress)
+
+    def GetCLUSTERText(self) -> str:
+        """
+        Return the content of the CLUSTER file written by CreateCLUSTER.
+        """
+        return Writers.ToText(self.CreateCLUSTER)
+
+    def CreateCLUSTER(self, filename = "CLUSTER", compress: bool = None) -> None:
         """
         Creates a CLUSTER file that will serve as an input file for FLOSIC to begin
         """
-        cluster = open("CLUSTER", "w")
-        # CLUSTER Preamble
-        cluster.write("LDA-PW91*LDA-PW91\n")
-        cluster.write("NONE\n")
-        cluster.write(f"{len(self.mAtoms)}\n")
+        _, Z, atoms = self._AtomArrays()
+        Writers.WriteCLUSTER(filename, Z, atoms, self.mQ, compress=compress)
 
-        # Loop thorugh each atom for coordinates
-        for atom in self.mAtoms:
-            coordinate = " ".join( f"{x * GlobalData.ANG2AU:10.5f}" for x in atom.mPos) + " " + str(atom.mZ) + " ALL" + '\n'
-            cluster.write(coordinate)
-        cluster.write(f"{self.mQ} {0.0}")  # TODO: Make a variable that contains sum of all spins
-        cluster.close()
-    
-    def CreateFRMORB(self) -> None:
-        cluster = open("FRMORB", "w")
-        # CLUSTER Preamble
-        cluster.write(f"{len(GlobalData.mFODs)} 0\n")
-        # Loop thorugh each atom for coordinates
-        for fod in GlobalData.mFODs:
-            coordinate = " ".join( f"{x * GlobalData.ANG2AU:7.4f}" for x in fod.mPos) + '\n'
-            cluster.write(coordinate)
-        cluster.close()
+    def GetFRMORBText(self) -> str:
+        """
+        Return the content of the FRMORB file written by CreateFRMORB.
+        """
+        return Writers.ToText(self.CreateFRMORB)
+
+    def CreateFRMORB(self, filename = "FRMORB", compress: bool = None) -> None:
+        """
+        Creates the FRMORB file with the predicted FODs, the FOD input of FLOSIC.
+        """
+        Writers.WriteFRMORB(filename, self.mContext.mStore['pos'], compress=compress)
 
     def ClosedMol(self) -> bool:
         """
@@ -167,32 +463,28 @@ class Molecule:
         """
         file = self.mComment
         prefix = file[:-4]
-        with open(f"{prefix}_legocomp.xyz",'w') as output:
-            #First 2 lines
-            output.write(str(len(self.mAtoms) + 2*len(self.mFODs)) + '\n')
-            output.write(self.mComment)
-            #Write all atoms
-            for atom in self.mAtoms:
-                output.write(' '.join([atom.mName,*[str(x) for x in atom.mPos]]) + '\n')
-
-            #Write all FODs
-            fods = set.union(self.mBFODs, self.mCFODs, self.mFFODs)
-            for bfod in fods:
-                xyz = " ".join([str(x) for x in bfod.mPos])   
-                output.write(f"X {xyz}\n")
-
-            # Write the Relaxed FODs read from comparison
-            for relaxed in self.mRelaxPos:
-                pos = " ".join([str(x) for x in relaxed])   
-                output.write(f"He {pos}\n")
+        names, _, atoms = self._AtomArrays()
+        relaxed = np.array(self.mRelaxPos, dtype=np.float64).reshape(-1,3)
+        Writers.WriteXYZ(f"{prefix}_legocomp.xyz", self.mComment, (names, atoms),
+                         ('X', self.mContext.mStore['pos']), ('He', relaxed), fmt=Writers.FULL_XYZ_ROW)
 
-    def ReverseDetermination(self) -> None:
+    def ReverseDetermination(self, assign: str = 'greedy') -> None:
         """
         This function executes the reversedetermination of paramters for all Target FODs that have
         been associated with the predicted FODs.
+
+        Args:
+            assign: 'greedy' associates each predicted FOD with the nearest remaining target.
+            'optimal' finds the assignment with the smallest total displacement, per spin channel.
         """
         from FODLego.Shells import FODShell
-        self.__AssociateTargets()
+        from scipy.spatial import distance
+        if assign == 'optimal':
+            self.__AssociateTargetsOptimal()
+        else:
+            self.__AssociateTargets()
+        self.mAssignTotal, self.mAssignMax = self.AssignmentDisplacement()
+        logger.info(f"Assignment of targets. Total displacement: {self.mAssignTotal:.4f}, maximum displacement: {self.mAssignMax:.4f}")
         
         #Loop through atoms to deterpmine the average and the variance
         for atom in self.mAtoms:
@@ -212,6 +504,16 @@ class Molecule:
                     shell.mTarget_s2_R = np.var(pred_radii)
 
     # Getters
+    def AssignmentDisplacement(self):
+        """
+        Returns the total and the maximum distance between the predicted FODs and the
+        target FODs associated with them.
+        """
+        d = [dist(fod.mPos, fod.mAssocFOD.mPos) for fod in self.mFODs if isinstance(fod.mAssocFOD, FOD)]
+        if len(d) == 0:
+            return 0.0, 0.0
+        return float(np.sum(d)), float(np.max(d))
+
     def GeFBEdges(self):
         for at in self.mAtoms:
             edges = at.GetAssocEdges_B_F_FOD()
@@ -247,6 +549,7 @@ class Molecule:
         """
         #TODO: Create a function that loops over the things, instead of doing 3 for loops....
         from FODLego.FFOD import FFOD
+        from scipy.spatial import distance
 
         # Create a vector of the distances, vertical
         rlx = np.vstack([x for x in self.mRelaxPos])
@@ -258,7 +561,7 @@ class Molecule:
             # Print general information
             # Create appropriate associate fod
             if isinstance(fod, CFOD):
-                fod.mAssocFOD = CFOD(fod.mAtom, rlx[index])
+                fod.mAssocFOD = CFOD(fod.mAtom, rlx[index], store=self.mContext.mTargets)
                 # Exclude the FOD that has been associated from the relaxed list.
                 rlx = np.delete(rlx,index,axis=0)
             else:
@@ -291,10 +594,49 @@ class Molecule:
                     target=rlx[index])
                 rlx = np.delete(rlx,index,axis=0)
 
+    def __AssociateTargetsOptimal(self, cutoff: float = 1.5):
+        """
+        Associates the target FODs with the predicted FODs through the assignment that minimizes
+        the sum of displacements, instead of the greedy nearest neighbor. Each spin channel is
+        assigned on its own: alpha FODs to the up targets and, in open-shell molecules, beta FODs
+        to the down targets. Channels with many thousands of FODs prune the cost matrix to pairs
+        closer than cutoff (Funcs.OptimalAssignment).
+        """
+        channels = [(True, self.mRelaxPos)]
+        if self.mOpen:
+            channels.append((False, self.mRelaxPosDown))
+
+        for ch, targets in channels:
+            pred = [fod for fod in self.mFODs if fod.mChannel == ch]
+            if len(pred) == 0 or len(targets) == 0:
+                continue
+            if len(pred) != len(targets):
+                logger.warning(f"{len(pred)} predicted FODs and {len(targets)} targets in channel {'up' if ch else 'down'}")
+            rlx = np.vstack(targets)
+            rows, cols = OptimalAssignment(np.vstack([fod.mPos for fod in pred]), rlx, cutoff)
+            for i, j in zip(rows, cols):
+                pred[i].mAssocFOD = self.__CreateAssocFOD(pred[i], rlx[j])
+
+    def __CreateAssocFOD(self, fod, pos: np.ndarray):
+        """
+        Create the FOD that represents the target position associated with fod. It has the
+        same type, atoms and channel as the predicted FOD.
+        """
+        from FODLego.FFOD import FFOD
+        if isinstance(fod, CFOD):
+            return CFOD(fod.mAtom, pos, fod.mChannel, store=self.mContext.mTargets)
+        elif isinstance(fod, BFOD):
+            return BFOD(fod.mBold, fod.mMeek, pos, fod.mChannel)
+        elif isinstance(fod, FFOD):
+            return FFOD(fod.mAtom, ch=fod.mChannel, target=pos)
+        else:
+            print("Invalid classification for associated FOD")
+
     def __CreateCoordMap(self, file):
         """
         Create a map for the Embedding to work....
         """
+        from rdkit import Geometry
         XYZ = open(file, "r")
         count = int(XYZ.readline()) #Read Size
         self.mComment = XYZ.readline() #Read Size
@@ -316,18 +658,31 @@ class Molecule:
         from random import randint
         seed = randint(0,2000)
 
+        from rdkit.Chem import AllChem
+        from rdkit.Chem import rdDistGeom
+        rdDistGeom.EmbedParameters.enableSequentialRandomSeeds=False
+        rdDistGeom.EmbedParameters.maxIterations=1
+        AllChem.EmbedParameters.clearConfs = True
+
         # Prepare SMILES Molecule with rdkit
         if tmp != None:
             core = Chem.MolFromXYZFile(tmp)
+            key = None
+            if self.mCache is not None:
+                key = self.mCache.Key('embed', core, self.mQ, Chem.MolToSmiles(self.rdmol))
+                cached = self.mCache.Load(key, self.rdmol.GetNumAtoms())
+                if cached is not None:
+                    self.rdmol = cached
+                    self.mAtoms = AtomTable.FromRDKit(self, self.rdmol)
+                    return
             try:
                 self.rdmol = AllChem.ConstrainedEmbed(self.rdmol, core, randomseed=seed, maxAttempts=8000)
                 AllChem.MMFFOptimizeMolecule(self.rdmol)
+                if key is not None:
+                    self.mCache.Store(key, self.rdmol)
 
                 # Load onto FODLego scheme
-                for i,atom in enumerate(self.rdmol.GetAtoms()):
-                    coor = self.rdmol.GetConformer().GetAtomPosition(i)
-                    name = atom.GetSymbol()
-                    self.mAtoms.append(Atom(i, name,coor, self)) #Name and Position
+                self.mAtoms = AtomTable.FromRDKit(self, self.rdmol)
             except Exception as e:
                 self.mValidStruct = False
                 print(f'File with {tmp} not cannot be embeded')
@@ -335,11 +690,7 @@ class Molecule:
         else:
             AllChem.EmbedMolecule(self.rdmol, maxAttempts=8000, randomSeed=seed)
             AllChem.MMFFOptimizeMolecule(self.rdmol)
-
-            for i, at in enumerate(self.rdmol.GetAtoms()):
-                name = at.GetSymbol()
-                pos = self.rdmol.GetConformer().GetAtomPosition(i)
-                self.mAtoms.append(Atom(i, name,[pos.x, pos.y, pos.z], self))
+            self.mAtoms = AtomTable.FromRDKit(self, self.rdmol)
 
     def __LoadTargetFODs(self):
         """
@@ -352,18 +703,23 @@ class Molecule:
             upcount = int(relx[0])
             downcount = int(relx[1])
 
-            # Load positions as ndarrays
-            for i in range(upcount):
+            # Load positions as ndarrays. The up FODs come first, then the down FODs.
+            for i in range(upcount + downcount):
                 coor = TargetF.readline()
                 coor = coor.replace('D','E')
                 coor = coor.split()
+                if len(coor) < 3:
+                    break
                 if self.mTargetFile[-6:] == 'FRMORB':
                     atom_xyz = np.array([float(x)*(GlobalData.AU2ANG) for x in coor[0:3]])
                 elif self.mTargetFile[-6:] == 'Target':
                     atom_xyz = np.array([float(x) for x in coor[0:3]])
                 else:
                     atom_xyz = np.array([float(x) for x in coor[0:3]])
-                self.mRelaxPos.append(atom_xyz)  # Name and Position
+                if i < upcount:
+                    self.mRelaxPos.append(atom_xyz)  # Name and Position
+                else:
+                    self.mRelaxPosDown.append(atom_xyz)
             TargetF.close()
         elif isinstance(self.mTargetFile, list):
             print("A list was passed")
@@ -374,10 +730,7 @@ class Molecule:
         Credit to Betelgeuse in stackoverflow describing how to get this:
         https://stackoverflow.com/questions/71915443/rdkit-coordinates-for-atoms-in-a-molecule
         """
-        for i, atom in enumerate(self.rdmol.GetAtoms()):
-            position = self.rdmol.GetConformer().GetAtomPosition(i)
-            pos = [position.x, position.y, position.z]
-            self.mAtoms.append(Atom(i, atom.GetSymbol(), pos, self))
+        self.mAtoms = AtomTable.FromRDKit(self, self.rdmol)
 
     def __RD_Bonds(self):
         """
@@ -385,24 +738,24 @@ class Molecule:
         This will be used for prototyping  
         """ 
         rdmolops.Kekulize(self.rdmol)
-        #Loop through the
-        for rdbond in self.rdmol.GetBonds():
-            # Get atoms
-            i1 = rdbond.GetBeginAtomIdx()   
-            i2 = rdbond.GetEndAtomIdx() 
-            Atom1 = self.mAtoms[i1]
-            Atom2 = self.mAtoms[i2]
-
-            # Set order and create bonds
-            order = rdbond.GetBondTypeAsDouble()
-            newbond = Bond(Atom1, Atom2, order)
-            self.mBonds.append(newbond)
-            Atom1.AddBond(Atom2, order)
-            Atom2.AddBond(Atom1, order)
-        
+        # One table with every bond, shared by the atoms (Atom.mBonds are views into it)
+        idx = [[b.GetBeginAtomIdx(), b.GetEndAtomIdx()] for b in self.rdmol.GetBonds()]
+        orders = [b.GetBondTypeAsDouble() for b in self.rdmol.GetBonds()]
+        self.mBonds = BondTable(self.mAtoms, idx, orders)
+        self.mAtoms.mBondTable = self.mBonds
+        # Bond vectors, distances and directions, computed when the heuristics first need them
+        self.mGeometry = Geometry(self.mAtoms, self.mBonds)
+        self.mAtoms.mGeometry = self.mGeometry
+        # Bonded atoms and orders as arrays, for the batched engines
+        self.mBondIdx = self.mBonds.mIdx
+        self.mBondOrder = self.mBonds.mOrder
+        # Positions at which the bonds were perceived (UpdatePositions with rebond)
+        self.mBondPos = self.mAtoms.mPos.copy()
+
         # Find out valence of atoms after connectivity
-        for at in self.mAtoms:
-            at.mValCount = at.FindValence()
+        if isinstance(self.mAtoms, AtomTable):
+            degree = np.array([at.GetDegree() for at in self.rdmol.GetAtoms()])
+            self.mAtoms.FindValences(degree)
 
     def _CheckChemValency(self) -> None:
         """
@@ -415,7 +768,8 @@ class Molecule:
                 self.mValidStruct = False
 
     def _CheckRadicals(self):
-        if Chem.Descriptors.NumRadicalElectrons(self.rdmol) > 0:
+        from rdkit.Chem import Descriptors
+        if Descriptors.NumRadicalElectrons(self.rdmol) > 0:
             self.mValidStruct = False
  
     def CheckStericity(self):
@@ -424,8 +778,7 @@ class Molecule:
         TODO: Implement some way to easily add an open-shell calculation, in which there might be 
         open-shells
         """
-        for atom in self.mAtoms:
-            atom.CalcSteric()
+        self.mAtoms.CalcSteric()
         
     def CountFODs(self):
         """
@@ -443,64 +796,55 @@ class Molecule:
             src: The
             ogXYZ:
         """
-        # Parameters
-        rdDistGeom.EmbedParameters.enableSequentialRandomSeeds=False
-        rdDistGeom.EmbedParameters.maxIterations=1
-        AllChem.EmbedParameters.clearConfs = True
-
-        def CLUST2XYZ(input_file, output_file):
-            """
-            Load a CLUSTER File into an rdmol
-            """
-            # Function to process the file and convert to .xyz format
-            with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-                lines = infile.readlines()
-
-                # Skip the first two lines and get the atom count from the third line
-                atom_count = int(lines[2].split()[0])
-                outfile.write(f"{atom_count}\n\n")  # XYZ format first line (atom count) and an empty comment line
-
-                # Process the remaining lines
-                for line in lines[3:3+atom_count]:
-                    parts = line.split()
-                    x, y, z = parts[:3]  # First three are the coordinates
-                    x = float(x)*GlobalData.AU2ANG
-                    y = float(y)*GlobalData.AU2ANG
-                    z = float(z)*GlobalData.AU2ANG
-
-                    atomZ = int(parts[3])  # Atomic number at index 3
-                    element = GetPeriodicTable().GetElementSymbol(atomZ)
-
-                    # Write the element and coordinates in .xyz format
-                    outfile.write(f"{element} {x:10.5f} {y:10.5f} {z:10.6f}\n")
-
         def read_xyz():
-            for i, atom in enumerate(self.rdmol.GetAtoms()):
-                position = self.rdmol.GetConformer().GetAtomPosition(i)
-                pos = [position.x, position.y, position.z]
-                self.mAtoms.append(Atom(i, atom.GetSymbol(), pos, self))
-
-        def create_xyz(file: str) -> None:
-            self.mComment = self.mSrc + '\n'
-            self.rdmol = Chem.MolFromXYZFile(file)
+            self.mAtoms = AtomTable.FromRDKit(self, self.rdmol)
+
+        def create_xyz(rdmol: Chem.Mol, comment: str) -> None:
+            self.mComment = comment + '\n'
+            self.rdmol = rdmol
             read_xyz()
-            rdDetermineBonds.DetermineConnectivity(self.rdmol)
-            if len(self.rdmol.GetBonds()) > 0:
-                rdDetermineBonds.DetermineBondOrders(self.rdmol, charge=self.mQ)
+            # The perceived bonds only depend on the elements, coordinates and charge
+            key = None
+            if self.mCache is not None:
+                key = self.mCache.Key(f'bonds-{self.mConnectivity}', self.rdmol, self.mQ)
+                cached = self.mCache.Load(key, self.rdmol.GetNumAtoms())
+                if cached is not None:
+                    self.rdmol = cached
+                    SetPositions(self.rdmol, self.mAtoms.mPos)
+                    return
+            if self.mConnectivity == 'covalent':
+                # KD-tree connectivity and bond orders per fragment, for large structures
+                from FODLego.Connectivity import DetermineBonds
+                self.rdmol = DetermineBonds(self.rdmol, charge=self.mQ)
+            else:
+                rdDetermineBonds.DetermineConnectivity(self.rdmol)
+                if len(self.rdmol.GetBonds()) > 0:
+                    rdDetermineBonds.DetermineBondOrders(self.rdmol, charge=self.mQ)
+            if key is not None:
+                self.mCache.Store(key, self.rdmol)
+
+        if isinstance(self.mSrc, Chem.Mol):
+            # In-memory structure. Without bonds, they are perceived as for an XYZ file.
+            comment = self.mSrc.GetProp('_FileComments') if self.mSrc.HasProp('_FileComments') else ''
+            if self.mSrc.GetNumBonds() == 0:
+                create_xyz(Chem.Mol(self.mSrc), comment)
+            else:
+                self.mComment = comment + '\n'
+                self.rdmol = Chem.Mol(self.mSrc)
+                read_xyz()
 
-        if self.mOgXYZ == None:
+        elif self.mOgXYZ == None:
             if self.mSrc[-3:] == "pdb":  # WiP. This is a test
                 self.rdmol = Chem.MolFromPDBFile(self.mSrc)
                 self.__LoadPDB()
 
             elif self.mSrc[-3:] == "xyz":
-                create_xyz(self.mSrc)
+                create_xyz(Chem.MolFromXYZFile(self.mSrc), self.mSrc)
 
             elif self.mSrc[-7:] == "CLUSTER":
-                # Turn CLUSTER into an .xyz file  
-                CLUST2XYZ(self.mSrc, "CLUST.xyz")
-                create_xyz("CLUST.xyz")
-                remove("CLUST.xyz")
+                # Turn CLUSTER into an XYZ block, in memory
+                with open(self.mSrc, 'r') as file:
+                    create_xyz(Chem.MolFromXYZBlock(ClusterToXYZ(file.read())), self.mSrc)
 
             else:  # SMILES
                 print('THis is SMILES')
@@ -515,12 +859,14 @@ class Molecule:
                 self.__LoadSMILES(self.mOgXYZ)
 
         # Read RDKit documentation. They said this was in experimentation. It might help later down the line.
-        Chem.rdMolDescriptors.CalcOxidationNumbers(self.rdmol)
+        from rdkit.Chem import rdMolDescriptors
+        rdMolDescriptors.CalcOxidationNumbers(self.rdmol)
 
     #Debugging Methods
-    def debug_printTargPred():
+    def debug_printTargPred(self):
+        from scipy.spatial import distance
         c = np.vstack([x for x in self.mRelaxPos])
-        for pfod in GlobalData.mFODs:
+        for pfod in self.mContext.mFODs:
             # Get the minimum distance to Target FOD
             distances = distance.cdist([pfod.mPos],c, 'sqeuclidean')
             index = np.argmin(distances[0])
@@ -564,30 +910,21 @@ class Molecule:
     def _debug_printBondMatrix(self):
         print("##BOND MATRIX##")
         str4 = [[0] * len(self.mAtoms) for _ in range(len(self.mAtoms))]
-        for b in self.mBonds:
-            str4[b.mAtoms[0]][b.mAtoms[1]] = b.mOrder
+        for (i, j), order in zip(self.mBonds.mIdx, self.mBonds.mOrder):
+            str4[i][j] = order
         for atom in str4:
             print(atom)    
 
     def _debug_printBFODs(self):
         from FODLego.ElementaryClasses import Atom
-        for atom in GlobalData.mAtoms:
+        for atom in self.mAtoms:
             print(f'In atom {atom.mI}:')
             for bfod in atom.mFODStruct.mBFODs:
                 print(bfod)
 
     def _debug_printBFODsXYZ(self):
-        with open(f"lego.xyz",'w') as output:
-            #First 2 lines
-            output.write(str(len(self.mAtoms) + len(GlobalData.mFODs)) + '\n')
-            output.write(self.mComment)
-            #Write all atoms
-            for atom in self.mAtoms:
-                output.write(' '.join([atom.mName,*[str(x) for x in atom.mPos]]) + '\n')
-            #Write all FODs
-            for bfod in GlobalData.mFODs:
-                xyz = " ".join([str(x) for x in bfod.mPos])   
-                output.write(f"X {xyz}\n")
+        names, _, atoms = self._AtomArrays()
+        Writers.WriteXYZ("lego.xyz", self.mComment, (names, atoms), ('X', self.mContext.mStore['pos']), fmt=Writers.FULL_XYZ_ROW)
 
     def _debug_CompareTargetFODs(self):
         """
@@ -595,7 +932,7 @@ class Molecule:
         and the number of FODs from your target file.
         """
         print("-"*30)
-        print(f'You have {len(GlobalData.mFODs)} Predicted FODs')
+        print(f'You have {len(self.mContext.mFODs)} Predicted FODs')
         print(f'You have {len(self.mRelaxPos)} Target FODs')
 
     #String Output
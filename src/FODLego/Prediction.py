@@ -0,0 +1,125 @@
+#Description: In-memory Python interface of FODLego. predict() takes a structure that is already in
+#  memory (an RDKit Mol, a pair of elements and positions, XYZ or CLUSTER text, a SMILES string or a
+#  file name) and returns a Prediction whose FOD positions, channels and type codes are NumPy views
+#  into the FOD store of the molecule, so no file is written and no array is copied. The file
+#  writers are available as optional serializers on top of the result.
+import numpy as np
+from rdkit import Chem
+
+class Prediction:
+    """
+    Result of predict(). The arrays are views into the FODStore of mMolecule, in the order of the
+    FRMORB file: mPos (N,3) in Angstrom, mChannel (N,) (True for alpha) and mType (N,) with the FOD
+    class codes of FODStore (e.g. 1 for CFOD, 2 for BFOD, 6 for FFOD).
+    """
+    def __init__(self, mol):
+        self.mMolecule = mol
+        store = mol.mContext.mStore
+        self.mPos = store['pos']
+        self.mChannel = store['channel']
+        self.mType = store['type']
+
+    @property
+    def mAtomPos(self) -> np.ndarray:
+        """
+        The (M,3) positions of the atoms, in Angstrom.
+        """
+        return self.mMolecule.mAtoms.mPos
+
+    @property
+    def mZ(self) -> np.ndarray:
+        """
+        The atomic numbers of the atoms.
+        """
+        return self.mMolecule.mAtoms.mZ
+
+    def __len__(self) -> int:
+        return len(self.mPos)
+
+    def UpdatePositions(self, positions, tol: float = 1e-3, rebond: bool = False) -> np.ndarray:
+        """
+        Move the atoms to positions ((M,3), Angstrom) and update the FODs without perceiving the
+        bonds again (Molecule.UpdatePositions). The FODs keep their order. With rebond, the bonds
+        that form or break are perceived around the atoms involved.
+        Returns the indices of the atoms whose FODs were computed again.
+        """
+        redo = self.mMolecule.UpdatePositions(positions, tol, rebond)
+        store = self.mMolecule.mContext.mStore
+        self.mPos = store['pos']
+        self.mChannel = store['channel']
+        self.mType = store['type']
+        return redo
+
+    # Serializers
+    def GetXYZText(self) -> str:
+        return self.mMolecule.GetXYZText()
+
+    def GetCLUSTERText(self) -> str:
+        return self.mMolecule.GetCLUSTERText()
+
+    def GetFRMORBText(self) -> str:
+        return self.mMolecule.GetFRMORBText()
+
+    def WriteXYZ(self, filename: str = "lego.xyz") -> None:
+        self.mMolecule.CreateXYZ(filename)
+
+    def WriteCLUSTER(self, filename: str = "CLUSTER") -> None:
+        self.mMolecule.CreateCLUSTER(filename)
+
+    def WriteFRMORB(self, filename: str = "FRMORB") -> None:
+        self.mMolecule.CreateFRMORB(filename)
+
+def MolFromElements(elements, positions) -> Chem.Mol:
+    """
+    Create an RDKit molecule without bonds from element symbols (or atomic numbers) and their
+    (M,3) positions in Angstrom.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    if len(elements) != len(positions):
+        raise ValueError(f"{len(elements)} elements were given for {len(positions)} positions")
+    rwmol = Chem.RWMol()
+    for elem in elements:
+        atom = Chem.Atom(int(elem)) if isinstance(elem, (int, np.integer)) else Chem.Atom(str(elem))
+        rwmol.AddAtom(atom)
+    conf = Chem.Conformer(len(positions))
+    conf.SetPositions(positions)
+    rwmol.AddConformer(conf, assignId=True)
+    return rwmol.GetMol()
+
+def _MolFromText(text: str) -> Chem.Mol:
+    """
+    Read the content of an XYZ file (first line is the atom count) or of a CLUSTER file.
+    """
+    from FODLego.Molecule import ClusterToXYZ
+    first = text.split('\n', 1)[0].split()
+    if len(first) == 1 and first[0].isdigit():
+        rdmol = Chem.MolFromXYZBlock(text)
+    else:
+        rdmol = Chem.MolFromXYZBlock(ClusterToXYZ(text))
+    if rdmol is None:
+        raise ValueError("The structure text could not be read")
+    return rdmol
+
+def predict(source, positions=None, **kwargs) -> Prediction:
+    """
+    Predict the FODs of a structure without writing files.
+    Args:
+        source: An RDKit Mol with a conformer (bonds are perceived if it has none), a sequence of
+            element symbols or atomic numbers (with positions), the text of an XYZ or CLUSTER file,
+            a SMILES string, or the name of a structure file.
+        positions: The (M,3) positions in Angstrom when source is a sequence of elements.
+        kwargs: Passed on to Molecule (e.g. openshell=True, connectivity='covalent', cache=True,
+            symmetry=True).
+    Returns:
+        A Prediction with the FOD positions, channels and type codes as NumPy arrays.
+    """
+    from FODLego.Molecule import Molecule
+    if positions is not None:
+        source = MolFromElements(source, positions)
+    elif isinstance(source, tuple) and len(source) == 2:
+        source = MolFromElements(*source)
+    elif isinstance(source, str) and '\n' in source.strip():
+        source = _MolFromText(source)
+    elif not isinstance(source, (str, Chem.Mol)):
+        raise TypeError(f"Cannot predict the FODs of a {type(source).__name__}")
+    return Prediction(Molecule(source, **kwargs))
@@ -0,0 +1,133 @@
+#Description: Resident prediction server, started with 'fodlego serve'. RDKit, NumPy, SciPy and the
+#  GlobalData tables are imported once when the server starts, and every request is predicted in
+#  memory: nothing is written to the working directory. The server speaks HTTP on localhost or on
+#  a Unix socket. A prediction is a POST to /predict with a JSON body holding one of
+#      {"xyz": <XYZ text>}, {"smiles": <SMILES>} or {"cluster": <CLUSTER text>}
+#  and optionally "openshell": true and "symmetry": true. The reply holds the FOD positions (Angstrom) and channels, in
+#  the order of FRMORB, together with the text of the XYZ, CLUSTER and FRMORB files.
+import os
+import sys
+import json
+import signal
+import logging
+import argparse
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+logger = logging.getLogger(__name__)
+
+def _WarmUp():
+    """
+    Import the prediction machinery, including the modules that are otherwise loaded on demand.
+    """
+    import scipy.spatial
+    from rdkit.Chem import AllChem, rdMolDescriptors, Descriptors
+    import FODLego.Molecule
+    import FODLego.Connectivity
+
+def Predict(request: dict) -> dict:
+    """
+    Predict the FODs of the structure in a request (see the description of this module).
+    """
+    from rdkit import Chem
+    from FODLego.Molecule import ClusterToXYZ
+    from FODLego.Prediction import predict
+    openshell = bool(request.get("openshell", False))
+    symmetry = bool(request.get("symmetry", False))
+    if "xyz" in request:
+        source = Chem.MolFromXYZBlock(request["xyz"])
+    elif "cluster" in request:
+        source = Chem.MolFromXYZBlock(ClusterToXYZ(request["cluster"]))
+    elif "smiles" in request:
+        source = str(request["smiles"])
+    else:
+        raise ValueError("The request needs an 'xyz', 'smiles' or 'cluster' entry")
+    if source is None:
+        raise ValueError("The structure text could not be read")
+
+    result = predict(source, openshell=openshell, symmetry=symmetry)
+    return {
+        "fods": result.mPos.tolist(),
+        "channels": result.mChannel.astype(int).tolist(),
+        "xyz": result.GetXYZText(),
+        "cluster": result.GetCLUSTERText(),
+        "frmorb": result.GetFRMORBText(),
+    }
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    def _Reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._Reply(200, {"status": "ok"})
+        else:
+            self._Reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._Reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            reply = Predict(request)
+        except Exception as e:
+            logger.warning(f"Request could not be predicted. {type(e).__name__}: {e}")
+            self._Reply(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._Reply(200, reply)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+
+def MakeServer(host: str = "127.0.0.1", port: int = 8765, socket: str = None):
+    """
+    Create the server on host:port, or on the Unix socket path when one is given.
+    """
+    _WarmUp()
+    if socket is not None:
+        return UnixHTTPServer(socket, PredictionHandler)
+    return ThreadingHTTPServer((host, port), PredictionHandler)
+
+def ServeMain(argv: list) -> int:
+    """
+    Command line interface of 'fodlego serve'.
+    """
+    parser = argparse.ArgumentParser(prog="fodlego serve",
+        description="Serve FOD predictions over HTTP on localhost or on a Unix socket.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("-s", "--socket", default=None, help="Listen on this Unix socket path instead of a port")
+    args = parser.parse_args(argv)
+
+    server = MakeServer(args.host, args.port, args.socket)
+    where = args.socket if args.socket is not None else f"http://{args.host}:{args.port}"
+    logger.info(f"Serving FOD predictions on {where}")
+    # Shut down cleanly (and remove the socket) when the job scheduler terminates the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
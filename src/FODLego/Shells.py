@@ -4,6 +4,15 @@ from numpy import sqrt, array
 from numpy.linalg import norm
 from FODLego.FOD import CFOD
 
+# Unit-shell templates: offsets of the FODs from the nucleus before scaling by the shell radius
+mTemplates = {
+    'pt': np.zeros((1,3)),
+    'tetra': array([[0.0,0.0,1.0],
+                    [sqrt(8/9), 0.0, -1/3],
+                    [-sqrt(2/9),sqrt(2/3), -1/3],
+                    [-sqrt(2/9),-sqrt(2/3), -1/3]])
+}
+
 class FODShell:
     """
     This is the parent class to a variety of core FOD structures.
@@ -15,6 +24,15 @@ class FODShell:
         self.mfods = fods
         self.ch = channel
 
+    @classmethod
+    def FromFODs(cls, atom, fods, channel = True):
+        """
+        Create the shell around CFODs that already exist, e.g. the ones placed by CoreShells().
+        """
+        shell = cls.__new__(cls)
+        FODShell.__init__(shell, atom, cls.mShape, fods, channel)
+        return shell
+
     def __str__(self):
         return self.mShape
     
@@ -22,6 +40,8 @@ class FODShell:
         return norm(self.mfods[-1].mPos - self.mAtom.mPos)
 
 class Point(FODShell):
+    mShape = 'point'
+
     def __init__(self, atom, ch=True):
         super().__init__(atom,'point', [CFOD(atom, atom.mPos, ch)], ch)
 
@@ -31,28 +51,25 @@ class Tetra(FODShell):
     Roadmap: There will  be different functions to create compound transformations of FODs (e.g. the base, or peak
     of the tetrahedron), and to rotate them in the proper direction as well.
     """
+    mShape = 'tetra'
+    # Descriptive Stats. of Predicted FODs
+    mPred_u_R = 0.0
+    mPred_s2_R = 0.0
+    # Descriptive Stats. of Target FODs
+    mTarget_u_R = 0.0
+    mTarget_s2_R = 0.0
+
     def __init__(self, atom, core_amount: int, ch = True) -> None:
         # Scale the FODs according to radius
-        s = GlobalData.mRadii[core_amount][atom.mZ]
+        s = GlobalData.GetRadii(atom.mZ, core_amount)
         if ch is False:
             s *= -1
 
         # The geometry of a tetrahedron in a unit circle
-        # TODO Create a file with geometries, rather than declaring here
-        fods = [ CFOD(atom, atom.mPos + s*array([0.0,0.0,1.0]), ch),
-            CFOD(atom, atom.mPos + s*array([sqrt(8/9), 0.0, -1/3]), ch),
-            CFOD(atom, atom.mPos + s*array([-sqrt(2/9),sqrt(2/3), -1/3]), ch),
-            CFOD(atom, atom.mPos + s*array([-sqrt(2/9),-sqrt(2/3), -1/3]),ch)]
+        fods = [CFOD(atom, atom.mPos + s*vertex, ch) for vertex in mTemplates['tetra']]
         # Call parent initializer
         super().__init__(atom, 'tetra', fods, ch)
 
-        # Descriptive Stats. of Predicted FODs
-        self.mPred_u_R = 0.0
-        self.mPred_s2_R = 0.0
-        # Descriptive Stats. of Target FODs
-        self.mTarget_u_R = 0.0
-        self.mTarget_s2_R = 0.0
-
     #Class Methods
     def RotateTetra(self):
         pass
@@ -63,3 +80,63 @@ class Triaug(FODShell):
     However, its implementation could go here.
     """
     pass
+
+mShellClasses = {'pt': Point, 'tetra': Tetra}
+
+def CoreShells(mol, indices=None) -> None:
+    """
+    Batched version of the core electrons in FODStructure.PrepareShells. The atoms are grouped
+    by (Z, core electrons), so that every group shares the same shells and radii. The unit-shell
+    templates are scaled once per group and broadcast over the positions of all the atoms in it,
+    and the CFODs are written into the FOD store of the molecule in one call per group. For
+    open-shell molecules the beta shells are the alpha shells inverted through the nucleus,
+    so no geometry is computed twice.
+
+    mol: The Molecule
+    indices: The atoms whose core is created. All atoms by default.
+    """
+    table = mol.mAtoms
+    store = mol.mContext.mStore
+    idx = np.arange(len(table)) if indices is None else np.asarray(indices, dtype=np.int64)
+    if len(idx) == 0:
+        return
+    core = table.mZ[idx] - table.mValCount[idx]
+    idx, core = idx[core != 0], core[core != 0]
+    channels = (True, False) if mol.mOpen else (True,)
+
+    groups, inverse = np.unique(np.stack((table.mZ[idx], core), axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for g, (Z, core_elec) in enumerate(groups):
+        # Offsets of all the core FODs of one atom of this group, in the order of the ladder
+        offsets, chans, shells = [], [], []
+        for shell in GlobalData.mGeo_Ladder[int(core_elec)]:
+            if shell not in mTemplates:
+                continue # For future development: Beyond scope
+            s = 1.0 if shell == 'pt' else GlobalData.GetRadii(Z, 10)
+            alpha = s*mTemplates[shell]
+            for ch in channels:
+                # The beta shell mirrors the alpha one through the nucleus (Tetra with ch=False)
+                offsets.append(alpha if ch else -alpha)
+                chans += [ch]*len(mTemplates[shell])
+                shells.append((mShellClasses[shell], ch, len(mTemplates[shell])))
+        if len(offsets) == 0:
+            continue
+        offsets = np.vstack(offsets)
+        k = len(offsets)
+
+        # Broadcast over the atoms of the group
+        members = idx[inverse == g]
+        centers = table.mPos[members][:,None,:]
+        pos = centers + offsets[None,:,:]
+        rows = store.Extend(CFOD, pos.reshape(-1,3),
+                            atom=np.repeat(members, k),
+                            channel=np.tile(chans, len(members)),
+                            R=norm(pos - centers, axis=2).reshape(-1))
+
+        # Link the shells to the FOD structures of the atoms
+        for i, start in zip(members, range(rows.start, rows.stop, k)):
+            atom = table[int(i)]
+            for cls, ch, size in shells:
+                fods = store.Views(range(start, start + size))
+                atom.mFODStruct._AddCoreShell(cls.FromFODs(atom, fods, ch))
+                start += size
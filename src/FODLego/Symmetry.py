@@ -0,0 +1,501 @@
+#Description: Point-group symmetry of a molecule, used by Molecule(symmetry=True). The symmetry
+#  operations are detected from the atomic positions within a tolerance, before the FODs are
+#  calculated. The FOD heuristics then run for one atom and one bond of every class of
+#  symmetry-equivalent atoms and bonds, and the FODs of the other atoms and bonds are the images
+#  of those under the symmetry operations, applied to the columns of the FOD store at once.
+import logging
+import numpy as np
+from numpy.linalg import norm
+logger = logging.getLogger(__name__)
+
+# Largest distance (Angstrom) between an atom and the image of its equivalent atom
+TOLERANCE = 0.1
+
+def _Frame(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Orthonormal frame (as columns) built from the vectors x and y, which are not parallel.
+    """
+    u = x/norm(x)
+    v = y - (y@u)*u
+    v = v/norm(v)
+    return np.stack((u, v, np.cross(u, v)), axis=1)
+
+def _Classes(Z: np.ndarray, dist: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Label the atoms by element and distance to the center. Equivalent atoms share a label.
+    """
+    order = np.lexsort((dist, Z))
+    new = np.ones(len(Z), dtype=bool)
+    new[1:] = (np.diff(Z[order]) != 0) | (np.diff(dist[order]) > tol)
+    labels = np.empty(len(Z), dtype=np.int64)
+    labels[order] = np.cumsum(new) - 1
+    return labels
+
+def IsLinear(pos, tol: float = TOLERANCE) -> bool:
+    """
+    Whether all the positions lie on one line (within tol).
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+    r = pos - pos.mean(axis=0)
+    return len(pos) < 3 or np.linalg.svd(r, compute_uv=False)[1] <= tol
+
+def SymmetryOperations(Z, pos, tol: float = TOLERANCE):
+    """
+    Find the point-group operations of a set of atoms. Every operation maps each atom onto an
+    atom of the same element within tol. The candidates are the orthogonal matrices that map
+    two non-collinear atoms of the rarest classes (element, distance to the center) onto atoms
+    of the same classes, so only a few of them are checked against all the atoms.
+    Args:
+        Z: The atomic numbers of the M atoms.
+        pos: The (M,3) positions in Angstrom.
+        tol: The tolerance in Angstrom.
+    Returns:
+        center: The center of the point group (the Z-weighted mean of the positions).
+        ops: The (k,3,3) operations, acting on positions relative to center. ops[0] is the identity.
+        perms: The (k,M) atom permutations; atom i is mapped onto atom perms[g,i] by ops[g].
+    """
+    from scipy.spatial import cKDTree
+    Z = np.asarray(Z)
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+    n = len(pos)
+    center = (Z[:,None]*pos).sum(axis=0)/Z.sum()
+    r = pos - center
+    dist = norm(r, axis=1)
+    tree = cKDTree(r)
+
+    def Match(R, sub):
+        """
+        Atoms onto which R maps the atoms sub, or None if an image has no partner.
+        """
+        d, j = tree.query(r[sub] @ R.T, distance_upper_bound=tol)
+        if np.isinf(d).any() or (Z[j] != Z[sub]).any():
+            return None
+        return j
+
+    # Candidate operations
+    labels = _Classes(Z, dist, tol)
+    sizes = np.bincount(labels)
+    off = np.flatnonzero(dist > tol)
+    exact = True
+    if len(off) == 0:
+        candidates = [np.eye(3)]
+    else:
+        a = off[np.argmin(sizes[labels[off]])]
+        u = r[a]/dist[a]
+        apart = np.flatnonzero(norm(r - np.outer(r@u, u), axis=1) > tol)
+        if len(apart) == 0:
+            # Linear molecule: only the finite operations that keep the axis are used
+            candidates = [np.eye(3), -np.eye(3)]
+        else:
+            b = apart[np.argmin(sizes[labels[apart]])]
+            F = _Frame(r[a], r[b])
+            A = np.flatnonzero(labels == labels[a])
+            B = np.flatnonzero(labels == labels[b])
+            sub = np.union1d(A, B)
+            candidates, exact = [], False
+            for a2 in A:
+                for b2 in B[np.abs(r[B]@r[a2] - r[a]@r[b]) < tol*(dist[a] + dist[b])]:
+                    if norm(np.cross(r[a2], r[b2])) <= tol*dist[a2]:
+                        continue
+                    F2 = _Frame(r[a2], r[b2])
+                    for s in (1.0, -1.0):
+                        R = (F2*[1.0, 1.0, s]) @ F.T
+                        if Match(R, sub) is not None:
+                            candidates.append(R)
+
+    # Check the candidates on all the atoms and refine them (orthogonal Procrustes). The
+    # identity and the inversion are exact already.
+    ops, perms = [], []
+    everyone = np.arange(n)
+    for R in candidates:
+        j = Match(R, everyone)
+        if j is None or len(np.unique(j)) < n:
+            continue
+        if not exact:
+            U, _, Vt = np.linalg.svd(r[j].T @ r)
+            D = np.diag([1.0, 1.0, np.sign(np.linalg.det(R))*np.sign(np.linalg.det(U @ Vt))])
+            R = U @ D @ Vt
+        ops.append(R)
+        perms.append(j)
+    ident = next(g for g, j in enumerate(perms) if (j == everyone).all() and np.linalg.det(ops[g]) > 0)
+    order = [ident] + [g for g in range(len(ops)) if g != ident]
+    return center, np.array(ops)[order], np.array(perms)[order]
+
+def _Rotation(R: np.ndarray):
+    """
+    Axis and order of the rotation part of an operation, and whether the operation is improper.
+    """
+    improper = np.linalg.det(R) < 0
+    P = -R if improper else R
+    angle = np.arccos(np.clip((np.trace(P) - 1)/2, -1, 1))
+    if angle < 1e-3:
+        return None, 1, improper
+    if np.pi - angle < 1e-3:
+        M = P + np.eye(3)
+        axis = M[:, np.argmax(norm(M, axis=0))]
+    else:
+        axis = np.array([P[2,1] - P[1,2], P[0,2] - P[2,0], P[1,0] - P[0,1]])
+    return axis/norm(axis), int(round(2*np.pi/angle)), improper
+
+def PointGroup(ops: np.ndarray, linear: bool = False) -> str:
+    """
+    Schoenflies symbol of the point group made of the operations ops (e.g. 'D6h', 'Td', 'C2v').
+    For a linear molecule, ops only holds the identity and the inversion.
+    """
+    inversion = any(np.allclose(R, -np.eye(3), atol=1e-3) for R in ops)
+    if linear:
+        return 'D*h' if inversion else 'C*v'
+    axes, mirrors = [], []
+    for R in ops:
+        axis, n, improper = _Rotation(R)
+        if axis is None:
+            continue
+        if improper and n == 2:
+            mirrors.append(axis)
+        elif not improper:
+            for k, (other, m) in enumerate(axes):
+                if abs(axis@other) > 0.99:
+                    axes[k] = (other, max(n, m))
+                    break
+            else:
+                axes.append((axis, n))
+    improper = any(np.linalg.det(R) < 0 for R in ops)
+
+    high = [n for _, n in axes if n >= 3]
+    if len(high) > 1:
+        if 5 in high:
+            return 'Ih' if inversion else 'I'
+        if 4 in high:
+            return 'Oh' if inversion else 'O'
+        return 'Th' if inversion else ('Td' if mirrors else 'T')
+    if len(axes) == 0:
+        return 'Cs' if mirrors else ('Ci' if inversion else 'C1')
+
+    principal, n = max(axes, key=lambda x: x[1])
+    perp = sum(1 for axis, m in axes if m == 2 and abs(axis@principal) < 0.01)
+    horizontal = any(abs(normal@principal) > 0.99 for normal in mirrors)
+    vertical = sum(1 for normal in mirrors if abs(normal@principal) < 0.01)
+    if perp >= n:
+        if horizontal:
+            return f'D{n}h'
+        return f'D{n}d' if vertical >= n else f'D{n}'
+    if horizontal:
+        return f'C{n}h'
+    if vertical >= n:
+        return f'C{n}v'
+    return f'S{2*n}' if improper else f'C{n}'
+
+def _ElementDirections(ops: np.ndarray, vecs: np.ndarray = None) -> np.ndarray:
+    """
+    Unit directions, both ways, of the symmetry elements of the operations ops: their rotation
+    axes, the normals of their mirrors and the directions within the mirrors that are
+    perpendicular to the axes. With vecs, also the vectors vecs projected into the mirrors and
+    onto the planes perpendicular to the axes, for the orientations that a single element leaves
+    free (e.g. in a mirror plane).
+    """
+    def Unique(dirs):
+        dirs = np.array(dirs).reshape(-1, 3)
+        length = norm(dirs, axis=1)
+        dirs = dirs[length > 1e-6]/length[length > 1e-6][:,None]
+        # One sign per direction before rounding, so that both signs are kept only once
+        dirs = dirs*np.where(dirs[np.arange(len(dirs)), np.argmax(np.abs(dirs), axis=1)] < 0, -1.0, 1.0)[:,None]
+        dirs = np.unique(np.round(dirs, 6), axis=0)
+        return list(dirs/norm(dirs, axis=1)[:,None])
+    axes, normals = [], []
+    for R in ops:
+        axis, n, improper = _Rotation(R)
+        if axis is None:
+            continue
+        (normals if improper and n == 2 else axes).append(axis)
+    axes, normals = Unique(axes), Unique(normals)
+    dirs = axes + normals + [np.cross(m, u) for m in normals for u in axes]
+    if vecs is not None:
+        dirs += [v - (v@u)*u for u in axes + normals for v in vecs]
+    dirs = np.array(Unique(dirs)).reshape(-1, 3)
+    return np.vstack((dirs, -dirs))
+
+def _Mismatch(Q: np.ndarray, X: np.ndarray, ops: np.ndarray) -> np.ndarray:
+    """
+    For every rotation Q[c] ((K,3,3)), the largest distance between an image of the points Q[c]X
+    under the operations ops and the nearest of those points.
+    """
+    Y = np.einsum('cij,kj->cki', Q, X)
+    img = np.einsum('gij,ckj->cgki', ops, Y)
+    d = norm(img[:,:,:,None,:] - Y[:,None,None,:,:], axis=-1)
+    return d.min(axis=-1).max(axis=(1,2))
+
+def _Closest(Q: np.ndarray, X: np.ndarray, ops: np.ndarray, tol: float):
+    """
+    The rotation of Q closest to the identity that keeps the points X under ops within 1e-3
+    Angstrom. The rotations are checked in order of their angle, a block at a time, until one
+    is found. Otherwise the rotation that keeps them best (and within tol), or None.
+    """
+    Q = Q[np.argsort(-np.trace(Q, axis1=1, axis2=2), kind='stable')]
+    miss = []
+    for k in range(0, len(Q), 1024):
+        miss.append(_Mismatch(Q[k:k+1024], X, ops))
+        ok = np.flatnonzero(miss[-1] <= 1e-3)
+        if len(ok) > 0:
+            return Q[k + ok[0]]
+    miss = np.concatenate(miss)
+    best = np.argmin(miss)
+    return Q[best] if miss[best] <= tol else None
+
+def SiteOrientation(X: np.ndarray, ops: np.ndarray, tol: float = TOLERANCE):
+    """
+    Rotation of the FOD offsets X (from the atom that they belong to) that makes them symmetric
+    under ops, the operations that keep the atom in place. The candidates map one FOD (or the
+    middle of two FODs) onto a symmetry element of ops and a second FOD into the plane of two of
+    them, e.g. a core tetrahedron onto the threefold axes of Td, or onto the axis and a mirror of
+    C3v. Returns the rotation closest to the identity, or None if no candidate is symmetric.
+    """
+    X = X[norm(X, axis=1) > 1e-6]
+    if len(X) < 2:
+        return None
+    anchors = [X[0]] + [X[0] + x for x in X[1:]]
+    frames = [_Frame(a, b) for a in anchors if norm(a) > 1e-6 for b in X if norm(np.cross(a, b)) > 1e-6*norm(a)*norm(b)]
+    # A single symmetry element leaves the orientation free, so the FODs projected onto it are
+    # candidates as well
+    few = _ElementDirections(ops)
+    dirs = _ElementDirections(ops, X) if len(few) <= 2 else few
+    cos = dirs @ dirs.T
+    i, j = np.nonzero(np.abs(cos) < 1 - 1e-6)
+    if len(frames) == 0 or len(i) == 0:
+        return None
+    u = dirs[i]
+    v = dirs[j] - cos[i, j][:,None]*u
+    v = v/norm(v, axis=1)[:,None]
+    targets = np.stack((u, v, np.cross(u, v)), axis=2)
+    Q = np.einsum('pij,akj->paik', targets, np.array(frames)).reshape(-1, 3, 3)
+    return _Closest(np.concatenate((np.eye(3)[None], Q)), X, ops, tol)
+
+def BondOrientation(X: np.ndarray, axis: np.ndarray, ops: np.ndarray, tol: float = TOLERANCE):
+    """
+    Rotation about the bond axis of the FOD offsets X (from the middle of the bond) that makes
+    them symmetric under ops, the operations that keep the bond in place. The candidates turn
+    one FOD (or the middle of two FODs) onto a symmetry element of ops, e.g. the FODs of a
+    triple bond on a threefold axis onto its vertical mirrors. Returns the rotation closest to
+    the identity, or None if no candidate is symmetric.
+    """
+    from FODLego.Funcs import RotateBatch
+    axis = axis/norm(axis)
+    perp = lambda V: V - np.outer(V@axis, axis)
+    anchors = perp(np.vstack([X] + [X[k] + X[k+1:] for k in range(len(X))]))
+    dirs = perp(_ElementDirections(ops, X))
+    anchors = anchors[norm(anchors, axis=1) > 1e-6]
+    dirs = dirs[norm(dirs, axis=1) > 1e-6]
+    if len(anchors) == 0 or len(dirs) == 0:
+        return None
+    a = np.repeat(anchors, len(dirs), axis=0)
+    d = np.tile(dirs, (len(anchors), 1))
+    angle = np.arctan2(np.cross(a, d)@axis, np.einsum('ij,ij->i', a, d))
+    # Columns of the rotations: the unit vectors rotated about the axis by every angle
+    Q = RotateBatch(np.eye(3), np.tile(axis, (3, 1)), angle).transpose(1, 2, 0)
+    return _Closest(np.concatenate((np.eye(3)[None], Q)), X, ops, tol)
+
+def _Images(mol, src: list, g: np.ndarray, sizes: list, center: np.ndarray, ops: np.ndarray, perms: np.ndarray) -> list:
+    """
+    Add the images of the FODs in the rows src under the operations g (one per row) to the store,
+    with their atoms mapped and their vector columns rotated. The rows come in blocks of the
+    given sizes, one block per target atom or bond. Returns the views of the new rows.
+    """
+    from FODLego.FOD import FOD
+    store = mol.mContext.mStore
+    src = np.asarray(src, dtype=np.int64)
+    R = ops[g]
+    columns = {name: store[name][src] for name in store.mLayout if name not in ('pos', 'type')}
+    for name in ('height', 'freedir'):
+        columns[name] = np.einsum('kij,kj->ki', R, columns[name])
+    for name in ('atom', 'bold', 'meek'):
+        idx = columns[name]
+        columns[name] = np.where(idx >= 0, perms[g, np.maximum(idx, 0)], -1)
+    pos = np.einsum('kij,kj->ki', R, store['pos'][src] - center) + center
+    rows = store.Extend(FOD, pos, type=store['type'][src], **columns)
+    fods = store.Views(range(rows.start, rows.stop))
+
+    # The siblings of an image are the images of the siblings of its source, in the same block
+    block = np.repeat(np.arange(len(sizes)), sizes)
+    image = dict(zip(zip(block.tolist(), src.tolist()), fods))
+    for b, s, fod in zip(block.tolist(), src.tolist(), fods):
+        siblings = store.View(s).mSiblings
+        if len(siblings) > 0:
+            fod.AddSibling(*[image[b, sib.mIdx] for sib in siblings])
+    return fods
+
+def _Turn(store, rows: np.ndarray, origin: np.ndarray, Q: np.ndarray) -> None:
+    """
+    Rotate the FODs in rows by Q about origin, with their direction columns.
+    """
+    store['pos'][rows] = origin + (store['pos'][rows] - origin) @ Q.T
+    for name in ('height', 'freedir'):
+        store[name][rows] = store[name][rows] @ Q.T
+
+def SymmetricFODs(mol, tol: float = TOLERANCE) -> bool:
+    """
+    Create the FODs of the molecule from its symmetry-unique atoms and bonds. The point group is
+    detected within tol and reduced to the operations that map the bonds (and their orders) and
+    the lone pairs of the atoms onto themselves. BondFODs, Shells.CoreShells and FreeFODs run
+    for one atom and one bond of every class of equivalent atoms and bonds, and the FODs of the
+    others are the images of those, so the prediction is symmetric by construction. The FODs of
+    atoms and bonds that lie on symmetry elements are turned onto those elements
+    (SiteOrientation, BondOrientation), e.g. the core tetrahedra of a central atom onto its
+    threefold axes; they keep the orientation of the heuristics when no turn makes them
+    symmetric (e.g. the three FODs of a triple bond under an inversion). The second double bond
+    of a two-bonded atom depends on the first one, so those double bonds and their atoms are
+    always placed by the heuristics.
+
+    mol: The Molecule
+    tol: The tolerance of the point group, in Angstrom.
+
+    Returns False, without creating any FOD, when no symmetry operation other than the identity
+    keeps the bonds, or when the batched engine cannot place the BFODs of the unique bonds.
+    The caller then creates the FODs of every atom as usual.
+    """
+    from FODLego.BFOD import BondFODs, BFOD
+    from FODLego.FFOD import FreeFODs
+    import FODLego.Shells as Shells
+    table = mol.mAtoms
+    store = mol.mContext.mStore
+    pairs, orders = mol.mBondIdx, mol.mBondOrder
+    n, nb = len(table), len(pairs)
+
+    center, ops, perms = SymmetryOperations(table.mZ, table.mPos, tol)
+    mol.mPointGroup = PointGroup(ops, IsLinear(table.mPos, tol))
+
+    # Keep the operations that map the bonds, with their orders, and the lone pairs onto themselves
+    freepairs = table.mFreePairs
+    key = pairs.min(axis=1)*n + pairs.max(axis=1)
+    sort = np.argsort(key)
+    keep, bperms = [], []
+    for g, p in enumerate(perms):
+        if (freepairs[p] != freepairs).any():
+            continue
+        img = np.minimum(p[pairs[:,0]], p[pairs[:,1]])*n + np.maximum(p[pairs[:,0]], p[pairs[:,1]])
+        b = sort[np.minimum(np.searchsorted(key[sort], img), max(nb - 1, 0))] if nb > 0 else img
+        if (key[b] != img).any() or (orders[b] != orders).any():
+            continue
+        keep.append(g)
+        bperms.append(b)
+    if len(keep) < 2:
+        logger.warning(f"Point group {mol.mPointGroup}: {len(keep)} of {len(ops)} operations keep the bonds; the symmetric mode is disabled")
+        return False
+    logger.info(f"Point group {mol.mPointGroup}: {len(keep)} of {len(ops)} operations keep the bonds")
+    ops, perms = ops[keep], perms[keep]
+    bperms = np.array(bperms, dtype=np.int64).reshape(len(keep), nb)
+    mol.mSymmetryOps = (center, ops, perms)
+
+    # One representative per class of equivalent atoms and bonds, and an operation that maps it
+    # onto every member of its class
+    rep_atom = perms.min(axis=0)
+    op_atom = np.argmax(perms[:, rep_atom] == np.arange(n), axis=0)
+    rep_bond = bperms.min(axis=0)
+    op_bond = np.argmax(bperms[:, rep_bond] == np.arange(nb), axis=0)
+    own_atom = rep_atom == np.arange(n)
+    own_bond = rep_bond == np.arange(nb)
+    degree = mol.mBonds.Degree()
+    chain = (degree == 2) & (freepairs == 0)
+    dep = (orders == 2) & (chain[pairs[:,0]] | chain[pairs[:,1]])
+    own_bond |= dep
+    own_atom[pairs[dep].reshape(-1)] = True
+
+    ### BFODs ###
+    if not BondFODs(mol, np.flatnonzero(own_bond)):
+        return False
+    rows = store.Select(BFOD)
+    lo = np.minimum(store['bold'][rows], store['meek'][rows])
+    hi = np.maximum(store['bold'][rows], store['meek'][rows])
+    bond_of = sort[np.searchsorted(key[sort], lo*n + hi)]
+    bond_rows = {}
+    for r, b in zip(rows.tolist(), bond_of.tolist()):
+        bond_rows.setdefault(b, []).append(r)
+    # The FODs of unique bonds on symmetry elements are turned about the bond to be symmetric
+    for b in np.flatnonzero(own_bond & ~dep).tolist():
+        site = bperms[:, b] == b
+        if site.sum() < 2 or b not in bond_rows:
+            continue
+        r = np.array(bond_rows[b])
+        mid = table.mPos[pairs[b]].mean(axis=0)
+        Q = BondOrientation(store['pos'][r] - mid, table.mPos[pairs[b,1]] - table.mPos[pairs[b,0]], ops[site], tol)
+        if Q is not None:
+            _Turn(store, r, mid, Q)
+    targets = [b for b in np.flatnonzero(~own_bond).tolist() if rep_bond[b] in bond_rows]
+    if len(targets) > 0:
+        sizes = [len(bond_rows[rep_bond[b]]) for b in targets]
+        src = [r for b in targets for r in bond_rows[rep_bond[b]]]
+        fods = _Images(mol, src, np.repeat(op_bond[targets], sizes), sizes, center, ops, perms)
+        k = 0
+        bold, meek = store['bold'].tolist(), store['meek'].tolist()
+        channel = store['channel'].tolist()
+        for size in sizes:
+            block = fods[k:k+size]
+            k += size
+            # Alpha BFODs first, as created by BondFODs
+            for ch in (True, False):
+                for fod in block:
+                    if channel[fod.mIdx] == ch:
+                        table[bold[fod.mIdx]].AddBFOD(fod)
+                        table[meek[fod.mIdx]].AddBFOD(fod)
+
+    ### Core FODs ###
+    own = np.flatnonzero(own_atom)
+    targets = np.flatnonzero(~own_atom).tolist()
+    Shells.CoreShells(mol, own)
+    # The core shells of unique atoms on symmetry elements are turned to be symmetric. The shells
+    # of an atom share one orientation, so the first shell with more than one FOD decides it.
+    for i in own.tolist():
+        site = perms[:, i] == i
+        corefods = [fod for shell in table[i].mFODStruct.mCoreShells for fod in shell.mfods]
+        first = next((shell.mfods for shell in table[i].mFODStruct.mCoreShells if len(shell.mfods) > 1), None)
+        if site.sum() < 2 or first is None:
+            continue
+        origin = table.mPos[i]
+        Q = SiteOrientation(store['pos'][[fod.mIdx for fod in first]] - origin, ops[site], tol)
+        if Q is not None:
+            _Turn(store, np.array([fod.mIdx for fod in corefods]), origin, Q)
+    shells = {i: table[int(rep_atom[i])].mFODStruct.mCoreShells for i in targets}
+    src = [fod.mIdx for i in targets for shell in shells[i] for fod in shell.mfods]
+    if len(src) > 0:
+        sizes = [sum(len(shell.mfods) for shell in shells[i]) for i in targets]
+        fods = _Images(mol, src, np.repeat(op_atom[targets], sizes), sizes, center, ops, perms)
+        k = 0
+        for i in targets:
+            atom = table[i]
+            for shell in shells[i]:
+                size = len(shell.mfods)
+                atom.mFODStruct._AddCoreShell(type(shell).FromFODs(atom, fods[k:k+size], shell.ch))
+                k += size
+
+    ### Free FODs ###
+    if not FreeFODs(mol, own):
+        for i in own:
+            table[int(i)].mFODStruct.PrepareShells(table, bonds=False, core=False)
+    # The free FODs of unique atoms with one bond on symmetry elements (e.g. the three lone pairs
+    # of a terminal halogen on an axis) are turned about the bond to be symmetric
+    for i in own.tolist():
+        site = perms[:, i] == i
+        ffods = table[i].mFODStruct.mFFODs
+        if site.sum() < 2 or degree[i] != 1 or len(ffods) < 2:
+            continue
+        r = np.array([fod.mIdx for fod in ffods])
+        origin = table.mPos[i]
+        other = mol.mBonds.Neighbors([i])[0, 0]
+        Q = BondOrientation(store['pos'][r] - origin, table.mPos[other] - origin, ops[site], tol)
+        if Q is not None:
+            _Turn(store, r, origin, Q)
+    free = {i: table[int(rep_atom[i])].mFODStruct.mFFODs for i in targets}
+    src = [fod.mIdx for i in targets for fod in free[i]]
+    if len(src) > 0:
+        sizes = [len(free[i]) for i in targets]
+        fods = _Images(mol, src, np.repeat(op_atom[targets], sizes), sizes, center, ops, perms)
+        k = 0
+        for i, size in zip(targets, sizes):
+            table[i].mFODStruct.mFFODs += fods[k:k+size]
+            k += size
+
+    # Bond by bond, as BondFODs writes them, so that RestoreCreationOrder gives the usual order
+    bond_key = np.full(len(store), -1)
+    rows = store.Select(BFOD)
+    bond_key[rows] = sort[np.searchsorted(key[sort], np.minimum(store['bold'][rows], store['meek'][rows])*n
+                                          + np.maximum(store['bold'][rows], store['meek'][rows]))]
+    store.Permute(np.lexsort((np.arange(len(store)), bond_key)))
+    return True
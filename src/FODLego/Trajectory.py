@@ -0,0 +1,110 @@
+#Description: Trajectory driver ('fodlego traj'). The frames of a multi-frame XYZ file (or of a
+#  sequence of CLUSTER files) are read one at a time. The bonds and the FODs are predicted once, on
+#  the first frame; every later frame only moves the atoms (Molecule.UpdatePositions), so the
+#  bonds are not perceived again and the FODs keep their order from frame to frame. All frames
+#  are written into one multi-frame XYZ file with the atoms and the FODs. With rebond, the bonds
+#  that form or break between frames (e.g. along a reaction path) are perceived again around the
+#  atoms involved.
+import os
+import logging
+import argparse
+import numpy as np
+from glob import glob
+logger = logging.getLogger(__name__)
+
+def ReadXYZFrames(path: str):
+    """
+    Yield (comment, elements, positions) for every frame of a (multi-frame) XYZ file.
+    """
+    with open(path, 'r') as file:
+        while True:
+            line = file.readline()
+            if line == '':
+                return
+            if line.strip() == '':
+                continue
+            count = int(line.split()[0])
+            comment = file.readline().rstrip('\n')
+            rows = [file.readline().split() for _ in range(count)]
+            if len(rows[-1]) < 4:
+                raise ValueError(f"The last frame of {path} is incomplete")
+            elements = [row[0] for row in rows]
+            pos = np.array([row[1:4] for row in rows], dtype=np.float64)
+            yield comment, elements, pos
+
+def ReadCLUSTERFrame(path: str):
+    """
+    Return (comment, atomic numbers, positions in Angstrom) of a CLUSTER file.
+    """
+    from FODLego.globaldata import GlobalData
+    with open(path, 'r') as file:
+        lines = file.read().splitlines()
+    count = int(lines[2].split()[0])
+    rows = np.array([line.split()[:4] for line in lines[3:3+count]], dtype=np.float64)
+    return path, rows[:,3].astype(np.int64).tolist(), rows[:,:3]*GlobalData.AU2ANG
+
+def ReadFrames(inputs: list):
+    """
+    Yield the frames of all inputs, in order. XYZ files can hold many frames, every CLUSTER
+    file is one frame.
+    """
+    for path in inputs:
+        if path.endswith("CLUSTER"):
+            yield ReadCLUSTERFrame(path)
+        else:
+            yield from ReadXYZFrames(path)
+
+def RunTrajectory(inputs: list, output: str = "traj.xyz", openshell: bool = False, connectivity: str = 'rdkit', tol: float = 1e-3, rebond: bool = False) -> int:
+    """
+    Predict the FODs of every frame of the inputs and write them into output, a multi-frame
+    XYZ file (alpha FODs as 'X', beta FODs as 'He'). Returns the number of frames. With rebond,
+    the bonds are updated when they form or break between frames.
+    """
+    import FODLego.Writers as Writers
+    from FODLego.Molecule import Molecule
+    from FODLego.Prediction import MolFromElements
+    mol = None
+    nframes = 0
+    with Writers.Output(output) as write:
+        for comment, elements, pos in ReadFrames(inputs):
+            if mol is None:
+                mol = Molecule(MolFromElements(elements, pos), openshell=openshell, connectivity=connectivity)
+                names, _, _ = mol._AtomArrays()
+                first = elements
+            else:
+                if list(elements) != list(first):
+                    raise ValueError(f"Frame {nframes} has different atoms than the first frame")
+                mol.UpdatePositions(pos, tol, rebond)
+            store = mol.mContext.mStore
+            up = store['channel']
+            # Alpha FODs first, then beta FODs, as in lego.xyz
+            Writers.WriteXYZFrame(write, comment + '\n', (names, mol.mAtoms.mPos), ('X', store['pos'][up]), ('He', store['pos'][~up]))
+            nframes += 1
+    return nframes
+
+def TrajMain(argv: list) -> int:
+    """
+    Command line interface of 'fodlego traj'.
+    """
+    parser = argparse.ArgumentParser(prog="fodlego traj",
+        description="Predict the FODs of every frame of a multi-frame XYZ file or of a sequence of CLUSTER files.")
+    parser.add_argument("inputs", nargs='+', help="Multi-frame XYZ files or CLUSTER files (glob patterns are sorted)")
+    parser.add_argument("-o", "--output", default="traj.xyz", help="Multi-frame XYZ file with the atoms and FODs (default: traj.xyz, '.gz' compresses)")
+    parser.add_argument("--open", action="store_true", help="Create open-shell (alpha/beta) FODs")
+    parser.add_argument("--connectivity", default="rdkit", choices=("rdkit", "covalent"), help="Bond perception of the first frame")
+    parser.add_argument("--tol", type=float, default=1e-3, help="Displacement (Angstrom) below which the FODs of an atom are not computed again")
+    parser.add_argument("--rebond", action="store_true", help="Perceive the bonds that form or break between frames (reactions, proton transfers)")
+    args = parser.parse_args(argv)
+
+    inputs = []
+    for spec in args.inputs:
+        matches = sorted(glob(spec)) if not os.path.isfile(spec) else [spec]
+        if len(matches) == 0:
+            logger.warning(f"No input matches {spec}")
+        inputs += matches
+    if len(inputs) == 0:
+        logger.warning("No inputs were found")
+        return 1
+    nframes = RunTrajectory(inputs, args.output, args.open, args.connectivity, args.tol, args.rebond)
+    logger.info(f"Predicted {nframes} frames into {args.output}")
+    return 0 if nframes > 0 else 1
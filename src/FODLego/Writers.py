@@ -0,0 +1,113 @@
+#Description: Writers of the output files of FODLego (XYZ, CLUSTER and FRMORB). Each block of rows is
+#  formatted from whole NumPy arrays with a single %-format call, instead of one f-string per
+#  coordinate, and very large blocks are written in chunks of CHUNK rows. The target of every
+#  writer is a path or an open file object (text or binary); paths ending in '.gz' are written
+#  with gzip. The formats are the ones FLOSIC reads, byte for byte.
+import io
+import os
+import gzip
+import numpy as np
+from contextlib import contextmanager
+from FODLego.globaldata import GlobalData
+
+# Rows formatted per write
+CHUNK = 65536
+
+# Row formats
+XYZ_ROW = "%s %7.4f %7.4f %7.4f\n"
+FULL_XYZ_ROW = "%s %r %r %r\n"      # Shortest repr of every coordinate, as str(float)
+CLUSTER_ROW = "%10.5f %10.5f %10.5f %d ALL\n"
+FRMORB_ROW = "%7.4f %7.4f %7.4f\n"
+
+@contextmanager
+def Output(target, compress: bool = None):
+    """
+    Yield a write(str) function for target, a path or an open file object. A path is opened
+    (and closed) here and written with gzip if compress is True, or if compress is None and the
+    path ends in '.gz'. File objects are left open; binary ones receive UTF-8 bytes.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        if compress is None:
+            compress = os.fspath(target).endswith(".gz")
+        handle = gzip.open(target, 'wt') if compress else open(target, 'w')
+        with handle:
+            yield handle.write
+        return
+    if compress:
+        with gzip.GzipFile(fileobj=target, mode='wb') as handle:
+            yield lambda text: handle.write(text.encode())
+        return
+    if isinstance(target, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(target, 'mode', ''):
+        yield lambda text: target.write(text.encode())
+    else:
+        yield target.write
+
+def FormatRows(fmt: str, *columns, chunk: int = CHUNK):
+    """
+    Yield the text of the rows 'fmt % row', chunk rows at a time. Every column is an array of
+    one value per row, or an (N,k) array of k values per row (e.g. the coordinates).
+    """
+    cols = [np.asarray(col) for col in columns]
+    n = len(cols[0]) if cols else 0
+    if n == 0:
+        return
+    cols = [col.reshape(n, -1) for col in cols]
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        values = np.hstack([col[start:stop].astype(object) for col in cols])
+        yield (fmt*(stop - start)) % tuple(values.ravel().tolist())
+
+def WriteXYZ(target, comment: str, *blocks, fmt: str = XYZ_ROW, compress: bool = None) -> None:
+    """
+    Write an XYZ file. Every block is a pair (labels, positions), where labels is one label for
+    all the rows of the block (e.g. 'X' for FODs) or one label per row. comment ends in a newline.
+    """
+    with Output(target, compress) as write:
+        WriteXYZFrame(write, comment, *blocks, fmt=fmt)
+
+def WriteXYZFrame(write, comment: str, *blocks, fmt: str = XYZ_ROW) -> None:
+    """
+    Write one XYZ frame with the write(str) function of Output, e.g. one frame of a multi-frame
+    XYZ file. The blocks are those of WriteXYZ.
+    """
+    blocks = [(labels, np.asarray(pos, dtype=np.float64).reshape(-1, 3)) for labels, pos in blocks]
+    count = sum(len(pos) for _, pos in blocks)
+    write(f"{count}\n")
+    write(comment)
+    for labels, pos in blocks:
+        if isinstance(labels, str):
+            labels = np.full(len(pos), labels, dtype=object)
+        for text in FormatRows(fmt, labels, pos):
+            write(text)
+
+def WriteCLUSTER(target, Z, atoms, charge: int = 0, compress: bool = None) -> None:
+    """
+    Write a CLUSTER file with the atoms (positions in Angstrom, written in Bohr).
+    """
+    atoms = np.asarray(atoms, dtype=np.float64).reshape(-1, 3)
+    with Output(target, compress) as write:
+        # CLUSTER Preamble
+        write("LDA-PW91*LDA-PW91\n")
+        write("NONE\n")
+        write(f"{len(atoms)}\n")
+        for text in FormatRows(CLUSTER_ROW, atoms*GlobalData.ANG2AU, Z):
+            write(text)
+        write(f"{charge} {0.0}")  # TODO: Make a variable that contains sum of all spins
+
+def WriteFRMORB(target, fods, compress: bool = None) -> None:
+    """
+    Write a FRMORB file with the FODs (positions in Angstrom, written in Bohr).
+    """
+    fods = np.asarray(fods, dtype=np.float64).reshape(-1, 3)
+    with Output(target, compress) as write:
+        write(f"{len(fods)} 0\n")
+        for text in FormatRows(FRMORB_ROW, fods*GlobalData.ANG2AU):
+            write(text)
+
+def ToText(writer, *args, **kwargs) -> str:
+    """
+    Return what writer (e.g. WriteXYZ) would write, as a string.
+    """
+    buffer = io.StringIO()
+    writer(buffer, *args, **kwargs)
+    return buffer.getvalue()
@@ -1 +1,16 @@
 #!/usr/bin/env python3
+
+def predict(*args, **kwargs):
+    """
+    Predict the FODs of a structure in memory. See FODLego.Prediction.predict.
+    The prediction modules are imported on the first call, so importing FODLego stays cheap.
+    """
+    from FODLego.Prediction import predict
+    return predict(*args, **kwargs)
+
+def ensemble(*args, **kwargs):
+    """
+    Predict the FODs of a conformer ensemble of a SMILES string. See FODLego.Ensemble.Ensemble.
+    """
+    from FODLego.Ensemble import Ensemble
+    return Ensemble(*args, **kwargs)
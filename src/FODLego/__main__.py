@@ -2,17 +2,33 @@
 #Atom Class
 # Author: Angel-Emilio Villegas Sanchez
 
-from .Molecule import Molecule
-from FODLego.graphing import *
+# Only the standard library is imported here. Each subcommand imports what it needs, so that
+# a single prediction does not load the analysis and plotting modules (matplotlib, MolecularSet).
 import sys
 import logging
-logging.basicConfig(format="%(levelname)s:%(filename)s:%(funcName)s(): %(message)s", level=logging.DEBUG)
 
 def main():
+    logging.basicConfig(format="%(levelname)s:%(filename)s:%(funcName)s(): %(message)s", level=logging.DEBUG)
     if len(sys.argv) == 1:
         logging.warning("No arguments were given, please provide XYZ file name")
         exit(1)
-    elif len(sys.argv) == 2:
+    elif sys.argv[1] == "batch":
+        from FODLego.Batch import BatchMain
+        if BatchMain(sys.argv[2:]) > 0:
+            exit(1)
+        return
+    elif sys.argv[1] == "serve":
+        from FODLego.Server import ServeMain
+        exit(ServeMain(sys.argv[2:]))
+    elif sys.argv[1] == "traj":
+        from FODLego.Trajectory import TrajMain
+        exit(TrajMain(sys.argv[2:]))
+    elif sys.argv[1] == "ensemble":
+        from FODLego.Ensemble import EnsembleMain
+        exit(EnsembleMain(sys.argv[2:]))
+
+    from FODLego.Molecule import Molecule
+    if len(sys.argv) == 2:
         logging.info("One argument passed. Creating FOD Prediction.")
         mol = Molecule(sys.argv[1])
         mol.CreateCLUSTER()
@@ -20,6 +36,8 @@ def main():
         mol.CreateXYZ()
     elif len(sys.argv) == 3:
         if sys.argv[1] == "list":
+            from FODLego.Analysis import CreateMolecules
+            from FODLego.MolecularSet import MolecularSet
             assert len(sys.argv) == 3, "You did not provide a list of files to analyze."
             print("You provided the 'list' flag. Your input file is expected to have several filenames for comparison.")
             mols = CreateMolecules(sys.argv[2])
@@ -49,4 +67,6 @@ def main():
             mol = Molecule(sys.argv[1], sys.argv[2])
             mol.CreateCompXYZ()
             #mol.GeFBEdges()
-main()
+
+if __name__ == "__main__":
+    main()
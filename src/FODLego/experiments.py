@@ -96,12 +96,13 @@ def find_minimum_energy_configuration(coords1, coords2):
                     best_coords = rot_coor
     return best_coords, min_energy
 
-sp3, sp3d5 = read_sp3_sp3d5("test2shellsxyz.xyz")
+if __name__ == "__main__":
+    sp3, sp3d5 = read_sp3_sp3d5("test2shellsxyz.xyz")
 
-create_xyz(normalize_l(sp3), file="normalized_4pt.xyz")
-# best_coords, min_energy = find_minimum_energy_configuration(sp3, sp3d5)
-# create_xyz(sp3, best_coords)
-sh1 = readxyz("down_sp3d5.xyz")
-sh2 = readxyz("up_sp3d4.xyz")
-best_coords, min_energy = find_minimum_energy_configuration(sh1,sh2)
-create_xyz(sh1, best_coords, "updown_ion.xyz")
+    create_xyz(normalize_l(sp3), file="normalized_4pt.xyz")
+    # best_coords, min_energy = find_minimum_energy_configuration(sp3, sp3d5)
+    # create_xyz(sp3, best_coords)
+    sh1 = readxyz("down_sp3d5.xyz")
+    sh2 = readxyz("up_sp3d4.xyz")
+    best_coords, min_energy = find_minimum_energy_configuration(sh1,sh2)
+    create_xyz(sh1, best_coords, "updown_ion.xyz")
@@ -11,6 +11,7 @@ from numpy import where, genfromtxt, sqrt
 from os import path
 from sys import argv
 from numpy import array
+import numpy as np
 
 
 class GlobalData:
@@ -43,6 +44,15 @@ class GlobalData:
 
     @staticmethod
     def GetRow(Z: int) -> int:
+        """
+        Return the group of the element Z, or -1 if it is not known.
+        """
+        if 0 <= Z <= GlobalData.mZMax:
+            return int(GlobalData.mRowTable[Z])
+        return GlobalData._Row(Z)
+
+    @staticmethod
+    def _Row(Z: int) -> int:
         row4 = array([22,40,72])
         row13 = array([5,13,31,49,81])
         if Z in [1,3,11,19,37,55]:
@@ -86,6 +96,15 @@ class GlobalData:
 
     @staticmethod
     def GetPeriod(Z: int) -> int:
+        """
+        Return the period of the element Z, or -1 if it is not known.
+        """
+        if 0 <= Z <= GlobalData.mZMax:
+            return int(GlobalData.mPeriodTable[Z])
+        return GlobalData._Period(Z)
+
+    @staticmethod
+    def _Period(Z: int) -> int:
        p1 = array([1,2])
        p2 = array([3,10])
        p4 = array([19,36])
@@ -97,7 +116,71 @@ class GlobalData:
        elif Z >= p4[0]+18 and Z <= p4[1]+18: return 5
        else: return -1
 
+    #Vectorized Functions. They take arrays of Z (or a single Z) and use fancy indexing on the
+    # Z-indexed tables built at import time.
+    @staticmethod
+    def GetPeriods(Z) -> np.ndarray:
+        return GlobalData.mPeriodTable[np.asarray(Z)]
+
+    @staticmethod
+    def GetRows(Z) -> np.ndarray:
+        return GlobalData.mRowTable[np.asarray(Z)]
+
+    @staticmethod
+    def GetFullElecCounts(Z) -> np.ndarray:
+        """
+        Electrons of the atoms when their valence is fully completed (-1 if unknown).
+        """
+        return GlobalData.mFullElecTable[np.asarray(Z)]
+
+    @staticmethod
+    def GetRadii(Z, elecs=None) -> np.ndarray:
+        """
+        Radii of the outmost shell of the atoms Z when they hold elecs electrons. By default
+        elecs is the full electron count of every atom, i.e. the monoatomic covalent radius.
+        Raises a KeyError if there is no data for some of the atoms, like the mRadii dictionary.
+        """
+        return GlobalData._ShellLookup(GlobalData.mRadiiTable, Z, elecs)
+
+    @staticmethod
+    def GetEdges(Z, elecs=None) -> np.ndarray:
+        """
+        Average FOD-FOD edge lengths of the outmost shell. Same conventions as GetRadii.
+        """
+        return GlobalData._ShellLookup(GlobalData.mVertTable, Z, elecs)
+
+    @staticmethod
+    def _ShellLookup(table: np.ndarray, Z, elecs) -> np.ndarray:
+        Z = np.asarray(Z)
+        if elecs is None:
+            elecs = GlobalData.mFullElecTable[Z]
+        elecs = np.asarray(elecs)
+        values = np.where(elecs >= 0, table[np.clip(elecs, 0, None), Z], np.nan)
+        missing = np.isnan(values)
+        if missing.any():
+            raise KeyError(np.unique(np.broadcast_to(Z, values.shape)[missing]).tolist())
+        return values[()]
+
+    @staticmethod
+    def _BuildTables() -> None:
+        """
+        Precompute the Z-indexed lookup tables from the ladders and dictionaries of the class.
+        """
+        n = GlobalData.mZMax + 1
+        GlobalData.mPeriodTable = np.array([GlobalData._Period(Z) for Z in range(n)], dtype=np.int64)
+        GlobalData.mRowTable = np.array([GlobalData._Row(Z) for Z in range(n)], dtype=np.int64)
+        elecs = [GlobalData.GetFullElecCount(g, p) for g, p in zip(GlobalData.mRowTable, GlobalData.mPeriodTable)]
+        GlobalData.mFullElecTable = np.array([-1 if e is None else e for e in elecs], dtype=np.int64)
+        # Shell tables are indexed as [electrons, Z]. Missing entries are NaN.
+        for name, data in (('mRadiiTable', GlobalData.mRadii), ('mVertTable', GlobalData.mVert)):
+            table = np.full((n, n), np.nan)
+            for shell, radii in data.items():
+                for Z, r in radii.items():
+                    table[shell, Z] = r
+            setattr(GlobalData, name, table)
+
     ############Class Variables############
+    mZMax = 118
     mElementInfo = []
     mElemNames = []
     mClosedGroups = [2,12,18]
@@ -194,6 +277,5 @@ class GlobalData:
     }
     AU2ANG = 0.529177249
     ANG2AU = 1.8897259886
-    mAtoms = []
-    mFODs = []
-    mBFODs = []
+
+GlobalData._BuildTables()